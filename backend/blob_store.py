@@ -0,0 +1,107 @@
+"""
+Content-addressed, deduplicated storage for uploaded files.
+
+Uploads are streamed to a staging file while being hashed, then stored once
+per distinct content at blobs/<aa>/<bb>/<sha256> in the configured storage
+(see storage.py). files rows point at their blob through blob_sha256, so
+identical content uploaded under different names (or by different users) is
+stored once, and two uploads with the same filename no longer overwrite each
+other.
+
+The blobs table keeps a reference count that a trigger on files maintains.
+collect_garbage() removes blobs nobody references any more once they have been
+unused for BLOB_GC_GRACE_SECONDS. Uploads and garbage collection are kept
+apart by row locks: store_blob() upserts (and so locks) the blob row before
+it puts the content in place, and the collector skips locked rows.
+"""
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from database import models
+from storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+BLOB_ROOT = os.getenv("BLOB_ROOT", "/uploads/blobs")
+# Infected blobs are moved here by the worker, keeping the same layout
+QUARANTINE_BLOB_ROOT = os.getenv("QUARANTINE_BLOB_ROOT", "/quarantine/blobs")
+STAGING_DIR = os.getenv("UPLOAD_STAGING_DIR", "/uploads/.staging")
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+BLOB_GC_INTERVAL_SECONDS = int(os.getenv("BLOB_GC_INTERVAL_SECONDS", "3600"))
+
+
+def blob_path(sha256: str, root: str = None) -> str:
+    """Sharded location of a blob, e.g. <root>/9f/86/9f86d0..."""
+    return os.path.join(root or BLOB_ROOT, sha256[:2], sha256[2:4], sha256)
+
+
+def staging_path() -> str:
+    """A fresh path to stream an upload to before its checksum is known."""
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    return os.path.join(STAGING_DIR, uuid.uuid4().hex)
+
+
+def place_blob(staged_path: str, sha256: str) -> str:
+    """Moves staged content to its blob location, or discards it if the blob already exists."""
+    path = blob_path(sha256)
+    storage = get_storage()
+    if storage.exists(path):
+        os.remove(staged_path)
+    else:
+        storage.put_file(staged_path, path)
+    return path
+
+
+def _insert(db):
+    return sqlite_insert if db.get_bind().dialect.name == "sqlite" else pg_insert
+
+
+async def store_blob(db: AsyncSession, staged_path: str, sha256: str, size: int) -> str:
+    """
+    Registers staged content as a blob and returns its path. Call inside the
+    transaction that creates the files row referencing it: the blob row stays
+    locked until that commit, so garbage collection cannot remove it meanwhile.
+    """
+    insert = _insert(db)
+    statement = insert(models.Blob).values(sha256=sha256, size=size, refcount=0)
+    statement = statement.on_conflict_do_update(index_elements=["sha256"], set_={"last_used_at": func.now()})
+    await db.execute(statement)
+    return await run_in_threadpool(place_blob, staged_path, sha256)
+
+
+def discard_staged(staged_path: str):
+    if os.path.exists(staged_path):
+        os.remove(staged_path)
+
+
+def collect_garbage(db: Session, grace_seconds: int = BLOB_GC_GRACE_SECONDS, limit: int = 500) -> int:
+    """Deletes unreferenced blobs (row and content) unused for grace_seconds. Returns how many."""
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    blobs = (
+        db.execute(
+            select(models.Blob)
+            .where(models.Blob.refcount <= 0, models.Blob.last_used_at < cutoff)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        .scalars()
+        .all()
+    )
+    storage = get_storage()
+    for blob in blobs:
+        for root in (BLOB_ROOT, QUARANTINE_BLOB_ROOT):
+            storage.delete(blob_path(blob.sha256, root))
+        db.delete(blob)
+    db.commit()
+    if blobs:
+        logger.info(f"Garbage collected {len(blobs)} unreferenced blobs.")
+    return len(blobs)
@@ -1,22 +1,37 @@
 import os
-import shutil
+import time
 import pika
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 import asyncio
 from datetime import datetime, timedelta
 
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File, Form, Security, status, Body
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File, Form, Security, status, Body, Query, Request, Response
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from database.database import get_db
+from database.async_database import get_async_db
 from database import models
 from enums import ScanStatus
-from schemas import File as FileResponse, FileUpdate, ScanStatusUpdate, FileUploadResponse, SystemSetting, SystemSettingUpdate
+from schemas import File as FileResponse, FileUpdate, ScanStatusUpdate, FileUploadResponse, SystemSetting, SystemSettingUpdate, FileStats
 import logging
 import json
 from sqlalchemy.exc import IntegrityError
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt as pyjwt
+from upload_stream import save_upload
+from metrics import UPLOAD_WRITE_SECONDS
+from opentelemetry.trace import SpanKind, get_current_span
+from tracing import inject_headers, traced, tracer
+from blob_store import discard_staged, staging_path, store_blob
+from downloads import download_response
+from rabbitmq_publisher import publisher
+from scan_queues import scan_queue_for
+from database.settings_cache import settings_cache
+from pagination import encode_cursor, decode_datetime_cursor
+from ws_broadcaster import StatusBroadcaster
+from starlette.concurrency import run_in_threadpool
 
 # Add a logger for this module
 logger = logging.getLogger(__name__)
@@ -28,17 +43,22 @@ DUMMY_PUBLIC_KEY = "your-public-key"
 
 # Dependency: Kontrollera SSO/RBAC och roll
 
-def get_current_user(role: str = "user"):
-    def dependency(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
-        sso_config = get_sso_rbac_config(db)
+def get_current_user(role: str = "user", query_token: bool = False):
+    """
+    Dependency returning the authenticated user. With query_token the token may
+    also be passed as ?access_token=, for clients that cannot set the
+    Authorization header (EventSource).
+    """
+    def authenticate(token: Optional[str]):
+        sso_config = get_sso_rbac_config()
         if not sso_config.get("enabled", False):
             # Dev-läge: tillåt alla, returnera dummy-user
             return {"username": "devuser", "roles": ["admin", "user"], "dev_mode": True}
         # SSO/RBAC på: kontrollera JWT och grupp
-        if not credentials:
+        if not token:
             raise HTTPException(status_code=401, detail="Not authenticated")
         try:
-            payload = pyjwt.decode(credentials.credentials, DUMMY_PUBLIC_KEY, algorithms=["RS256"], options={"verify_signature": False})
+            payload = pyjwt.decode(token, DUMMY_PUBLIC_KEY, algorithms=["RS256"], options={"verify_signature": False})
             username = payload.get("preferred_username") or payload.get("sub")
             groups = payload.get("groups", [])
             if not username or not groups:
@@ -53,7 +73,14 @@ def get_current_user(role: str = "user"):
             return {"username": username, "roles": groups, "dev_mode": False}
         except Exception as e:
             raise HTTPException(status_code=401, detail=f"Auth failed: {e}")
-    return dependency
+
+    def dependency(credentials: HTTPAuthorizationCredentials = Security(security)):
+        return authenticate(credentials.credentials if credentials else None)
+
+    def query_dependency(credentials: HTTPAuthorizationCredentials = Security(security), access_token: Optional[str] = Query(None)):
+        return authenticate(credentials.credentials if credentials else access_token)
+
+    return query_dependency if query_token else dependency
 
 class ConnectionManager:
     def __init__(self):
@@ -89,10 +116,7 @@ class ConnectionManager:
                 self.disconnect(connection)
 
 manager = ConnectionManager()
-status_manager = ConnectionManager() # Manager for status updates
-
-# In-memory cache for the last known status of each file
-file_status_cache = {}
+status_manager = StatusBroadcaster() # Per-client queues and subscriptions for status updates
 
 # --- Maintenance Mode Check Decorator ---
 from functools import wraps
@@ -110,24 +134,24 @@ MAINTENANCE_MODE_WHITELIST = [
     "websocket_status_endpoint",
 ]
 
+async def is_maintenance_mode_active() -> bool:
+    """Reads MAINTENANCE_MODE from the settings cache; only a stale cache touches the DB."""
+    if settings_cache.is_fresh():
+        return settings_cache.get_bool("MAINTENANCE_MODE")
+    return await run_in_threadpool(settings_cache.get_bool, "MAINTENANCE_MODE")
+
 def require_not_maintenance_mode(endpoint_func):
     @wraps(endpoint_func)
-    async def async_wrapper(*args, db: Session = Depends(get_db), **kwargs):
+    async def async_wrapper(*args, **kwargs):
         # Allow whitelisted endpoints to bypass maintenance mode check
-        if endpoint_func.__name__ in MAINTENANCE_MODE_WHITELIST:
-            if inspect.iscoroutinefunction(endpoint_func):
-                return await endpoint_func(*args, db=db, **kwargs)
-            else:
-                return endpoint_func(*args, db=db, **kwargs)
-
-        setting = db.query(models.SystemSetting).filter_by(key="MAINTENANCE_MODE").first()
-        if setting and setting.value == "true":
-            raise HTTPException(status_code=503, detail="System is in maintenance mode.")
-        
+        if endpoint_func.__name__ not in MAINTENANCE_MODE_WHITELIST:
+            if await is_maintenance_mode_active():
+                raise HTTPException(status_code=503, detail="System is in maintenance mode.")
+
         if inspect.iscoroutinefunction(endpoint_func):
-            return await endpoint_func(*args, db=db, **kwargs)
+            return await endpoint_func(*args, **kwargs)
         else:
-            return endpoint_func(*args, db=db, **kwargs)
+            return await run_in_threadpool(endpoint_func, *args, **kwargs)
     return async_wrapper
 
 router = APIRouter()
@@ -136,74 +160,77 @@ UPLOAD_DIR = "/uploads"
 
 @router.post("/upload/", response_model=FileUploadResponse)
 @require_not_maintenance_mode
-async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db), user=Depends(get_current_user())):
-    if not os.path.exists(UPLOAD_DIR):
-        os.makedirs(UPLOAD_DIR)
-
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-
-    # Get file size
-    file.file.seek(0, os.SEEK_END)
-    file_size = file.file.tell()
-    file.file.seek(0)
-
-    # Check if a file with the same path already exists
-    db_file = db.query(models.File).filter(models.File.filepath == file_path).first()
-
-    # Save the uploaded file, overwriting if it exists
+@traced("upload", kind=SpanKind.SERVER)
+async def upload_file(file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user())):
+    filename = os.path.basename(file.filename or "")
+    if not filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+
+    # Stream the upload to a staging file, computing size and checksum in the same pass
+    staged = staging_path()
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        with UPLOAD_WRITE_SECONDS.labels("single").time():
+            file_size, checksum = await save_upload(file, staged)
     except Exception as e:
+        await run_in_threadpool(discard_staged, staged)
         raise HTTPException(status_code=500, detail=f"Could not save file: {e}")
 
-    if db_file:
-        # If file exists, update its status to PENDING for re-scanning
-        db_file.scan_status = models.ScanStatus.PENDING
-        db_file.scan_details = "Re-uploaded for scanning."
-        db_file.upload_date = datetime.utcnow() # Update timestamp
-        db_file.filesize = file_size
-        db_file.is_quarantined = False # Reset quarantine status
-        db_file.owner = user["username"] if user else None
-    else:
-        # If file doesn't exist, create a new database record
-        db_file = models.File(
-            filename=file.filename, 
-            filepath=file_path, 
-            filesize=file_size,
-            scan_status=models.ScanStatus.PENDING,
-            owner=user["username"] if user else None
-        )
-        db.add(db_file)
-    db.commit()
-    db.refresh(db_file)
-
-    # Publish message to RabbitMQ
     try:
-        rabbitmq_user = os.getenv("RABBITMQ_DEFAULT_USER", "guest")
-        rabbitmq_pass = os.getenv("RABBITMQ_DEFAULT_PASS", "guest")
-        rabbitmq_host = os.getenv("RABBITMQ_HOST", "rabbitmq")
-        credentials = pika.PlainCredentials(rabbitmq_user, rabbitmq_pass)
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=rabbitmq_host, credentials=credentials)
-        )
-        channel = connection.channel()
-        channel.queue_declare(queue='file_queue', durable=True)
-        message = {'file_path': file_path, 'file_id': db_file.id}
-        channel.basic_publish(
-            exchange='',
-            routing_key='file_queue',
-            body=json.dumps(message),
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # make message persistent
-            ))
-        connection.close()
-        return {"filename": file.filename, "id": db_file.id, "status": "PENDING"}
+        file_path = await store_blob(db, staged, checksum, file_size)
+        db_file = await register_upload(db, filename, file_path, file_size, checksum, user)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        await run_in_threadpool(discard_staged, staged)
+        raise
+    get_current_span().set_attribute("cfiles.file_id", db_file.id)
+    await queue_for_scan(db, db_file)
+    return {"filename": filename, "id": db_file.id, "status": "PENDING"}
+
+async def register_upload(db: AsyncSession, filename: str, file_path: str, file_size: int, checksum: str, user) -> models.File:
+    """
+    Creates the files row for content stored with store_blob(). Every upload
+    gets its own row, even when its content is already stored.
+    The row is flushed so it has an id, but the caller commits.
+    """
+    db_file = models.File(
+        filename=filename,
+        filepath=file_path,
+        filesize=file_size,
+        checksum=checksum,
+        blob_sha256=checksum,
+        scan_status=models.ScanStatus.PENDING,
+        owner=user["username"] if user else None
+    )
+    db.add(db_file)
+    await db.flush()
+    return db_file
+
+async def queue_for_scan(db: AsyncSession, db_file: models.File, priority: bool = False, rescan: bool = False):
+    """
+    Queues a committed file for scanning on the queue for its size (or the
+    priority queue); marks it ERROR if RabbitMQ is unavailable. A rescan
+    ignores cached verdicts for the file's checksum.
+    """
+    # Publish message to RabbitMQ over the shared, pooled publisher
+    try:
+        message = {
+            'file_path': db_file.filepath, 'file_id': db_file.id, 'checksum': db_file.checksum, 'owner': db_file.owner,
+            # For the workers' metrics: scan time by size and time spent in the queue
+            'filesize': db_file.filesize, 'queued_at': time.time(),
+        }
+        if rescan:
+            message['rescan'] = True
+        queue = scan_queue_for(db_file.filesize, priority)
+        # The trace continues in the worker that takes the message
+        with tracer.start_as_current_span(f"publish {queue}", kind=SpanKind.PRODUCER,
+                                          attributes={"messaging.destination.name": queue, "cfiles.file_id": db_file.id}):
+            await publisher.publish(queue, message, headers=inject_headers())
     except Exception as e:
         # If RabbitMQ fails, update DB status to ERROR
         db_file.scan_status = models.ScanStatus.ERROR
         db_file.scan_details = f"Failed to publish to RabbitMQ: {e}"
-        db.commit()
+        await db.commit()
         raise HTTPException(status_code=500, detail=f"Could not publish message to RabbitMQ: {e}")
 
 @router.websocket("/ws")
@@ -229,13 +256,17 @@ async def websocket_endpoint(websocket: WebSocket):
 async def websocket_status_endpoint(websocket: WebSocket):
     logger.info(f"WebSocket /ws/status: Försöker acceptera anslutning från {websocket.client}")
     try:
-        await status_manager.connect(websocket)
+        # Optional subscriptions: /ws/status?file_id=1&file_id=2&owner=alice (default: all files)
+        file_ids = [int(i) for i in websocket.query_params.getlist("file_id") if i.isdigit()]
+        owners = websocket.query_params.getlist("owner")
+        # Progress of bulk quarantine jobs only goes to the clients that ask for it
+        job_ids = websocket.query_params.getlist("job_id")
+        await status_manager.connect(websocket, file_ids=file_ids, owners=owners, job_ids=job_ids)
         logger.info(f"WebSocket /ws/status: Anslutning accepterad från {websocket.client}")
         while True:
             data = await websocket.receive_text()
             logger.debug(f"Received message from {websocket.client}: {data}")
-            if data == '{"type":"pong"}':
-                status_manager.update_last_pong(websocket)
+            status_manager.handle_client_message(websocket, data)
     except WebSocketDisconnect:
         status_manager.disconnect(websocket)
         logger.info(f"Client {websocket.client} disconnected from status endpoint.")
@@ -250,29 +281,86 @@ async def websocket_status_endpoint(websocket: WebSocket):
 
 @router.get("/files/", response_model=List[FileResponse])
 @require_not_maintenance_mode
-def get_files(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    files = db.query(models.File).order_by(models.File.upload_date.desc()).offset(skip).limit(limit).all()
+async def get_files(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    scan_status: Optional[ScanStatus] = None,
+    owner: Optional[str] = None,
+    uploaded_from: Optional[datetime] = None,
+    uploaded_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Lists files newest first using keyset pagination over (upload_date, id).
+    When more rows exist, the cursor for the next page is returned in the
+    X-Next-Cursor header; pass it back as ?cursor= to continue.
+    """
+    query = select(models.File)
+    if scan_status is not None:
+        query = query.where(models.File.scan_status == scan_status.value)
+    if owner is not None:
+        query = query.where(models.File.owner == owner)
+    if uploaded_from is not None:
+        query = query.where(models.File.upload_date >= uploaded_from)
+    if uploaded_to is not None:
+        query = query.where(models.File.upload_date < uploaded_to)
+    if cursor:
+        try:
+            last_date, last_id = decode_datetime_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.where(tuple_(models.File.upload_date, models.File.id) < tuple_(last_date, last_id))
+
+    query = query.order_by(models.File.upload_date.desc(), models.File.id.desc()).limit(limit + 1)
+    files = (await db.execute(query)).scalars().all()
+    if len(files) > limit:
+        files = files[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(files[-1].upload_date, files[-1].id)
     return files
 
 @router.get("/files/{file_id}", response_model=FileResponse)
 @require_not_maintenance_mode
-async def get_file(file_id: int, db: Session = Depends(get_db)):
-    file = db.query(models.File).filter(models.File.id == file_id).first()
+async def get_file(file_id: int, db: AsyncSession = Depends(get_async_db)):
+    file = await db.get(models.File, file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
     return file
 
-@router.get("/download/{file_id}")
-async def download_file(file_id: int, db: Session = Depends(get_db)):
-    db_file = db.query(models.File).filter(models.File.id == file_id).first()
+@router.post("/files/{file_id}/rescan", response_model=FileUploadResponse)
+@require_not_maintenance_mode
+async def rescan_file(
+    file_id: int,
+    priority: bool = Body(True, embed=True),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user(role="admin")),
+):
+    """Scans a file again, by default ahead of everything else that is queued."""
+    db_file = await db.get(models.File, file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
+    db_file.scan_status = models.ScanStatus.PENDING
+    db_file.scan_details = f"Rescan requested by {user['username'] if user else 'admin'}."
+    # The new verdict replaces any earlier override
+    db_file.verdict_overridden_by = None
+    db_file.verdict_overridden_at = None
+    await db.commit()
+    await queue_for_scan(db, db_file, priority=priority, rescan=True)
+    logger.info(f"File {file_id} queued for {'priority ' if priority else ''}rescan.")
+    return {"filename": db_file.filename, "id": db_file.id, "status": "PENDING"}
+
+@router.api_route("/files/{file_id}/download", methods=["GET", "HEAD"])
+@router.api_route("/download/{file_id}", methods=["GET", "HEAD"])
+async def download_file(file_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    db_file = await db.get(models.File, file_id)
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
 
-    # Only allow download if the scan status is 'clean'
+    # Security check: Only allow downloading of clean files
     if db_file.scan_status != ScanStatus.CLEAN:
         raise HTTPException(status_code=403, detail=f"File cannot be downloaded. Status: {db_file.scan_status}")
 
-    return FileResponse(db_file.filepath, media_type="application/octet-stream", filename=db_file.filename)
+    return await download_response(request, db_file)
 
 @router.post("/config/logo")
 async def upload_logo(file: UploadFile = File(...)):
@@ -284,20 +372,69 @@ async def get_logo():
     # Implementation for getting logo
     pass
 
+# Statuses that mean a scan has finished with a verdict
+SCANNED_STATUSES = (ScanStatus.CLEAN.value, ScanStatus.INFECTED.value, ScanStatus.QUARANTINED.value)
+
+
+def _status_totals(db: Session) -> dict:
+    """{scan_status: count} summed over the file_stats counters."""
+    rows = (
+        db.query(models.FileStat.scan_status, func.sum(models.FileStat.file_count))
+        .group_by(models.FileStat.scan_status)
+        .all()
+    )
+    return {status_: int(count) for status_, count in rows if count}
+
+
+@router.get("/stats", response_model=FileStats)
+def get_stats(days: int = Query(30, ge=1, le=366), db: Session = Depends(get_db)):
+    """
+    File counts per status, per owner and per upload day (the last `days` days).
+    Reads the trigger-maintained file_stats table, never the files table.
+    """
+    by_status = _status_totals(db)
+
+    by_owner = {}
+    owner_rows = (
+        db.query(models.FileStat.owner, models.FileStat.scan_status, func.sum(models.FileStat.file_count))
+        .group_by(models.FileStat.owner, models.FileStat.scan_status)
+        .all()
+    )
+    for owner, status_, count in owner_rows:
+        if count:
+            by_owner.setdefault(owner, {})[status_] = int(count)
+
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    by_day = {}
+    day_rows = (
+        db.query(models.FileStat.day, models.FileStat.scan_status, func.sum(models.FileStat.file_count))
+        .filter(models.FileStat.day >= since)
+        .group_by(models.FileStat.day, models.FileStat.scan_status)
+        .all()
+    )
+    for day, status_, count in day_rows:
+        if count:
+            by_day.setdefault(day, {})[status_] = int(count)
+
+    return {
+        "total": sum(by_status.values()),
+        "by_status": by_status,
+        "by_owner": by_owner,
+        "by_day": [{"day": day, "counts": counts} for day, counts in sorted(by_day.items())],
+    }
+
 @router.get("/config/files/count", response_model=int)
 def get_files_count(db: Session = Depends(get_db)):
-    count = db.query(models.File).count()
-    return count
+    return sum(_status_totals(db).values())
 
 @router.get("/config/files/scanned-count", response_model=int)
 def get_scanned_files_count(db: Session = Depends(get_db)):
-    count = db.query(models.File).filter(models.File.status == models.ScanStatus.SCANNED).count()
-    return count
+    totals = _status_totals(db)
+    return sum(totals.get(s, 0) for s in SCANNED_STATUSES)
 
 @router.get("/config/files/infected-count", response_model=int)
 def get_infected_files_count(db: Session = Depends(get_db)):
-    count = db.query(models.File).filter(models.File.status == models.ScanStatus.INFECTED).count()
-    return count
+    return _status_totals(db).get(ScanStatus.INFECTED.value, 0)
 
 @router.get("/config/system-settings", response_model=List[SystemSetting])
 def get_system_settings(db: Session = Depends(get_db)):
@@ -313,21 +450,12 @@ def update_system_setting(setting_id: int, setting: SystemSettingUpdate, db: Ses
     for key, value in setting.dict().items():
         setattr(db_setting, key, value)
     
+    settings_cache.notify_changed(db, db_setting.key)
     db.commit()
+    settings_cache.invalidate()
     db.refresh(db_setting)
     return db_setting
 
-@router.post("/upload-chunk")
-async def upload_chunk(file: UploadFile, 
-                        chunkIndex: int = Form(...), 
-                        fileName: str = Form(...)):
-    try:
-        with open(f"uploads/{fileName}.part{chunkIndex}", "wb") as f:
-            f.write(file.file.read())
-        return {"message": "Chunk uploaded successfully", "chunkIndex": chunkIndex}
-    except Exception as e:
-        return {"error": str(e)}
-
 @router.post("/scan-virus")
 async def scan_virus(file_path: str = Form(...)):
     if "file_path" not in file_path:
@@ -347,11 +475,11 @@ async def scan_virus(file_path: str = Form(...)):
 # --- Maintenance Mode Endpoints ---
 
 @router.get("/config/maintenance-mode")
-def get_maintenance_mode(db: Session = Depends(get_db)):
-    setting = db.query(models.SystemSetting).filter_by(key="MAINTENANCE_MODE").first()
-    if not setting:
+def get_maintenance_mode():
+    value = settings_cache.get("MAINTENANCE_MODE")
+    if value is None:
         raise HTTPException(status_code=500, detail="MAINTENANCE_MODE setting missing")
-    return {"maintenance_mode": setting.value == "true"}
+    return {"maintenance_mode": value == "true"}
 
 @router.post("/config/maintenance-mode")
 def set_maintenance_mode(
@@ -363,13 +491,14 @@ def set_maintenance_mode(
     if not setting:
         raise HTTPException(status_code=500, detail="MAINTENANCE_MODE setting missing")
     setting.value = "true" if enabled else "false"
+    settings_cache.notify_changed(db, setting.key)
     db.commit()
+    settings_cache.invalidate()
     return {"maintenance_mode": setting.value == "true"}
 
 @router.get("/config/sso-settings")
-def get_sso_settings(db: Session = Depends(get_db)):
-    setting = db.query(models.SystemSetting).filter_by(key="SHOW_CURRENT_USER_IN_ADMIN").first()
-    show_current_user = setting.value == "true" if setting else False
+def get_sso_settings():
+    show_current_user = settings_cache.get_bool("SHOW_CURRENT_USER_IN_ADMIN")
     # Frontend expects uppercase key
     return {"SHOW_CURRENT_USER_IN_ADMIN": show_current_user}
 
@@ -388,17 +517,16 @@ def get_current_user_info(user=Depends(get_current_user())):
 
 # Utility: Hämta SSO/RBAC-status och config
 
-def get_sso_rbac_config(db):
-    settings = {s.key: s for s in db.query(models.SystemSetting).all()}
-    enabled = settings.get("RBAC_SSO_ENABLED", None)
-    if enabled and enabled.value == "true":
+def get_sso_rbac_config():
+    settings = settings_cache.get_all()
+    if settings.get("RBAC_SSO_ENABLED") == "true":
         return {
             "enabled": True,
-            "ad_endpoint": settings.get("AD_ENDPOINT", None).value if settings.get("AD_ENDPOINT") else None,
-            "ad_client_id": settings.get("AD_CLIENT_ID", None).value if settings.get("AD_CLIENT_ID") else None,
-            "ad_client_secret": settings.get("AD_CLIENT_SECRET", None).value if settings.get("AD_CLIENT_SECRET") else None,
-            "ad_group_users": settings.get("AD_GROUP_USERS", None).value if settings.get("AD_GROUP_USERS") else "users",
-            "ad_group_admins": settings.get("AD_GROUP_ADMINS", None).value if settings.get("AD_GROUP_ADMINS") else "admins",
+            "ad_endpoint": settings.get("AD_ENDPOINT"),
+            "ad_client_id": settings.get("AD_CLIENT_ID"),
+            "ad_client_secret": settings.get("AD_CLIENT_SECRET"),
+            "ad_group_users": settings.get("AD_GROUP_USERS", "users"),
+            "ad_group_admins": settings.get("AD_GROUP_ADMINS", "admins"),
         }
     return {"enabled": False}
 
@@ -420,14 +548,17 @@ def init_sso_settings(db: Session = Depends(get_db)):
             db.add(s)
             created.append(d["key"])
     try:
+        if created:
+            settings_cache.notify_changed(db, "RBAC_SSO_ENABLED")
         db.commit()
+        settings_cache.invalidate()
     except IntegrityError:
         db.rollback()
     return {"created": created}
 
 @router.get("/config/sso-status")
-def get_sso_status(db: Session = Depends(get_db)):
-    return get_sso_rbac_config(db)
+def get_sso_status():
+    return get_sso_rbac_config()
 
 @router.get("/")
 def root():
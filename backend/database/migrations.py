@@ -0,0 +1,196 @@
+"""
+Versioned schema migrations applied at startup, after create_all().
+
+create_all() only creates missing tables; it never adds indexes or columns to
+tables that already exist. Changes to existing tables therefore go here as
+numbered migrations. Each one runs once and is recorded in schema_migrations.
+An advisory lock keeps several backend replicas from running them at the same
+time. Migrations marked "concurrent" run outside a transaction so that
+CREATE INDEX CONCURRENTLY keeps a large files table writable; all others run
+in a single transaction together with their schema_migrations record.
+Every statement is idempotent.
+"""
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary constant identifying the migration advisory lock
+MIGRATION_LOCK_ID = 7_300_451
+
+# Append only - never edit a migration that has already been applied.
+# Note: statements go through sqlalchemy.text(), so use CAST(x AS type)
+# instead of x::type (a colon starts a bind parameter).
+MIGRATIONS = [
+    {
+        "version": 1,
+        "description": "Composite and partial indexes for keyset pagination of files",
+        "concurrent": True,
+        "statements": [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_files_upload_date_id ON files (upload_date DESC, id DESC)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_files_status_upload_date_id ON files (scan_status, upload_date DESC, id DESC)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_files_owner_upload_date_id ON files (owner, upload_date DESC, id DESC)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_files_in_flight_upload_date_id ON files (upload_date DESC, id DESC) "
+            "WHERE scan_status IN ('pending', 'scanning')",
+        ],
+    },
+    {
+        "version": 2,
+        "description": "Trigger-maintained per day/owner/status counters in file_stats",
+        "concurrent": False,
+        "statements": [
+            # Block writers while the counters are rebuilt so no change is counted twice or missed
+            "LOCK TABLE files IN SHARE ROW EXCLUSIVE MODE",
+            """
+            CREATE OR REPLACE FUNCTION file_stats_apply(p_day DATE, p_owner VARCHAR, p_status VARCHAR, p_delta BIGINT)
+            RETURNS void AS $$
+            BEGIN
+                INSERT INTO file_stats (day, owner, scan_status, file_count)
+                VALUES (p_day, COALESCE(p_owner, ''), COALESCE(p_status, ''), p_delta)
+                ON CONFLICT (day, owner, scan_status)
+                DO UPDATE SET file_count = file_stats.file_count + EXCLUDED.file_count;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            """
+            CREATE OR REPLACE FUNCTION file_stats_track() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM file_stats_apply(CAST(OLD.upload_date AS DATE), OLD.owner, OLD.scan_status, -1);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM file_stats_apply(CAST(NEW.upload_date AS DATE), NEW.owner, NEW.scan_status, 1);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS files_stats_insert_delete ON files",
+            "CREATE TRIGGER files_stats_insert_delete AFTER INSERT OR DELETE ON files "
+            "FOR EACH ROW EXECUTE FUNCTION file_stats_track()",
+            "DROP TRIGGER IF EXISTS files_stats_update ON files",
+            "CREATE TRIGGER files_stats_update AFTER UPDATE OF scan_status, owner, upload_date ON files "
+            "FOR EACH ROW WHEN (OLD.scan_status IS DISTINCT FROM NEW.scan_status "
+            "OR OLD.owner IS DISTINCT FROM NEW.owner "
+            "OR OLD.upload_date IS DISTINCT FROM NEW.upload_date) "
+            "EXECUTE FUNCTION file_stats_track()",
+            # Backfill from the existing rows
+            "DELETE FROM file_stats",
+            "INSERT INTO file_stats (day, owner, scan_status, file_count) "
+            "SELECT CAST(upload_date AS DATE), COALESCE(owner, ''), COALESCE(scan_status, ''), COUNT(*) "
+            "FROM files GROUP BY 1, 2, 3",
+        ],
+    },
+    {
+        "version": 3,
+        "description": "Widen files.filesize to BIGINT for uploads over 2 GiB",
+        "concurrent": False,
+        "statements": [
+            "ALTER TABLE files ALTER COLUMN filesize TYPE BIGINT",
+        ],
+    },
+    {
+        "version": 4,
+        "description": "Point files at reference-counted content-addressed blobs",
+        "concurrent": False,
+        "statements": [
+            "ALTER TABLE files ADD COLUMN IF NOT EXISTS blob_sha256 VARCHAR REFERENCES blobs (sha256)",
+            # Several files may now share a blob, and an upload never replaces another file
+            "ALTER TABLE files DROP CONSTRAINT IF EXISTS files_filepath_key",
+            """
+            CREATE OR REPLACE FUNCTION blobs_track_refs() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.blob_sha256 IS NOT NULL THEN
+                    UPDATE blobs SET refcount = refcount - 1, last_used_at = now() WHERE sha256 = OLD.blob_sha256;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.blob_sha256 IS NOT NULL THEN
+                    UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = NEW.blob_sha256;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS files_blob_refs_insert_delete ON files",
+            "CREATE TRIGGER files_blob_refs_insert_delete AFTER INSERT OR DELETE ON files "
+            "FOR EACH ROW EXECUTE FUNCTION blobs_track_refs()",
+            "DROP TRIGGER IF EXISTS files_blob_refs_update ON files",
+            "CREATE TRIGGER files_blob_refs_update AFTER UPDATE OF blob_sha256 ON files "
+            "FOR EACH ROW WHEN (OLD.blob_sha256 IS DISTINCT FROM NEW.blob_sha256) "
+            "EXECUTE FUNCTION blobs_track_refs()",
+        ],
+    },
+    {
+        "version": 5,
+        "description": "Indexes for looking up files by path and by blob",
+        "concurrent": True,
+        "statements": [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_files_filepath ON files (filepath)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_files_blob_sha256 ON files (blob_sha256)",
+        ],
+    },
+    {
+        "version": 6,
+        "description": "Flag files that were quarantined before is_quarantined was maintained",
+        "concurrent": False,
+        "statements": [
+            "UPDATE files SET is_quarantined = TRUE "
+            "WHERE NOT is_quarantined AND scan_status = 'infected' AND filepath LIKE '/quarantine/%'",
+        ],
+    },
+    {
+        "version": 7,
+        "description": "Partial index for keyset pagination of quarantined files",
+        "concurrent": True,
+        "statements": [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_files_quarantined_upload_date_id ON files (upload_date DESC, id DESC) "
+            "WHERE is_quarantined",
+        ],
+    },
+    {
+        "version": 8,
+        "description": "Resumable quarantine jobs and a record of overridden verdicts",
+        "concurrent": False,
+        "statements": [
+            "ALTER TABLE quarantine_jobs ADD COLUMN IF NOT EXISTS last_file_id INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE files ADD COLUMN IF NOT EXISTS verdict_overridden_by VARCHAR",
+            "ALTER TABLE files ADD COLUMN IF NOT EXISTS verdict_overridden_at TIMESTAMP WITH TIME ZONE",
+        ],
+    },
+]
+
+
+def run_migrations(engine):
+    """Applies all pending migrations. Safe to call on every startup."""
+    with engine.connect() as connection:
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, "
+            "description VARCHAR, "
+            "applied_at TIMESTAMP WITH TIME ZONE DEFAULT now())"
+        ))
+        connection.execute(text("SELECT pg_advisory_lock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+        try:
+            applied = {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+            for migration in MIGRATIONS:
+                if migration["version"] in applied:
+                    continue
+                logger.info(f"Applying migration {migration['version']}: {migration['description']}")
+                if migration["concurrent"]:
+                    _apply(connection, migration)
+                else:
+                    with engine.begin() as transaction:
+                        _apply(transaction, migration)
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+
+
+def _apply(connection, migration):
+    for statement in migration["statements"]:
+        connection.execute(text(statement))
+    connection.execute(
+        text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+        {"version": migration["version"], "description": migration["description"]},
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Boolean, JSON, ForeignKey
 from sqlalchemy.sql import func
 from .database import Base
 from enums import ScanStatus
@@ -8,8 +8,8 @@ class File(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
-    filepath = Column(String, unique=True)
-    filesize = Column(Integer, nullable=False)
+    filepath = Column(String, index=True)  # Flera filer kan dela samma blob
+    filesize = Column(BigInteger, nullable=False)
     upload_date = Column(DateTime(timezone=True), server_default=func.now())
     scan_status = Column(String, default=ScanStatus.PENDING.value)
     scan_date = Column(DateTime(timezone=True), nullable=True)
@@ -17,6 +17,27 @@ class File(Base):
     is_quarantined = Column(Boolean, default=False, nullable=False)
     checksum = Column(String, nullable=True)
     owner = Column(String, nullable=True, index=True)  # Nytt fält för användare/ägare
+    blob_sha256 = Column(String, ForeignKey("blobs.sha256"), nullable=True, index=True)  # NULL för filer från före blob-lagringen
+    # Satt när en admin släppt filen ur karantän trots skannerns utslag
+    verdict_overridden_by = Column(String, nullable=True)
+    verdict_overridden_at = Column(DateTime(timezone=True), nullable=True)
+
+class QuarantineJob(Base):
+    """A bulk release or delete of quarantined files, run in the background by the backend."""
+    __tablename__ = "quarantine_jobs"
+
+    id = Column(String, primary_key=True)
+    action = Column(String, nullable=False)  # release | delete
+    file_ids = Column(JSON, nullable=True)  # NULL = alla filer i karantän
+    state = Column(String, nullable=False, default="queued")  # queued | running | finished | failed
+    total = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    last_file_id = Column(Integer, nullable=False, default=0)  # Jobbet fortsätter efter detta fil-id
+    error = Column(String, nullable=True)
+    created_by = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
 
 class SystemSetting(Base):
     __tablename__ = "system_settings"
@@ -27,3 +48,62 @@ class SystemSetting(Base):
     description = Column(String, nullable=True)
     # För framtida komplexa inställningar (t.ex. AD-konfig):
     extra = Column(JSON, nullable=True)
+
+class ScanVerdict(Base):
+    """Cached scan verdict for a given content checksum and ClamAV signature version."""
+    __tablename__ = "scan_verdicts"
+
+    checksum = Column(String, primary_key=True)
+    signature_version = Column(String, primary_key=True)
+    scan_status = Column(String, nullable=False)
+    scan_details = Column(String, nullable=True)
+    scanned_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class FileStat(Base):
+    """
+    Number of files per upload day, owner and scan status. Maintained by a
+    trigger on files (see migrations.py), so statistics never scan the files table.
+    """
+    __tablename__ = "file_stats"
+
+    day = Column(Date, primary_key=True)
+    owner = Column(String, primary_key=True, default="")  # '' för filer utan ägare
+    scan_status = Column(String, primary_key=True)
+    file_count = Column(BigInteger, nullable=False, default=0)
+
+class UploadSession(Base):
+    """A resumable upload in progress; its chunks are stored until the session is completed."""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+    filename = Column(String, nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    checksum = Column(String, nullable=True)  # Förväntad SHA-256 för hela filen, om klienten skickade en
+    owner = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    file_id = Column(Integer, nullable=True)  # Sätts när filen har satts ihop
+
+class UploadChunk(Base):
+    """A chunk received for an upload session."""
+    __tablename__ = "upload_chunks"
+
+    session_id = Column(String, ForeignKey("upload_sessions.id", ondelete="CASCADE"), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    size = Column(Integer, nullable=False)
+    checksum = Column(String, nullable=False)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Blob(Base):
+    """
+    Content-addressed file content, shared by all files rows with the same
+    SHA-256. refcount is maintained by a trigger on files (see migrations.py).
+    """
+    __tablename__ = "blobs"
+
+    sha256 = Column(String, primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Touched by every upload of this content; garbage collection waits for a grace period after it
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -0,0 +1,145 @@
+"""
+Process-wide cache of the system_settings table.
+
+Hot paths (maintenance-mode checks, SSO/RBAC config, the worker's per-message
+checks) read settings from memory. The cache reloads all rows in one query
+when its short TTL has expired, and is invalidated immediately when a setting
+is written: writers call notify_changed() inside their transaction, Postgres
+delivers a NOTIFY on commit, and every process running start_listener() drops
+its cached copy and runs its change callbacks.
+"""
+import logging
+import os
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+from .database import SessionLocal, engine
+from .models import SystemSetting
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "5"))
+SETTINGS_NOTIFY_CHANNEL = "settings_changed"
+LISTENER_RETRY_DELAY = 5
+
+
+class SettingsCache:
+    def __init__(self, session_factory=SessionLocal, ttl: float = SETTINGS_CACHE_TTL):
+        self._session_factory = session_factory
+        self.ttl = ttl
+        self._values = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._listener_thread = None
+        self._stop_listener = threading.Event()
+
+    def is_fresh(self) -> bool:
+        return self._values is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def get_all(self) -> dict:
+        """Returns {key: value} for all settings, reloading them if the TTL has expired."""
+        if self.is_fresh():
+            return self._values
+        with self._lock:
+            if self.is_fresh():
+                return self._values
+            db = self._session_factory()
+            try:
+                values = {s.key: s.value for s in db.query(SystemSetting).all()}
+            except Exception as e:
+                if self._values is None:
+                    raise
+                # Serve the last known settings rather than failing every request
+                logger.error(f"Could not reload system settings, using cached values: {e}")
+                return self._values
+            finally:
+                db.close()
+            self._values = values
+            self._loaded_at = time.monotonic()
+            return values
+
+    def get(self, key: str, default=None):
+        return self.get_all().get(key, default)
+
+    def get_bool(self, key: str, default: bool = False) -> bool:
+        value = self.get(key)
+        if value is None:
+            return default
+        return value.lower() == "true"
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+    def notify_changed(self, db, key: str):
+        """
+        Announces a settings change to all processes. Call before db.commit():
+        NOTIFY is transactional and is only delivered once the change is committed.
+        """
+        db.execute(text("SELECT pg_notify(:channel, :key)"), {"channel": SETTINGS_NOTIFY_CHANNEL, "key": key})
+
+    def add_change_callback(self, callback):
+        """
+        Registers callback(key) to run on the listener thread whenever a setting
+        changes. key is None when any setting may have changed (e.g. after the
+        listener reconnected).
+        """
+        self._callbacks.append(callback)
+
+    def _handle_notification(self, key: str):
+        self.invalidate()
+        for callback in list(self._callbacks):
+            try:
+                callback(key)
+            except Exception as e:
+                logger.error(f"Settings change callback failed for {key}: {e}")
+
+    def start_listener(self):
+        """Starts a background thread that LISTENs for settings changes."""
+        if self._listener_thread is not None:
+            return
+        self._stop_listener.clear()
+        self._listener_thread = threading.Thread(target=self._listen, name="settings-listener", daemon=True)
+        self._listener_thread.start()
+
+    def stop_listener(self):
+        self._stop_listener.set()
+        if self._listener_thread is not None:
+            self._listener_thread.join(timeout=LISTENER_RETRY_DELAY)
+            self._listener_thread = None
+
+    def _listen(self):
+        while not self._stop_listener.is_set():
+            raw_connection = None
+            try:
+                raw_connection = engine.raw_connection()
+                connection = raw_connection.driver_connection
+                connection.autocommit = True
+                cursor = connection.cursor()
+                cursor.execute(f"LISTEN {SETTINGS_NOTIFY_CHANNEL}")
+                logger.info(f"Listening for settings changes on '{SETTINGS_NOTIFY_CHANNEL}'.")
+                # Anything may have changed while we were not listening
+                self._handle_notification(None)
+                while not self._stop_listener.is_set():
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        logger.info(f"Setting '{notification.payload}' changed; invalidating settings cache.")
+                        self._handle_notification(notification.payload)
+            except Exception as e:
+                logger.error(f"Settings listener failed: {e}. Retrying in {LISTENER_RETRY_DELAY} seconds...")
+                self._stop_listener.wait(LISTENER_RETRY_DELAY)
+            finally:
+                if raw_connection is not None:
+                    try:
+                        raw_connection.invalidate()
+                    except Exception:
+                        pass
+
+
+settings_cache = SettingsCache()
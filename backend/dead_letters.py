@@ -0,0 +1,164 @@
+"""
+Admin endpoints for scan messages that ended up in the dead-letter queue.
+
+    GET  /admin/dead-letters?offset=0&limit=50   -> [DeadLetter]
+    POST /admin/dead-letters/replay              -> DeadLetterReplayResult
+
+Listing takes messages from the queue without acking them and closes the
+channel afterwards, which returns them to the queue in their original order;
+offset pages through a long queue. Replaying publishes the selected messages
+to the scan queue they came from with a fresh attempt count, and acks each
+one only once the broker has confirmed its copy; the rest are returned.
+Without file_ids the first `limit` messages are replayed. With file_ids the
+queue is searched until all of them are found, but no further than the
+first DEAD_LETTER_SEARCH_LIMIT messages.
+"""
+import json
+import logging
+import os
+from typing import List, Optional
+
+import aio_pika
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config_endpoints import get_current_user, require_not_maintenance_mode
+from database import models
+from database.async_database import get_async_db
+from rabbitmq_publisher import RABBITMQ_PUBLISH_TIMEOUT, publisher
+from scan_queues import (
+    ATTEMPTS_HEADER, DEAD_LETTER_QUEUE, DEAD_LETTERED_AT_HEADER, LAST_ERROR_HEADER, ORIGINAL_QUEUE_HEADER, SMALL_QUEUE,
+)
+from schemas import DeadLetter, DeadLetterReplay, DeadLetterReplayResult
+
+logger = logging.getLogger(__name__)
+
+# Messages a replay by file id looks through at most
+DEAD_LETTER_SEARCH_LIMIT = int(os.getenv("DEAD_LETTER_SEARCH_LIMIT", "10000"))
+
+router = APIRouter(prefix="/admin/dead-letters")
+
+
+async def take_dead_letters(channel, limit: int, file_ids: Optional[set] = None) -> list:
+    """
+    Gets up to limit messages, unacked, from the front of the dead-letter
+    queue. Given file_ids, stops early once a message for each has been seen.
+    """
+    queue = await channel.declare_queue(DEAD_LETTER_QUEUE, durable=True)
+    missing = set(file_ids) if file_ids is not None else None
+    messages = []
+    while len(messages) < limit and missing != set():
+        message = await queue.get(no_ack=False, fail=False)
+        if message is None:
+            break
+        messages.append(message)
+        if missing:
+            missing.discard(describe(message)["file_id"])
+    return messages
+
+
+def describe(message) -> dict:
+    headers = message.headers or {}
+    try:
+        body = json.loads(message.body)
+    except ValueError:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+    return {
+        "file_id": body.get("file_id"),
+        "file_path": body.get("file_path"),
+        "original_queue": headers.get(ORIGINAL_QUEUE_HEADER),
+        "attempts": int(headers.get(ATTEMPTS_HEADER) or 0),
+        "last_error": headers.get(LAST_ERROR_HEADER),
+        "dead_lettered_at": headers.get(DEAD_LETTERED_AT_HEADER),
+    }
+
+
+async def restore_unreplayed(db: AsyncSession, letters: list, error: Exception):
+    """Marks the files of messages that could not be replayed as failed again."""
+    file_ids = [letter["file_id"] for letter in letters if letter["file_id"] is not None]
+    logger.error(f"Replaying dead-lettered scan messages failed; {len(letters)} stay in {DEAD_LETTER_QUEUE}: {error}")
+    if file_ids:
+        await db.execute(
+            update(models.File)
+            .where(models.File.id.in_(file_ids))
+            .values(scan_status=models.ScanStatus.ERROR, scan_details=f"Replay from the dead-letter queue failed: {error}")
+        )
+        await db.commit()
+
+
+@router.get("", response_model=List[DeadLetter])
+async def list_dead_letters(
+    offset: int = Query(0, ge=0, le=DEAD_LETTER_SEARCH_LIMIT),
+    limit: int = Query(50, ge=1, le=1000),
+    user=Depends(get_current_user(role="admin")),
+):
+    connection = await publisher.get_connection()
+    channel = await connection.channel()
+    try:
+        return [describe(message) for message in (await take_dead_letters(channel, offset + limit))[offset:]]
+    finally:
+        # Unacked messages go back to the queue
+        await channel.close()
+
+
+@router.post("/replay", response_model=DeadLetterReplayResult)
+@require_not_maintenance_mode
+async def replay_dead_letters(
+    request: DeadLetterReplay = Body(DeadLetterReplay()),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user(role="admin")),
+):
+    connection = await publisher.get_connection()
+    # Confirms: a message is only acked here once its copy is safe in the scan queue
+    channel = await connection.channel(publisher_confirms=True)
+    replayed = 0
+    try:
+        if request.file_ids is None:
+            messages = await take_dead_letters(channel, request.limit)
+        else:
+            messages = await take_dead_letters(channel, DEAD_LETTER_SEARCH_LIMIT, file_ids=set(request.file_ids))
+        selected = []
+        for message in messages:
+            letter = describe(message)
+            if request.file_ids is None or letter["file_id"] in request.file_ids:
+                selected.append((message, letter))
+
+        file_ids = [letter["file_id"] for _, letter in selected if letter["file_id"] is not None]
+        if file_ids:
+            # Before publishing, so a quick scan result is not overwritten
+            await db.execute(
+                update(models.File)
+                .where(models.File.id.in_(file_ids))
+                .values(scan_status=models.ScanStatus.PENDING, scan_details="Replayed from the dead-letter queue.")
+            )
+            await db.commit()
+
+        for message, letter in selected:
+            try:
+                # Raises if the broker nacks or returns the message
+                await channel.default_exchange.publish(
+                    aio_pika.Message(
+                        body=message.body,
+                        content_type=message.content_type,
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                    ),
+                    routing_key=letter["original_queue"] or SMALL_QUEUE,
+                    mandatory=True,
+                    timeout=RABBITMQ_PUBLISH_TIMEOUT,
+                )
+            except Exception as e:
+                await restore_unreplayed(db, [letter for _, letter in selected[replayed:]], e)
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Replayed {replayed} of {len(selected)} messages; the rest stay in the dead-letter queue: {e}",
+                )
+            await message.ack()
+            replayed += 1
+    finally:
+        await channel.close()
+
+    logger.info(f"Replayed {len(selected)} dead-lettered scan messages.")
+    return {"replayed": len(selected), "file_ids": file_ids}
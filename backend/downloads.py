@@ -0,0 +1,144 @@
+"""
+File downloads with validators and byte ranges.
+
+The stored SHA-256 checksum is the file's strong ETag. A client that already
+has the current version sends it back in If-None-Match and gets an empty 304
+instead of the whole body. Range requests (single or multiple ranges, guarded
+by If-Range) are answered with 206 by Starlette's FileResponse, so interrupted
+downloads can resume and download managers can fetch parts in parallel. When
+the ASGI server supports the pathsend extension, FileResponse hands the file
+to the server to send with sendfile instead of streaming it through Python.
+Files in remote storage (S3) are streamed from it instead, with single byte
+ranges fetched as ranged reads.
+"""
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, StreamingResponse
+
+from database import models
+from storage import Storage, get_storage
+
+# Clients may keep a copy but must revalidate it; a matching ETag makes that a cheap 304
+DOWNLOAD_CACHE_CONTROL = "private, no-cache"
+
+
+def file_etag(db_file: models.File, stat_result) -> str:
+    """Strong ETag from the content checksum, or a weak one from size and mtime if it is unknown."""
+    if db_file.checksum:
+        return f'"{db_file.checksum}"'
+    return f'W/"{int(stat_result.st_mtime)}-{stat_result.st_size}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as required for If-None-Match (RFC 9110, 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    The byte range requested by a Range header, as inclusive (start, end).
+    None means the whole file is sent: no header, a syntax error or several
+    ranges (which a server may ignore). Unsatisfiable ranges raise a 416.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    first, sep, last = spec.partition("-")
+    if "," in spec or not sep:
+        return None
+    try:
+        if first.strip():
+            start = int(first)
+            end = min(int(last), size - 1) if last.strip() else size - 1
+        else:
+            suffix_length = int(last)
+            # bytes=-0 asks for nothing, which is as unsatisfiable as a start past the end
+            start = max(0, size - suffix_length) if suffix_length > 0 else size
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"content-range": f"bytes */{size}"})
+    if end < start:
+        return None
+    return start, end
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def stream_response(request: Request, storage: Storage, db_file: models.File, size: int, headers: dict) -> Response:
+    """
+    Streams a file that is not on a local filesystem (e.g. in S3), supporting
+    a single byte range. Only the requested range is read from storage.
+    """
+    headers = dict(headers, **{"accept-ranges": "bytes", "content-disposition": content_disposition(db_file.filename)})
+    byte_range = None
+    # A partial response is only safe if the client's copy is the current version
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == headers["etag"]:
+        byte_range = parse_range(request.headers.get("range"), size)
+
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+    else:
+        start, end = 0, None
+        status_code = 200
+    headers["content-length"] = str((size if end is None else end + 1) - start)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type="application/octet-stream")
+    return StreamingResponse(
+        storage.iter_bytes(db_file.filepath, start, end),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/octet-stream",
+    )
+
+
+async def download_response(request: Request, db_file: models.File) -> Response:
+    """Builds the response for downloading db_file, honouring conditional and range headers."""
+    storage = get_storage()
+    try:
+        stat_result = await run_in_threadpool(storage.stat, db_file.filepath)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found on server")
+
+    etag = file_etag(db_file, stat_result)
+    headers = {"etag": etag, "cache-control": DOWNLOAD_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    local_path = storage.local_path(db_file.filepath)
+    if local_path is None:
+        return stream_response(request, storage, db_file, stat_result.st_size, headers)
+
+    # FileResponse keeps our ETag (it only sets its own as a default) and
+    # uses it to evaluate If-Range before serving a partial response.
+    return FileResponse(
+        local_path,
+        media_type="application/octet-stream",
+        filename=db_file.filename,
+        headers=headers,
+        stat_result=stat_result,
+    )
@@ -0,0 +1,190 @@
+"""
+In-memory log ring buffer shared by the backend's log endpoints.
+
+Log records are turned into plain dict entries (record_to_entry) and kept in
+a bounded LogBuffer; subscribers are notified of new entries on their own
+event loop. Workers send their entries to the backend over the LOG_EXCHANGE
+fanout exchange (see workers/log_shipper.py), so the buffer holds the logs of
+the whole system.
+
+configure_logging() moves console output off the logging threads: records
+are put on a queue and written by a QueueListener thread, so request handlers
+and scan threads never wait for stdout.
+
+This module is also copied into the worker image and must not import
+anything the worker does not have.
+"""
+import asyncio
+import logging
+import logging.handlers
+import os
+import queue
+import socket
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+# Fanout exchange workers publish batches of log entries to
+LOG_EXCHANGE = "logs"
+# Entries kept in memory per backend process
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "5000"))
+# Records below this level are not kept (or shipped by workers)
+LOG_BUFFER_LEVEL = os.getenv("LOG_BUFFER_LEVEL", "INFO").upper()
+# Entries waiting for a slow subscriber before newer ones are dropped
+LOG_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("LOG_SUBSCRIBER_QUEUE_SIZE", "1000"))
+
+CONSOLE_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+
+def record_to_entry(record: logging.LogRecord, source: str) -> dict:
+    """A log record as a JSON-serialisable entry. A file_id given in extra= is kept."""
+    file_id = getattr(record, "file_id", None)
+    entry = {
+        "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+        "level": record.levelname,
+        "levelno": record.levelno,
+        "logger": record.name,
+        "message": record.getMessage(),
+        "source": source,
+        "file_id": int(file_id) if file_id is not None else None,
+    }
+    if record.exc_info:
+        entry["message"] += "\n" + logging.Formatter().formatException(record.exc_info)
+    return entry
+
+
+def default_source(service: str) -> str:
+    return f"{service}@{socket.gethostname()}"
+
+
+class LogFilter:
+    """Which entries a reader wants: a minimum level, a logger (and its children) and a file id."""
+
+    def __init__(self, level: str = None, logger: str = None, file_id: int = None):
+        self.levelno = logging.getLevelName(level.upper()) if level else logging.NOTSET
+        if not isinstance(self.levelno, int):
+            raise ValueError(f"Unknown log level: {level}")
+        self.logger = logger
+        self.file_id = file_id
+
+    def matches(self, entry: dict) -> bool:
+        if entry["levelno"] < self.levelno:
+            return False
+        if self.logger and entry["logger"] != self.logger and not entry["logger"].startswith(self.logger + "."):
+            return False
+        if self.file_id is not None and entry.get("file_id") != self.file_id:
+            return False
+        return True
+
+
+class LogSubscription:
+    """New matching entries for one reader, delivered to an asyncio.Queue on the reader's loop."""
+
+    def __init__(self, log_filter: LogFilter, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.filter = log_filter
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._loop = loop
+
+    def _offer(self, entry: dict):
+        # Runs on the subscriber's loop
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def offer(self, entry: dict):
+        if self.filter.matches(entry):
+            self._loop.call_soon_threadsafe(self._offer, entry)
+
+
+class LogBuffer:
+    """
+    Bounded, thread-safe buffer of the most recent log entries.
+
+    Each entry gets an increasing sequence number ("seq") so readers can ask
+    for what they have not seen yet; the oldest entries are discarded once
+    the buffer is full.
+    """
+
+    def __init__(self, size: int = LOG_BUFFER_SIZE, subscriber_queue_size: int = LOG_SUBSCRIBER_QUEUE_SIZE):
+        self._entries = deque(maxlen=size)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._subscriber_queue_size = subscriber_queue_size
+
+    def add(self, entry: dict):
+        with self._lock:
+            self._seq += 1
+            entry = dict(entry, seq=self._seq)
+            self._entries.append(entry)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.offer(entry)
+            except RuntimeError:
+                # Its event loop has been closed
+                self.unsubscribe(subscription)
+
+    def query(self, log_filter: LogFilter, after: int = 0, limit: int = 200) -> list:
+        """The newest `limit` matching entries with seq > after, oldest first."""
+        with self._lock:
+            entries = list(self._entries)
+        matching = [e for e in entries if e["seq"] > after and log_filter.matches(e)]
+        return matching[-limit:] if limit else matching
+
+    def subscribe(self, log_filter: LogFilter) -> LogSubscription:
+        """Must be called from the event loop the subscription is read on."""
+        subscription = LogSubscription(log_filter, asyncio.get_running_loop(), self._subscriber_queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: LogSubscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+
+class RingBufferHandler(logging.Handler):
+    """Adds the records of this process to a LogBuffer."""
+
+    def __init__(self, buffer: LogBuffer, source: str, level=LOG_BUFFER_LEVEL):
+        super().__init__(level)
+        self.buffer = buffer
+        self.source = source
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.buffer.add(record_to_entry(record, self.source))
+        except Exception:
+            self.handleError(record)
+
+
+def configure_logging(*handlers: logging.Handler, level=logging.INFO, fmt: str = CONSOLE_FORMAT,
+                      record_filter: Optional[logging.Filter] = None) -> logging.handlers.QueueListener:
+    """
+    Routes the root logger through a queue to a console handler and the
+    given handlers, all run on one background thread. record_filter runs on
+    the logging thread before a record is queued. Returns the started
+    QueueListener; stop() it on shutdown to flush what is left.
+    """
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(fmt))
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, console, *handlers, respect_handler_level=True)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    queue_handler = logging.handlers.QueueHandler(records)
+    if record_filter:
+        queue_handler.addFilter(record_filter)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener.start()
+    return listener
+
+
+# The backend's buffer; entries from workers are added by main.listen_to_worker_logs
+log_buffer = LogBuffer()
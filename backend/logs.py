@@ -0,0 +1,100 @@
+"""
+Admin access to recent logs of the backend and the workers.
+
+    GET /logs/realtime?level=&logger=&file_id=&after=&limit=   -> {"logs": [entry]}
+    GET /logs/stream?level=&logger=&file_id=&after=            -> text/event-stream
+
+Both read the in-memory ring buffer (log_buffer.py). An entry is
+{"seq", "time", "level", "levelno", "logger", "message", "source", "file_id"}.
+`logger` also matches child loggers; `after` returns only entries with a
+higher seq. The stream first sends the matching entries still in the buffer,
+then new ones as they are logged; each event's id is the entry's seq, so a
+reconnecting EventSource resumes through Last-Event-ID. EventSource cannot
+send an Authorization header, so the stream also accepts the token as
+?access_token=.
+"""
+import asyncio
+import json
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from config_endpoints import get_current_user
+from log_buffer import LOG_BUFFER_SIZE, LogBuffer, LogFilter, log_buffer
+
+# Seconds between keep-alive comments on an idle stream
+LOG_STREAM_HEARTBEAT = float(os.getenv("LOG_STREAM_HEARTBEAT", "15"))
+
+router = APIRouter(prefix="/logs")
+
+
+def make_filter(level: Optional[str], logger: Optional[str], file_id: Optional[int]) -> LogFilter:
+    try:
+        return LogFilter(level=level, logger=logger, file_id=file_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def server_sent_event(entry: dict) -> str:
+    return f"id: {entry['seq']}\ndata: {json.dumps(entry)}\n\n"
+
+
+async def event_stream(buffer: LogBuffer, log_filter: LogFilter, after: int, is_disconnected, heartbeat: float = LOG_STREAM_HEARTBEAT):
+    """Buffered entries after `after`, then new ones until the client goes away."""
+    # Subscribe first so nothing logged while the backlog is sent is missed
+    subscription = buffer.subscribe(log_filter)
+    try:
+        last_seq = after
+        for entry in buffer.query(log_filter, after=after, limit=LOG_BUFFER_SIZE):
+            last_seq = entry["seq"]
+            yield server_sent_event(entry)
+        while not await is_disconnected():
+            try:
+                entry = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if entry["seq"] <= last_seq:
+                continue  # already sent with the backlog
+            if subscription.dropped:
+                yield f"event: dropped\ndata: {json.dumps({'dropped': subscription.dropped})}\n\n"
+                subscription.dropped = 0
+            last_seq = entry["seq"]
+            yield server_sent_event(entry)
+    finally:
+        buffer.unsubscribe(subscription)
+
+
+@router.get("/realtime")
+def get_recent_logs(
+    level: Optional[str] = None,
+    logger: Optional[str] = None,
+    file_id: Optional[int] = None,
+    after: int = Query(0, ge=0),
+    limit: int = Query(200, ge=1, le=LOG_BUFFER_SIZE),
+    user=Depends(get_current_user(role="admin")),
+):
+    return {"logs": log_buffer.query(make_filter(level, logger, file_id), after=after, limit=limit)}
+
+
+@router.get("/stream")
+async def stream_logs(
+    request: Request,
+    level: Optional[str] = None,
+    logger: Optional[str] = None,
+    file_id: Optional[int] = None,
+    after: int = Query(0, ge=0),
+    user=Depends(get_current_user(role="admin", query_token=True)),
+):
+    log_filter = make_filter(level, logger, file_id)
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        after = int(last_event_id)
+    return StreamingResponse(
+        event_stream(log_buffer, log_filter, after, request.is_disconnected),
+        media_type="text/event-stream",
+        # Proxies must pass events on as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,58 @@
+"""
+Prometheus metrics of the backend, served at GET /metrics.
+
+    cfiles_upload_write_seconds{kind}     streaming an upload to storage while hashing it
+                                          (single, resumable_chunk, resumable_assemble)
+    cfiles_publish_seconds{target}        publishing to RabbitMQ until the broker confirmed
+    cfiles_db_commit_seconds              committing a database session
+    cfiles_ws_flush_seconds               fanning a batch of status updates out to the client queues
+    cfiles_ws_send_seconds                sending one frame to one WebSocket client
+    cfiles_websocket_clients              connected status WebSocket clients
+
+Each worker serves its own scan metrics (queue lag, clamd scan time by file
+size, checksum time, errors, in-flight scans) on WORKER_METRICS_PORT; see
+workers/worker_metrics.py.
+"""
+import time
+
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Uploads of large files take minutes
+UPLOAD_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Frames and flushes are fast unless something is wrong
+FAN_OUT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10)
+
+UPLOAD_WRITE_SECONDS = Histogram("cfiles_upload_write_seconds", "Time to stream an upload to storage while hashing it", ["kind"], buckets=UPLOAD_BUCKETS)
+PUBLISH_SECONDS = Histogram("cfiles_publish_seconds", "Time to publish a message to RabbitMQ until the broker confirmed it", ["target"])
+DB_COMMIT_SECONDS = Histogram("cfiles_db_commit_seconds", "Time to commit a database session")
+WS_FLUSH_SECONDS = Histogram("cfiles_ws_flush_seconds", "Time to fan a batch of status updates out to the WebSocket client queues", buckets=FAN_OUT_BUCKETS)
+WS_SEND_SECONDS = Histogram("cfiles_ws_send_seconds", "Time to send one frame to a WebSocket client", buckets=FAN_OUT_BUCKETS)
+WEBSOCKET_CLIENTS = Gauge("cfiles_websocket_clients", "Connected status WebSocket clients")
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def _commit_started(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+def _commit_finished(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def instrument_commits():
+    """Times the commits of all sessions, sync and async (which commit through a sync Session)."""
+    if not event.contains(Session, "before_commit", _commit_started):
+        event.listen(Session, "before_commit", _commit_started)
+        event.listen(Session, "after_commit", _commit_finished)
+        event.listen(Session, "after_rollback", lambda session: session.info.pop("commit_started", None))
@@ -0,0 +1,40 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor encodes the sort key of the last row on a page, e.g.
+(upload_date, id). The next page is then fetched with a row-value comparison
+(`(upload_date, id) < (:date, :id)`) that an index on the same columns can
+answer directly, so deep pages cost the same as the first one.
+"""
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(*values) -> str:
+    """Encodes sort-key values (datetimes, ints, strings) into a URL-safe cursor."""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Decodes a cursor from encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def decode_datetime_cursor(cursor: str):
+    """Decodes a (datetime, id) cursor. Raises ValueError if it is malformed."""
+    values = decode_cursor(cursor)
+    if len(values) != 2:
+        raise ValueError("Invalid cursor")
+    try:
+        return datetime.fromisoformat(values[0]), int(values[1])
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
@@ -0,0 +1,386 @@
+"""
+Quarantined files: listing, release and deletion.
+
+    GET    /quarantine/files?limit=&cursor=     -> QuarantineOut (next cursor in X-Next-Cursor)
+    POST   /quarantine/files/{id}/release
+    DELETE /quarantine/files/{id}
+    POST   /quarantine/jobs                     -> QuarantineJobStatus (202)
+    GET    /quarantine/jobs/{id}                -> QuarantineJobStatus
+
+Releasing moves a file's content out of quarantine and marks it clean, and
+records who overrode the scanner's verdict (verdict_overridden_by/_at; a
+later rescan clears it). Quarantined content is shared like any other blob,
+so every file with the same content is released together with it. Deleting
+removes the files row; content nobody references any more is then removed by
+the blob garbage collector (files stored before blobs existed are deleted
+directly, once the row is gone).
+
+Bulk jobs are stored in quarantine_jobs and announced on the durable
+QUARANTINE_JOB_QUEUE, which every backend replica consumes. A job is
+processed QUARANTINE_JOB_BATCH_SIZE files per transaction, each under a lock
+on the job row that also records how far it has got (last_file_id), so a
+job whose replica died is picked up where it stopped by whichever replica
+gets the redelivered message. After QUARANTINE_JOB_BATCHES_PER_DELIVERY
+batches a job is requeued, so no delivery stays unacked for long. After each
+batch a {"type": "quarantine_job", ...} progress event goes through the
+status exchange to the WebSocket clients subscribed to the job
+(/ws/status?job_id=...); GET on the job returns the same numbers.
+"""
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+import config_endpoints
+from blob_store import blob_path
+from config_endpoints import get_current_user
+from database import models
+from database.async_database import AsyncSessionLocal, get_async_db
+from enums import ScanStatus
+from pagination import decode_datetime_cursor, encode_cursor
+from rabbitmq_publisher import QUARANTINE_JOB_QUEUE, STATUS_EXCHANGE, publisher
+from schemas import QuarantineJobCreate, QuarantineJobStatus, QuarantineOut
+from storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_JOB_BATCH_SIZE = int(os.getenv("QUARANTINE_JOB_BATCH_SIZE", "200"))
+QUARANTINE_JOB_BATCHES_PER_DELIVERY = int(os.getenv("QUARANTINE_JOB_BATCHES_PER_DELIVERY", "10"))
+QUARANTINE_JOB_EVENT = "quarantine_job"
+JOB_ACTIONS = ("release", "delete")
+FINAL_JOB_STATES = ("finished", "failed")
+
+router = APIRouter(prefix="/quarantine")
+
+
+def release_target(db_file: models.File) -> str:
+    """Where released content goes: back to its blob, or next to the other uploads for older files."""
+    if db_file.blob_sha256:
+        return blob_path(db_file.blob_sha256)
+    return os.path.join(config_endpoints.UPLOAD_DIR, f"{db_file.id}_{os.path.basename(db_file.filepath)}")
+
+
+def move_out_of_quarantine(quarantined_path: str, target: str):
+    storage = get_storage()
+    if quarantined_path == target:
+        # Never move onto itself: on S3 that is a copy followed by a delete of the only copy
+        return
+    if storage.exists(quarantined_path):
+        storage.move(quarantined_path, target)
+    elif not storage.exists(target):
+        raise FileNotFoundError(quarantined_path)
+    # Otherwise an earlier, interrupted release already moved it
+
+
+async def release_file(db: AsyncSession, db_file: models.File, username: Optional[str]):
+    """Releases db_file and every file sharing its quarantined content. The caller commits."""
+    # An earlier file of the same batch may have released this one with it
+    await db.refresh(db_file, ["filepath", "is_quarantined"])
+    if not db_file.is_quarantined:
+        return
+    quarantined_path = db_file.filepath
+    target = release_target(db_file)
+    await run_in_threadpool(move_out_of_quarantine, quarantined_path, target)
+    detection = f" (scanner found: {db_file.scan_details})" if db_file.scan_details else ""
+    await db.execute(
+        update(models.File)
+        .where(models.File.filepath == quarantined_path)
+        .values(
+            filepath=target,
+            is_quarantined=False,
+            scan_status=ScanStatus.CLEAN.value,
+            scan_details=f"Released from quarantine by {username or 'admin'}{detection}.",
+            verdict_overridden_by=username or "admin",
+            verdict_overridden_at=datetime.utcnow(),
+        )
+    )
+
+
+async def delete_file(db: AsyncSession, db_file: models.File) -> Optional[str]:
+    """
+    Deletes a quarantined file's row. The caller commits and then removes
+    the returned stored content, if any (blobs are left to the collector).
+    """
+    await db.delete(db_file)
+    return None if db_file.blob_sha256 else db_file.filepath
+
+
+async def remove_content(paths: list):
+    """Removes the content of deleted files, after their rows are gone for good."""
+    for path in paths:
+        try:
+            await run_in_threadpool(get_storage().delete, path)
+        except Exception as e:
+            # Nothing refers to it any more; it only takes up space
+            logger.warning(f"Could not remove the content of a deleted file at {path}: {e}")
+
+
+async def get_quarantined(db: AsyncSession, file_id: int) -> models.File:
+    db_file = await db.get(models.File, file_id)
+    if not db_file or not db_file.is_quarantined:
+        raise HTTPException(status_code=404, detail="Quarantined file not found")
+    return db_file
+
+
+@router.get("/files", response_model=QuarantineOut)
+async def list_quarantined_files(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user(role="admin")),
+):
+    """Quarantined files, newest first, with the same keyset pagination as /files/."""
+    query = select(models.File).where(models.File.is_quarantined)
+    if cursor:
+        try:
+            last_date, last_id = decode_datetime_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.where(tuple_(models.File.upload_date, models.File.id) < tuple_(last_date, last_id))
+    query = query.order_by(models.File.upload_date.desc(), models.File.id.desc()).limit(limit + 1)
+    files = (await db.execute(query)).scalars().all()
+    if len(files) > limit:
+        files = files[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(files[-1].upload_date, files[-1].id)
+    return {"quarantined_files": files}
+
+
+@router.post("/files/{file_id}/release")
+async def release_quarantined_file(file_id: int, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user(role="admin"))):
+    db_file = await get_quarantined(db, file_id)
+    try:
+        await release_file(db, db_file, user["username"] if user else None)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Quarantined file not found in storage")
+    await db.commit()
+    logger.info(f"File {file_id} released from quarantine.")
+    return {"message": "File released from quarantine"}
+
+
+@router.delete("/files/{file_id}")
+async def delete_quarantined_file(file_id: int, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user(role="admin"))):
+    db_file = await get_quarantined(db, file_id)
+    content = await delete_file(db, db_file)
+    await db.commit()
+    await remove_content([content] if content else [])
+    logger.info(f"Quarantined file {file_id} deleted.")
+    return {"message": "Quarantined file deleted"}
+
+
+@router.post("/jobs", response_model=QuarantineJobStatus, status_code=202)
+async def create_quarantine_job(
+    request: QuarantineJobCreate,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user(role="admin")),
+):
+    if request.action not in JOB_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"action must be one of {', '.join(JOB_ACTIONS)}")
+    if request.all == (request.file_ids is not None):
+        raise HTTPException(status_code=400, detail="Give either file_ids or all=true")
+
+    if request.all:
+        file_ids = None
+        total = (await db.execute(select(func.count()).select_from(models.File).where(models.File.is_quarantined))).scalar_one()
+    else:
+        file_ids = sorted(set(request.file_ids))
+        total = len(file_ids)
+    job = models.QuarantineJob(
+        id=uuid.uuid4().hex,
+        action=request.action,
+        file_ids=file_ids,
+        state="queued",
+        total=total,
+        processed=0,
+        failed=0,
+        created_by=user["username"] if user else None,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    try:
+        await publisher.publish(QUARANTINE_JOB_QUEUE, {"job_id": job.id})
+    except Exception as e:
+        job.state = "failed"
+        job.error = f"Could not queue the job: {e}"
+        job.finished_at = datetime.utcnow()
+        await db.commit()
+        raise HTTPException(status_code=500, detail=f"Could not publish message to RabbitMQ: {e}")
+    logger.info(f"Quarantine job {job.id} queued: {job.action} {total} files.")
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=QuarantineJobStatus)
+async def get_quarantine_job(job_id: str, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user(role="admin"))):
+    job = await db.get(models.QuarantineJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Quarantine job not found")
+    return job
+
+
+def progress_event(job: models.QuarantineJob) -> dict:
+    """The job's progress; taken while its attributes are loaded, i.e. right after a commit."""
+    return {
+        "type": QUARANTINE_JOB_EVENT,
+        "job_id": job.id,
+        "action": job.action,
+        "state": job.state,
+        "total": job.total,
+        "processed": job.processed,
+        "failed": job.failed,
+    }
+
+
+async def publish_progress(event: dict):
+    try:
+        await publisher.publish("", event, exchange=STATUS_EXCHANGE)
+    except Exception as e:
+        # Progress can still be polled
+        logger.warning(f"Could not publish progress of quarantine job {event['job_id']}: {e}")
+
+
+async def lock_job(db: AsyncSession, job_id: str) -> Optional[models.QuarantineJob]:
+    """Loads the job afresh and locks its row until the next commit or rollback."""
+    query = (
+        select(models.QuarantineJob)
+        .where(models.QuarantineJob.id == job_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return (await db.execute(query)).scalars().first()
+
+
+async def next_batch(db: AsyncSession, job: models.QuarantineJob, last_id: int):
+    """The next batch of the job's file ids after last_id, and the quarantined files among them."""
+    if job.file_ids is None:
+        query = (
+            select(models.File)
+            .where(models.File.is_quarantined, models.File.id > last_id)
+            .order_by(models.File.id)
+            .limit(QUARANTINE_JOB_BATCH_SIZE)
+        )
+        files = (await db.execute(query)).scalars().all()
+        return [f.id for f in files], files
+    ids = [file_id for file_id in job.file_ids if file_id > last_id][:QUARANTINE_JOB_BATCH_SIZE]
+    if not ids:
+        return [], []
+    query = select(models.File).where(models.File.id.in_(ids), models.File.is_quarantined).order_by(models.File.id)
+    return ids, (await db.execute(query)).scalars().all()
+
+
+async def process_batch(db: AsyncSession, job: models.QuarantineJob) -> list:
+    """
+    Processes the job's next batch and records it on the job, or finishes the
+    job if nothing is left. The caller commits and then removes the returned
+    content of deleted files.
+    """
+    ids, files = await next_batch(db, job, job.last_file_id)
+    if not ids:
+        job.state = "finished"
+        job.finished_at = datetime.utcnow()
+        return []
+    removed = []
+    failed = len(ids) - len(files)  # not found or no longer quarantined
+    for db_file in files:
+        try:
+            if job.action == "release":
+                await release_file(db, db_file, job.created_by)
+            else:
+                content = await delete_file(db, db_file)
+                if content:
+                    removed.append(content)
+        except FileNotFoundError:
+            logger.warning(f"Quarantine job {job.id}: content of file {db_file.id} is missing.")
+            failed += 1
+    job.last_file_id = ids[-1]
+    job.processed += len(ids)
+    job.failed += failed
+    return removed
+
+
+async def run_quarantine_job(job_id: str, max_batches: Optional[int] = None) -> bool:
+    """
+    Processes a quarantine job from where it stopped, one batch per
+    transaction, reporting progress after each. Returns False if it stopped
+    after max_batches with work left, True once the job is over.
+    """
+    async with AsyncSessionLocal() as db:
+        batches = 0
+        while True:
+            # Serialises runs of the same job (e.g. a redelivery while the first run is still going)
+            job = await lock_job(db, job_id)
+            if job is None or job.state in FINAL_JOB_STATES:
+                await db.commit()
+                return True
+            if job.state == "queued":
+                job.state = "running"
+                await db.commit()
+                await publish_progress(progress_event(job))
+                continue
+            if max_batches is not None and batches >= max_batches:
+                await db.commit()
+                return False
+            try:
+                removed = await process_batch(db, job)
+                await db.commit()
+            except Exception as e:
+                logger.error(f"Quarantine job {job_id} failed: {e}", exc_info=True)
+                await db.rollback()
+                # The rollback expired the job; load it again before recording the failure
+                job = await lock_job(db, job_id)
+                job.state = "failed"
+                job.error = str(e)
+                job.finished_at = datetime.utcnow()
+                await db.commit()
+                removed = []
+            event = progress_event(job)
+            await remove_content(removed)
+            await publish_progress(event)
+            batches += 1
+            if event["state"] in FINAL_JOB_STATES:
+                logger.info(f"Quarantine job {job_id} {event['state']}: {event['processed']}/{event['total']} processed, {event['failed']} failed.")
+                return True
+
+
+async def continue_quarantine_job(job_id: str):
+    """Runs a delivered job for a while and requeues it if it is not done yet."""
+    if not await run_quarantine_job(job_id, max_batches=QUARANTINE_JOB_BATCHES_PER_DELIVERY):
+        await publisher.publish(QUARANTINE_JOB_QUEUE, {"job_id": job_id})
+
+
+async def consume_quarantine_jobs(connection):
+    """
+    Runs the jobs delivered on QUARANTINE_JOB_QUEUE, one at a time. A delivery
+    is acked once its part of the job is committed (and the rest requeued);
+    if this process dies first, RabbitMQ hands it to another replica.
+    """
+    channel = await connection.channel()
+    try:
+        await channel.set_qos(prefetch_count=1)
+        queue = await channel.declare_queue(QUARANTINE_JOB_QUEUE, durable=True)
+        async with queue.iterator() as queue_iter:
+            async for message in queue_iter:
+                try:
+                    job_id = json.loads(message.body)["job_id"]
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Ignoring malformed quarantine job message: {e}")
+                    await message.ack()
+                    continue
+                try:
+                    await continue_quarantine_job(job_id)
+                except Exception as e:
+                    # E.g. the database is unavailable; the job is tried again later
+                    logger.error(f"Quarantine job {job_id} could not run: {e}")
+                    await message.nack(requeue=True)
+                    raise
+                await message.ack()
+    finally:
+        if not channel.is_closed:
+            await channel.close()
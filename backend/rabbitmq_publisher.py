@@ -0,0 +1,107 @@
+"""
+Shared, long-lived RabbitMQ publisher for the backend.
+
+One robust aio_pika connection is opened at startup and kept for the lifetime
+of the process. Messages are published over a pool of channels with publisher
+confirms enabled, so an upload only waits for the broker ack instead of a full
+TCP+AMQP handshake. aio_pika's robust connection reconnects (and restores its
+channels) on its own if the broker goes away.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+import aio_pika
+from aio_pika.pool import Pool
+
+from metrics import PUBLISH_SECONDS
+from scan_queues import SCAN_QUEUES
+
+logger = logging.getLogger(__name__)
+
+RABBITMQ_CHANNEL_POOL_SIZE = int(os.getenv("RABBITMQ_CHANNEL_POOL_SIZE", "10"))
+RABBITMQ_PUBLISH_TIMEOUT = float(os.getenv("RABBITMQ_PUBLISH_TIMEOUT", "10"))
+
+# Fanout exchange for status updates; every backend replica binds its own queue to it
+STATUS_EXCHANGE = "status_updates"
+# Bulk quarantine jobs; consumed by the backend replicas themselves (see quarantine.py)
+QUARANTINE_JOB_QUEUE = "quarantine_jobs"
+
+# Queues the backend publishes to; declared once when the publisher starts.
+PUBLISH_QUEUES = SCAN_QUEUES + [QUARANTINE_JOB_QUEUE]
+
+
+def get_amqp_url() -> str:
+    """Builds the AMQP URL from the same environment variables as the worker."""
+    rabbitmq_user = os.getenv("RABBITMQ_DEFAULT_USER", "guest")
+    rabbitmq_pass = os.getenv("RABBITMQ_DEFAULT_PASS", "guest")
+    rabbitmq_host = os.getenv("RABBITMQ_HOST", "rabbitmq")
+    return f"amqp://{rabbitmq_user}:{rabbitmq_pass}@{rabbitmq_host}/"
+
+
+class RabbitMQPublisher:
+    def __init__(self, amqp_url: str = None, pool_size: int = RABBITMQ_CHANNEL_POOL_SIZE):
+        self.amqp_url = amqp_url
+        self.pool_size = pool_size
+        self._connection = None
+        self._channel_pool = None
+        self._lock = None
+
+    async def start(self):
+        """Opens the shared connection and channel pool. Safe to call repeatedly."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._connection is not None and not self._connection.is_closed:
+                return
+            self._connection = await aio_pika.connect_robust(self.amqp_url or get_amqp_url())
+            self._channel_pool = Pool(self._open_channel, max_size=self.pool_size)
+            async with self._channel_pool.acquire() as channel:
+                for queue_name in PUBLISH_QUEUES:
+                    await channel.declare_queue(queue_name, durable=True)
+            logger.info(f"RabbitMQ publisher connected with a pool of {self.pool_size} channels.")
+
+    async def _open_channel(self):
+        return await self._connection.channel(publisher_confirms=True)
+
+    async def get_connection(self):
+        """Returns the shared robust connection, connecting first if needed."""
+        await self.start()
+        return self._connection
+
+    async def publish(self, routing_key: str, message: dict, exchange: str = "", headers: dict = None):
+        """
+        Publishes a persistent JSON message and waits for the broker confirm.
+        Raises if the broker cannot be reached or does not confirm in time.
+        """
+        await self.start()
+        body = aio_pika.Message(
+            body=json.dumps(message).encode(),
+            content_type="application/json",
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            headers=headers,
+        )
+        started = time.perf_counter()
+        async with self._channel_pool.acquire() as channel:
+            if channel.is_closed:
+                await channel.reopen()
+            if exchange:
+                target = await channel.get_exchange(exchange, ensure=False)
+            else:
+                target = channel.default_exchange
+            await target.publish(body, routing_key=routing_key, timeout=RABBITMQ_PUBLISH_TIMEOUT)
+        PUBLISH_SECONDS.labels(exchange or routing_key).observe(time.perf_counter() - started)
+
+    async def close(self):
+        if self._channel_pool is not None:
+            await self._channel_pool.close()
+            self._channel_pool = None
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+        logger.info("RabbitMQ publisher closed.")
+
+
+publisher = RabbitMQPublisher()
@@ -0,0 +1,266 @@
+"""
+Resumable chunked uploads.
+
+A client opens an upload session, PUTs the file in fixed-size chunks (in any
+order, retrying any that fail) and finally completes the session. Each chunk
+is stored as its own part (in the configured storage, so any backend replica
+can take the next chunk) and its SHA-256 is recorded, so a retried chunk with
+the same checksum is acknowledged without being stored again and GET on the
+session tells a resuming client which chunks are still missing.
+On completion the parts are concatenated into a staging file in a single
+streaming pass, and the result is stored, registered and queued for scanning
+exactly like a regular upload.
+
+    POST   /uploads/sessions                       -> UploadSessionStatus
+    PUT    /uploads/sessions/{id}/chunks/{index}   (raw body, optional X-Chunk-SHA256)
+    GET    /uploads/sessions/{id}                  -> UploadSessionStatus
+    POST   /uploads/sessions/{id}/complete         -> FileUploadResponse
+    DELETE /uploads/sessions/{id}
+"""
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+import config_endpoints
+from blob_store import discard_staged, staging_path, store_blob
+from config_endpoints import get_current_user, queue_for_scan, register_upload, require_not_maintenance_mode
+from database import models
+from database.async_database import get_async_db
+from storage import get_storage
+from schemas import FileUploadResponse, UploadChunkReceipt, UploadSessionCreate, UploadSessionStatus
+from upload_stream import UploadTooLargeError, concat_and_hash, save_stream
+from metrics import UPLOAD_WRITE_SECONDS
+from opentelemetry.trace import SpanKind
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("UPLOAD_SESSION_CHUNK_SIZE", str(8 * 1024 * 1024)))
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 256 * 1024 * 1024
+# Sessions that have not been completed within this time are removed with their chunks
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+
+router = APIRouter(prefix="/uploads/sessions")
+
+
+def session_dir(session_id: str) -> str:
+    return os.path.join(config_endpoints.UPLOAD_DIR, ".sessions", session_id)
+
+
+def chunk_path(session_id: str, chunk_index: int) -> str:
+    return os.path.join(session_dir(session_id), f"{chunk_index:06d}.part")
+
+
+def total_chunks(upload: models.UploadSession) -> int:
+    return max(1, -(-upload.total_size // upload.chunk_size))
+
+
+def expected_chunk_size(upload: models.UploadSession, chunk_index: int) -> int:
+    if chunk_index < total_chunks(upload) - 1:
+        return upload.chunk_size
+    return upload.total_size - upload.chunk_size * (total_chunks(upload) - 1)
+
+
+async def session_status(db: AsyncSession, upload: models.UploadSession) -> dict:
+    result = await db.execute(
+        select(models.UploadChunk.chunk_index)
+        .where(models.UploadChunk.session_id == upload.id)
+        .order_by(models.UploadChunk.chunk_index)
+    )
+    received = list(result.scalars().all())
+    return {
+        "session_id": upload.id,
+        "filename": upload.filename,
+        "total_size": upload.total_size,
+        "chunk_size": upload.chunk_size,
+        "total_chunks": total_chunks(upload),
+        "received_chunks": received,
+        "file_id": upload.file_id,
+    }
+
+
+async def get_session(db: AsyncSession, session_id: str, user, for_update: bool = False) -> models.UploadSession:
+    query = select(models.UploadSession).where(models.UploadSession.id == session_id)
+    if for_update:
+        query = query.with_for_update()
+    upload = (await db.execute(query)).scalars().first()
+    # Another user's session is reported as missing rather than forbidden
+    if not upload or (upload.owner and user and upload.owner != user["username"]):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return upload
+
+
+async def delete_session(db: AsyncSession, upload: models.UploadSession):
+    """Deletes a session, its chunk rows and its part files. The caller commits."""
+    await db.execute(delete(models.UploadChunk).where(models.UploadChunk.session_id == upload.id))
+    await db.delete(upload)
+    await run_in_threadpool(get_storage().delete_prefix, session_dir(upload.id))
+
+
+async def purge_expired_sessions(db: AsyncSession, limit: int = 10):
+    """Removes a few abandoned sessions and their chunk files."""
+    cutoff = datetime.utcnow() - timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    result = await db.execute(
+        select(models.UploadSession)
+        .where(models.UploadSession.created_at < cutoff)
+        .limit(limit)
+    )
+    expired = result.scalars().all()
+    for upload in expired:
+        logger.info(f"Removing expired upload session {upload.id} ({upload.filename})")
+        await delete_session(db, upload)
+    if expired:
+        await db.commit()
+
+
+@router.post("", response_model=UploadSessionStatus)
+@require_not_maintenance_mode
+async def create_upload_session(request: UploadSessionCreate, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user())):
+    filename = os.path.basename(request.filename)
+    if not filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if request.total_size < 0:
+        raise HTTPException(status_code=400, detail="total_size must not be negative")
+    chunk_size = request.chunk_size or DEFAULT_CHUNK_SIZE
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=400, detail=f"chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE}")
+
+    await purge_expired_sessions(db)
+
+    upload = models.UploadSession(
+        id=uuid.uuid4().hex,
+        filename=filename,
+        total_size=request.total_size,
+        chunk_size=chunk_size,
+        checksum=request.checksum.lower() if request.checksum else None,
+        owner=user["username"] if user else None,
+    )
+    db.add(upload)
+    await db.commit()
+    logger.info(f"Upload session {upload.id} opened for {filename} ({upload.total_size} bytes, {total_chunks(upload)} chunks)")
+    return await session_status(db, upload)
+
+
+@router.get("/{session_id}", response_model=UploadSessionStatus)
+async def get_upload_session(session_id: str, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user())):
+    return await session_status(db, await get_session(db, session_id, user))
+
+
+@router.put("/{session_id}/chunks/{chunk_index}", response_model=UploadChunkReceipt)
+async def put_upload_chunk(
+    session_id: str,
+    chunk_index: int,
+    request: Request,
+    x_chunk_sha256: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user()),
+):
+    upload = await get_session(db, session_id, user)
+    if upload.file_id is not None:
+        raise HTTPException(status_code=409, detail="Upload session is already completed")
+    if not 0 <= chunk_index < total_chunks(upload):
+        raise HTTPException(status_code=400, detail=f"chunk_index must be between 0 and {total_chunks(upload) - 1}")
+    expected_checksum = x_chunk_sha256.lower() if x_chunk_sha256 else None
+
+    existing = await db.get(models.UploadChunk, (session_id, chunk_index))
+    if existing and expected_checksum == existing.checksum:
+        # Retry of a chunk we already have; no need to store it again
+        return {"chunk_index": chunk_index, "size": existing.size, "checksum": existing.checksum}
+
+    expected_size = expected_chunk_size(upload, chunk_index)
+    staged = staging_path()
+    try:
+        with UPLOAD_WRITE_SECONDS.labels("resumable_chunk").time():
+            size, checksum = await save_stream(request.stream(), staged, max_size=expected_size)
+        if size != expected_size:
+            raise HTTPException(status_code=400, detail=f"Chunk {chunk_index} must be {expected_size} bytes, got {size}")
+        if expected_checksum and checksum != expected_checksum:
+            raise HTTPException(status_code=400, detail=f"Checksum mismatch for chunk {chunk_index}")
+        await run_in_threadpool(get_storage().put_file, staged, chunk_path(session_id, chunk_index))
+    except UploadTooLargeError:
+        raise HTTPException(status_code=400, detail=f"Chunk {chunk_index} must be {expected_size} bytes")
+    finally:
+        await run_in_threadpool(discard_staged, staged)
+
+    chunk = existing or models.UploadChunk(session_id=session_id, chunk_index=chunk_index)
+    chunk.size = size
+    chunk.checksum = checksum
+    chunk.received_at = datetime.utcnow()
+    if not existing:
+        db.add(chunk)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent retry of the same chunk got there first; the part file is identical in size
+        await db.rollback()
+        await db.execute(
+            update(models.UploadChunk)
+            .where(models.UploadChunk.session_id == session_id, models.UploadChunk.chunk_index == chunk_index)
+            .values(size=size, checksum=checksum)
+        )
+        await db.commit()
+    return {"chunk_index": chunk_index, "size": size, "checksum": checksum}
+
+
+@router.post("/{session_id}/complete", response_model=FileUploadResponse)
+@require_not_maintenance_mode
+@traced("upload complete", kind=SpanKind.SERVER)
+async def complete_upload_session(session_id: str, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user())):
+    # Row lock: a concurrent complete waits here and then sees file_id set
+    upload = await get_session(db, session_id, user, for_update=True)
+    if upload.file_id is not None:
+        await db.commit()
+        return {"filename": upload.filename, "id": upload.file_id, "status": "PENDING"}
+
+    status = await session_status(db, upload)
+    missing = sorted(set(range(status["total_chunks"])) - set(status["received_chunks"]))
+    if missing and upload.total_size > 0:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail={"message": "Upload is incomplete", "missing_chunks": missing})
+
+    staged = staging_path()
+    parts = [chunk_path(session_id, index) for index in status["received_chunks"]]
+    try:
+        with UPLOAD_WRITE_SECONDS.labels("resumable_assemble").time():
+            file_size, checksum = await run_in_threadpool(concat_and_hash, parts, staged, opener=get_storage().open)
+    except Exception as e:
+        await db.rollback()
+        await run_in_threadpool(discard_staged, staged)
+        raise HTTPException(status_code=500, detail=f"Could not assemble file: {e}")
+
+    if file_size != upload.total_size or (upload.checksum and checksum != upload.checksum):
+        await run_in_threadpool(discard_staged, staged)
+        await db.rollback()
+        raise HTTPException(status_code=422, detail="Assembled file does not match the announced size or checksum")
+
+    try:
+        file_path = await store_blob(db, staged, checksum, file_size)
+    except Exception:
+        await db.rollback()
+        await run_in_threadpool(discard_staged, staged)
+        raise
+    db_file = await register_upload(db, upload.filename, file_path, file_size, checksum, user)
+    upload.file_id = db_file.id
+    await db.execute(delete(models.UploadChunk).where(models.UploadChunk.session_id == session_id))
+    await db.commit()
+    await run_in_threadpool(get_storage().delete_prefix, session_dir(session_id))
+    await queue_for_scan(db, db_file)
+    logger.info(f"Upload session {session_id} assembled into {file_path} ({file_size} bytes)")
+    return {"filename": upload.filename, "id": db_file.id, "status": "PENDING"}
+
+
+@router.delete("/{session_id}")
+async def abort_upload_session(session_id: str, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user())):
+    upload = await get_session(db, session_id, user)
+    await delete_session(db, upload)
+    await db.commit()
+    return {"message": "Upload session aborted"}
@@ -0,0 +1,78 @@
+"""
+Scan queues by priority and size class.
+
+Files are queued for scanning on one of three queues so a bulk import of
+large archives cannot hold up small interactive uploads:
+
+- file_queue.priority: rescans requested by an admin
+- file_queue: files up to SCAN_SMALL_FILE_MAX_BYTES (the original queue, so
+  messages queued before the split are still consumed)
+- file_queue.large: everything bigger
+
+Workers consume all three and hand the deliveries to their scan threads by
+weighted round-robin (SCAN_WEIGHT_*), with a cap on how many threads large
+files may occupy at once.
+
+A scan that fails for a transient reason (clamd or the database unavailable,
+maintenance mode) is not requeued straight away. It is republished to a retry
+queue whose TTL dead-letters it back to its original queue after a delay that
+grows with each attempt (SCAN_RETRY_DELAYS). The number of attempts is kept in
+the x-scan-attempts header, and after SCAN_MAX_ATTEMPTS (or on an unexpected
+error) the message goes to file_queue.dead, where admins can inspect and
+replay it. Shared by the backend and the workers.
+"""
+import os
+from typing import Optional
+
+PRIORITY_QUEUE = "file_queue.priority"
+SMALL_QUEUE = "file_queue"
+LARGE_QUEUE = "file_queue.large"
+SCAN_QUEUES = [PRIORITY_QUEUE, SMALL_QUEUE, LARGE_QUEUE]
+
+SCAN_SMALL_FILE_MAX_BYTES = int(os.getenv("SCAN_SMALL_FILE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+SCAN_QUEUE_WEIGHTS = {
+    PRIORITY_QUEUE: int(os.getenv("SCAN_WEIGHT_PRIORITY", "8")),
+    SMALL_QUEUE: int(os.getenv("SCAN_WEIGHT_SMALL", "4")),
+    LARGE_QUEUE: int(os.getenv("SCAN_WEIGHT_LARGE", "1")),
+}
+
+
+def scan_queue_for(filesize: int, priority: bool = False) -> str:
+    """The queue a file of this size should be scanned from."""
+    if priority:
+        return PRIORITY_QUEUE
+    if filesize is not None and filesize > SCAN_SMALL_FILE_MAX_BYTES:
+        return LARGE_QUEUE
+    return SMALL_QUEUE
+
+
+# Delays in seconds before the 1st, 2nd, ... retry; the last one repeats
+SCAN_RETRY_DELAYS = [int(d) for d in os.getenv("SCAN_RETRY_DELAYS", "5,30,120,600").split(",") if d.strip()]
+SCAN_MAX_ATTEMPTS = int(os.getenv("SCAN_MAX_ATTEMPTS", "8"))
+DEAD_LETTER_QUEUE = "file_queue.dead"
+
+ATTEMPTS_HEADER = "x-scan-attempts"
+ORIGINAL_QUEUE_HEADER = "x-original-queue"
+LAST_ERROR_HEADER = "x-last-error"
+DEAD_LETTERED_AT_HEADER = "x-dead-lettered-at"
+
+
+def retry_exchange(delay: int) -> str:
+    """
+    Fanout exchange (and bound queue of the same name) holding messages for
+    delay seconds. Messages keep their routing key, which is the scan queue
+    they are dead-lettered back to through the default exchange.
+    """
+    return f"file_queue.retry.{delay}s"
+
+
+def retry_queue_arguments(delay: int) -> dict:
+    return {"x-message-ttl": delay * 1000, "x-dead-letter-exchange": ""}
+
+
+def retry_delay(attempts: int) -> Optional[int]:
+    """Delay before retrying a message that has failed `attempts` times, or None to dead-letter it."""
+    if attempts >= SCAN_MAX_ATTEMPTS or not SCAN_RETRY_DELAYS:
+        return None
+    return SCAN_RETRY_DELAYS[min(max(attempts, 1), len(SCAN_RETRY_DELAYS)) - 1]
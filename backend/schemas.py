@@ -1,6 +1,6 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Dict
+from datetime import date, datetime
 from enums import ScanStatus
 
 class FileBase(BaseModel):
@@ -19,6 +19,8 @@ class File(FileBase):
     scan_details: Optional[str] = None
     is_quarantined: bool
     checksum: Optional[str] = None
+    verdict_overridden_by: Optional[str] = None  # Admin som släppt filen ur karantän
+    verdict_overridden_at: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -52,3 +54,68 @@ class SystemSetting(SystemSettingBase):
 
 class SystemSettingUpdate(SystemSettingBase):
     pass
+
+class DailyFileStats(BaseModel):
+    day: date
+    counts: Dict[str, int]
+
+class FileStats(BaseModel):
+    total: int
+    by_status: Dict[str, int]
+    by_owner: Dict[str, Dict[str, int]]
+    by_day: List[DailyFileStats]
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    total_size: int
+    chunk_size: Optional[int] = None
+    checksum: Optional[str] = None  # SHA-256 of the whole file, verified on completion
+
+class UploadSessionStatus(BaseModel):
+    session_id: str
+    filename: str
+    total_size: int
+    chunk_size: int
+    total_chunks: int
+    received_chunks: List[int]
+    file_id: Optional[int] = None
+
+class UploadChunkReceipt(BaseModel):
+    chunk_index: int
+    size: int
+    checksum: str
+
+class DeadLetter(BaseModel):
+    file_id: Optional[int] = None
+    file_path: Optional[str] = None
+    original_queue: Optional[str] = None
+    attempts: int = 0
+    last_error: Optional[str] = None
+    dead_lettered_at: Optional[str] = None
+
+class DeadLetterReplay(BaseModel):
+    file_ids: Optional[List[int]] = None  # None replays every dead letter, up to limit
+    limit: int = 100  # only used without file_ids
+
+class DeadLetterReplayResult(BaseModel):
+    replayed: int
+    file_ids: List[int]
+
+class QuarantineJobCreate(BaseModel):
+    action: str  # "release" or "delete"
+    file_ids: Optional[List[int]] = None
+    all: bool = False  # every quarantined file instead of file_ids
+
+class QuarantineJobStatus(BaseModel):
+    id: str
+    action: str
+    state: str
+    total: int
+    processed: int
+    failed: int
+    error: Optional[str] = None
+    created_by: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,239 @@
+"""
+Where uploaded and quarantined files are kept.
+
+Files are addressed by the same path-like keys that files.filepath stores
+(e.g. /uploads/blobs/9f/86/9f86d0...). STORAGE_BACKEND selects how keys map
+to actual storage:
+
+- "local" (default): files under STORAGE_LOCAL_ROOT on a filesystem that the
+  backend, the workers and (in clamd "scan" mode) clamd share.
+- "s3": objects in S3_BUCKET of an S3-compatible service (AWS, MinIO, ...),
+  keyed without the leading slash. Large files are uploaded with multipart
+  uploads and quarantining is a server-side copy, so no node needs a shared
+  volume and storage scales independently of the API and scan nodes.
+
+Uploads are still streamed to a local staging file first (they are hashed
+while they are written) and then handed over with put_file(). Reads are
+streamed in chunks, optionally limited to a byte range. The interface is
+synchronous; async callers run it in the threadpool.
+"""
+import logging
+import os
+import shutil
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+STORAGE_LOCAL_ROOT = os.getenv("STORAGE_LOCAL_ROOT", "/")
+S3_BUCKET = os.getenv("S3_BUCKET", "cfiles")
+# Set for MinIO and other S3-compatible services, e.g. http://minio:9000
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_REGION = os.getenv("S3_REGION")
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(16 * 1024 * 1024)))
+S3_MULTIPART_CHUNK_SIZE = int(os.getenv("S3_MULTIPART_CHUNK_SIZE", str(16 * 1024 * 1024)))
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+# The subset of os.stat_result that callers use, for objects that are not files
+ObjectStat = namedtuple("ObjectStat", ["st_size", "st_mtime"])
+
+
+class Storage(ABC):
+    """A storage backend. Subclasses implement every abstract method."""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of the stored file, or None if it is not on a local filesystem."""
+        return None
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def stat(self, key: str):
+        """Size and modification time (st_size, st_mtime). Raises FileNotFoundError."""
+
+    @abstractmethod
+    def open(self, key: str):
+        """Opens the stored file for streaming reads. Raises FileNotFoundError."""
+
+    @abstractmethod
+    def iter_bytes(self, key: str, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yields the bytes start..end (inclusive; end=None reads to the end) in chunks."""
+
+    @abstractmethod
+    def put_file(self, local_path: str, key: str):
+        """Stores a local file under key, replacing any existing one. The local file is consumed."""
+
+    @abstractmethod
+    def move(self, src_key: str, dst_key: str):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Deletes a stored file; deleting a missing one is not an error."""
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str):
+        """Deletes everything stored under a directory-like prefix."""
+
+
+class LocalStorage(Storage):
+    def __init__(self, root: str = STORAGE_LOCAL_ROOT):
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, key.lstrip("/"))
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    def stat(self, key: str) -> os.stat_result:
+        return os.stat(self.local_path(key))
+
+    def open(self, key: str):
+        return open(self.local_path(key), "rb")
+
+    def iter_bytes(self, key, start=0, end=None, chunk_size=READ_CHUNK_SIZE):
+        with self.open(key) as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def put_file(self, local_path: str, key: str):
+        self._move_path(local_path, self.local_path(key))
+
+    def move(self, src_key: str, dst_key: str):
+        self._move_path(self.local_path(src_key), self.local_path(dst_key))
+
+    @staticmethod
+    def _move_path(src: str, dst: str):
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        # A rename on the same filesystem, a copy otherwise (e.g. staging on another volume)
+        shutil.move(src, dst)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix: str):
+        shutil.rmtree(self.local_path(prefix), ignore_errors=True)
+
+
+class S3Storage(Storage):
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: str = S3_ENDPOINT_URL,
+                 region: str = S3_REGION, client=None):
+        # boto3 is only needed when S3 storage is configured
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.exceptions import ClientError
+
+        self.bucket = bucket
+        self.client = client or boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+        )
+        self._client_error = ClientError
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return key.lstrip("/")
+
+    def _is_missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.stat(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def stat(self, key: str) -> ObjectStat:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key)
+            raise
+        return ObjectStat(st_size=head["ContentLength"], st_mtime=head["LastModified"].timestamp())
+
+    def _get(self, key: str, **kwargs):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key), **kwargs)["Body"]
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key)
+            raise
+
+    def open(self, key: str):
+        return self._get(key)
+
+    def iter_bytes(self, key, start=0, end=None, chunk_size=READ_CHUNK_SIZE):
+        if start or end is not None:
+            body = self._get(key, Range=f"bytes={start}-{'' if end is None else end}")
+        else:
+            body = self._get(key)
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def put_file(self, local_path: str, key: str):
+        # upload_file switches to a multipart upload above the threshold
+        self.client.upload_file(local_path, self.bucket, self._key(key), Config=self.transfer_config)
+        os.remove(local_path)
+
+    def move(self, src_key: str, dst_key: str):
+        # Server-side copy (multipart for large objects); the data never passes through this node
+        self.client.copy(
+            {"Bucket": self.bucket, "Key": self._key(src_key)},
+            self.bucket,
+            self._key(dst_key),
+            Config=self.transfer_config,
+        )
+        self.delete(src_key)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_prefix(self, prefix: str):
+        prefix = self._key(prefix).rstrip("/") + "/"
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True})
+
+
+def create_storage() -> Storage:
+    if STORAGE_BACKEND == "s3":
+        logger.info(f"Using S3 storage in bucket {S3_BUCKET} ({S3_ENDPOINT_URL or 'AWS'})")
+        return S3Storage()
+    if STORAGE_BACKEND != "local":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return LocalStorage()
+
+
+_storage = None
+
+
+def get_storage() -> Storage:
+    """The configured storage, created on first use."""
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
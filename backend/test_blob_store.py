@@ -0,0 +1,96 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import blob_store
+import config_endpoints
+from database import models
+from database.async_database import get_async_db
+
+
+@pytest.fixture
+def setup(monkeypatch, tmp_path):
+    db_path = tmp_path / "blobs.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    for model in (models.Blob, models.File):
+        model.__table__.create(bind=engine)
+    TestingSession = sessionmaker(bind=engine)
+
+    AsyncTestingSession = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSession() as session:
+            yield session
+
+    async def not_in_maintenance():
+        return False
+
+    async def fake_publish(routing_key, message, exchange="", headers=None):
+        pass
+
+    monkeypatch.setattr(blob_store, "BLOB_ROOT", str(tmp_path / "blobs"))
+    monkeypatch.setattr(blob_store, "QUARANTINE_BLOB_ROOT", str(tmp_path / "quarantine"))
+    monkeypatch.setattr(blob_store, "STAGING_DIR", str(tmp_path / "staging"))
+    monkeypatch.setattr(config_endpoints, "is_maintenance_mode_active", not_in_maintenance)
+    monkeypatch.setattr(config_endpoints, "get_sso_rbac_config", lambda: {"enabled": False})
+    monkeypatch.setattr(config_endpoints.publisher, "publish", fake_publish)
+    app = FastAPI()
+    app.include_router(config_endpoints.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    return TestClient(app), TestingSession, tmp_path
+
+
+def upload(client, filename, data):
+    response = client.post("/upload/", files={"file": (filename, data)})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_identical_content_is_stored_once(setup):
+    client, TestingSession, tmp_path = setup
+    first = upload(client, "a.txt", b"same content")
+    second = upload(client, "b.txt", b"same content")
+    other = upload(client, "a.txt", b"other content")
+
+    db = TestingSession()
+    files = {f.id: f for f in db.query(models.File).all()}
+    assert files[first].filepath == files[second].filepath == blob_store.blob_path(hashlib.sha256(b"same content").hexdigest())
+    assert files[first].blob_sha256 == files[second].blob_sha256
+    # Same filename, different content: both uploads are kept
+    assert files[other].filepath != files[first].filepath
+    assert open(files[other].filepath, "rb").read() == b"other content"
+    assert db.query(models.Blob).count() == 2
+    db.close()
+
+    stored = [name for _, _, names in os.walk(tmp_path / "blobs") for name in names]
+    assert len(stored) == 2
+    assert os.listdir(tmp_path / "staging") == []
+
+
+def test_garbage_collection_removes_only_old_unreferenced_blobs(setup):
+    client, TestingSession, _ = setup
+    upload(client, "keep.txt", b"keep")
+    upload(client, "drop.txt", b"drop")
+    keep, drop = (hashlib.sha256(data).hexdigest() for data in (b"keep", b"drop"))
+
+    db = TestingSession()
+    long_ago = datetime.utcnow() - timedelta(days=1)
+    # SQLite has no refcount trigger; set the counts as Postgres would have
+    db.get(models.Blob, keep).refcount = 1
+    db.get(models.Blob, keep).last_used_at = long_ago
+    db.get(models.Blob, drop).last_used_at = long_ago
+    db.commit()
+
+    assert blob_store.collect_garbage(db, grace_seconds=3600) == 1
+    assert db.get(models.Blob, drop) is None
+    assert db.get(models.Blob, keep) is not None
+    assert not os.path.exists(blob_store.blob_path(drop))
+    assert os.path.exists(blob_store.blob_path(keep))
+    db.close()
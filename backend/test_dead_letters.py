@@ -0,0 +1,179 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import config_endpoints
+import dead_letters
+from database import models
+from database.async_database import get_async_db
+from scan_queues import DEAD_LETTER_QUEUE, LARGE_QUEUE, SMALL_QUEUE
+
+
+class FakeMessage:
+    def __init__(self, broker, body, headers):
+        self.broker = broker
+        self.body = body
+        self.headers = headers
+        self.content_type = "application/json"
+
+    async def ack(self):
+        self.broker.acked.append(self)
+
+
+class FakeQueue:
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def get(self, no_ack=False, fail=True):
+        messages = self.broker.queues[DEAD_LETTER_QUEUE]
+        if not messages:
+            return None
+        message = messages.pop(0)
+        self.broker.unacked.append(message)
+        return message
+
+
+class FakeExchange:
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def publish(self, message, routing_key, mandatory=False, timeout=None):
+        if routing_key in self.broker.unroutable:
+            raise RuntimeError(f"Message returned: no queue {routing_key}")
+        self.broker.queues.setdefault(routing_key, []).append(message)
+
+
+class FakeChannel:
+    """Returns unacked messages to the front of the queue on close, like RabbitMQ."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.default_exchange = FakeExchange(broker)
+
+    async def declare_queue(self, name, durable=False):
+        return FakeQueue(self.broker)
+
+    async def close(self):
+        returned = [m for m in self.broker.unacked if m not in self.broker.acked]
+        self.broker.queues[DEAD_LETTER_QUEUE][:0] = returned
+        self.broker.unacked = []
+
+
+class FakeBroker:
+    def __init__(self):
+        self.queues = {DEAD_LETTER_QUEUE: []}
+        self.unacked = []
+        self.acked = []
+        self.unroutable = set()
+
+    def dead_letter(self, file_id, original_queue, attempts):
+        body = json.dumps({"file_id": file_id, "file_path": f"/uploads/blobs/{file_id}"}).encode()
+        self.queues[DEAD_LETTER_QUEUE].append(FakeMessage(self, body, {
+            "x-original-queue": original_queue,
+            "x-scan-attempts": attempts,
+            "x-last-error": "ClamAV connection error",
+        }))
+
+    async def channel(self, publisher_confirms=False):
+        return FakeChannel(self)
+
+
+@pytest.fixture
+def setup(monkeypatch, tmp_path):
+    db_path = tmp_path / "files.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    models.File.__table__.create(bind=engine)
+    TestingSession = sessionmaker(bind=engine)
+    db = TestingSession()
+    for file_id in (1, 2):
+        db.add(models.File(id=file_id, filename=f"{file_id}.bin", filepath=f"/uploads/blobs/{file_id}",
+                           filesize=1, scan_status="error"))
+    db.commit()
+    db.close()
+
+    AsyncTestingSession = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSession() as session:
+            yield session
+
+    async def not_in_maintenance():
+        return False
+
+    broker = FakeBroker()
+    broker.dead_letter(1, SMALL_QUEUE, 8)
+    broker.dead_letter(2, LARGE_QUEUE, 8)
+
+    async def get_connection():
+        return broker
+
+    monkeypatch.setattr(dead_letters.publisher, "get_connection", get_connection)
+    monkeypatch.setattr(config_endpoints, "is_maintenance_mode_active", not_in_maintenance)
+    monkeypatch.setattr(config_endpoints, "get_sso_rbac_config", lambda: {"enabled": False})
+    app = FastAPI()
+    app.include_router(dead_letters.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    return TestClient(app), TestingSession, broker
+
+
+def test_listing_leaves_messages_in_the_queue(setup):
+    client, _, broker = setup
+    response = client.get("/admin/dead-letters")
+    assert response.status_code == 200
+    assert [(d["file_id"], d["original_queue"], d["attempts"]) for d in response.json()] == [
+        (1, SMALL_QUEUE, 8), (2, LARGE_QUEUE, 8),
+    ]
+    assert response.json()[0]["last_error"] == "ClamAV connection error"
+    assert len(broker.queues[DEAD_LETTER_QUEUE]) == 2
+
+
+def test_replay_sends_selected_messages_back_to_their_queue(setup):
+    client, TestingSession, broker = setup
+    response = client.post("/admin/dead-letters/replay", json={"file_ids": [2]})
+    assert response.status_code == 200
+    assert response.json() == {"replayed": 1, "file_ids": [2]}
+
+    assert [json.loads(m.body)["file_id"] for m in broker.queues[LARGE_QUEUE]] == [2]
+    # Replayed messages start over without the attempt counter
+    assert not broker.queues[LARGE_QUEUE][0].headers
+    assert [json.loads(m.body)["file_id"] for m in broker.queues[DEAD_LETTER_QUEUE]] == [1]
+
+    db = TestingSession()
+    assert db.get(models.File, 2).scan_status == models.ScanStatus.PENDING
+    assert db.get(models.File, 1).scan_status == models.ScanStatus.ERROR
+    db.close()
+
+
+def test_listing_pages_through_the_queue(setup):
+    client, _, broker = setup
+    broker.dead_letter(3, SMALL_QUEUE, 8)
+    response = client.get("/admin/dead-letters", params={"offset": 1, "limit": 1})
+    assert [d["file_id"] for d in response.json()] == [2]
+    assert len(broker.queues[DEAD_LETTER_QUEUE]) == 3
+
+
+def test_replay_by_file_id_looks_past_the_limit(setup):
+    client, _, broker = setup
+    response = client.post("/admin/dead-letters/replay", json={"file_ids": [2], "limit": 1})
+    assert response.json() == {"replayed": 1, "file_ids": [2]}
+
+
+def test_failed_replay_keeps_the_message_dead_lettered(setup):
+    client, TestingSession, broker = setup
+    broker.unroutable.add(LARGE_QUEUE)
+    response = client.post("/admin/dead-letters/replay", json={})
+    assert response.status_code == 500
+    assert "Replayed 1 of 2" in response.json()["detail"]
+
+    assert [json.loads(m.body)["file_id"] for m in broker.queues[SMALL_QUEUE]] == [1]
+    assert [json.loads(m.body)["file_id"] for m in broker.queues[DEAD_LETTER_QUEUE]] == [2]
+    db = TestingSession()
+    assert db.get(models.File, 1).scan_status == models.ScanStatus.PENDING
+    assert db.get(models.File, 2).scan_status == models.ScanStatus.ERROR
+    assert db.get(models.File, 2).scan_details.startswith("Replay from the dead-letter queue failed")
+    db.close()
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import config_endpoints
+from database import models
+from database.async_database import get_async_db
+from pagination import decode_datetime_cursor, encode_cursor
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    db_path = tmp_path / "files.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    models.File.__table__.create(bind=engine)
+    TestingSession = sessionmaker(bind=engine)
+
+    db = TestingSession()
+    start = datetime(2024, 1, 1)
+    for i in range(25):
+        db.add(models.File(
+            filename=f"file{i}.txt",
+            filepath=f"/uploads/file{i}.txt",
+            filesize=i,
+            upload_date=start + timedelta(hours=i // 2),  # pairs share a timestamp
+            scan_status="clean" if i % 3 else "infected",
+            owner="alice" if i % 2 else "bob",
+        ))
+    db.commit()
+    db.close()
+
+    AsyncTestingSession = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSession() as session:
+            yield session
+
+    async def not_in_maintenance():
+        return False
+
+    monkeypatch.setattr(config_endpoints, "is_maintenance_mode_active", not_in_maintenance)
+    app = FastAPI()
+    app.include_router(config_endpoints.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    return TestClient(app)
+
+
+def fetch_all(client, **params):
+    ids = []
+    cursor = None
+    pages = 0
+    while True:
+        query = dict(params, limit=4)
+        if cursor:
+            query["cursor"] = cursor
+        response = client.get("/files/", params=query)
+        assert response.status_code == 200
+        ids.extend(f["id"] for f in response.json())
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids, pages
+
+
+def test_keyset_pages_cover_all_rows_once_in_order(client):
+    ids, pages = fetch_all(client)
+    assert len(ids) == 25
+    assert len(set(ids)) == 25
+    assert pages == 7
+    # Newest first, ties broken by id
+    assert ids == sorted(ids, key=lambda i: ((i - 1) // 2, i), reverse=True)
+
+
+def test_filters_are_applied_across_pages(client):
+    ids, _ = fetch_all(client, scan_status="infected", owner="bob")
+    response = client.get("/files/", params={"scan_status": "infected", "owner": "bob", "limit": 100})
+    expected = [f["id"] for f in response.json()]
+    assert ids == expected
+    assert all(f["scan_status"] == "infected" and f["owner"] == "bob" for f in response.json())
+
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get("/files/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_cursor_round_trip():
+    moment = datetime(2024, 5, 1, 12, 30)
+    assert decode_datetime_cursor(encode_cursor(moment, 42)) == (moment, 42)
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+
+import jwt
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+import config_endpoints
+import logs
+from log_buffer import LogBuffer, LogFilter, RingBufferHandler, record_to_entry
+
+
+def entry(message, level=logging.INFO, logger="worker", file_id=None):
+    record = logging.makeLogRecord({"name": logger, "levelno": level, "levelname": logging.getLevelName(level),
+                                    "msg": message, "file_id": file_id})
+    return record_to_entry(record, "test")
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    buffer = LogBuffer(size=5)
+    monkeypatch.setattr(logs, "log_buffer", buffer)
+    monkeypatch.setattr(config_endpoints, "get_sso_rbac_config", lambda: {"enabled": False})
+    return buffer
+
+
+@pytest.fixture
+def client(buffer):
+    app = FastAPI()
+    app.include_router(logs.router)
+    return TestClient(app)
+
+
+def test_buffer_keeps_the_newest_entries(buffer):
+    for i in range(8):
+        buffer.add(entry(f"message {i}"))
+    assert [e["message"] for e in buffer.query(LogFilter())] == [f"message {i}" for i in range(3, 8)]
+    assert [e["seq"] for e in buffer.query(LogFilter(), after=6)] == [7, 8]
+
+
+def test_filters_by_level_logger_and_file(client, buffer):
+    buffer.add(entry("debug", level=logging.DEBUG))
+    buffer.add(entry("scanning", logger="worker.scan", file_id=7))
+    buffer.add(entry("other file", logger="worker", file_id=8))
+    buffer.add(entry("failed", level=logging.ERROR, logger="workers", file_id=7))
+
+    def messages(**params):
+        response = client.get("/logs/realtime", params=params)
+        assert response.status_code == 200
+        return [e["message"] for e in response.json()["logs"]]
+
+    assert messages(level="info") == ["scanning", "other file", "failed"]
+    assert messages(logger="worker") == ["debug", "scanning", "other file"]
+    assert messages(file_id=7) == ["scanning", "failed"]
+    assert messages(level="WARNING", file_id=7) == ["failed"]
+    assert messages(limit=1) == ["failed"]
+    assert client.get("/logs/realtime", params={"level": "LOUD"}).status_code == 400
+
+
+def test_handler_respects_its_level(buffer):
+    logger = logging.getLogger("test_logs.handler")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = RingBufferHandler(buffer, "backend", level="INFO")
+    logger.addHandler(handler)
+    try:
+        logger.debug("hidden")
+        logger.info("file %s scanned", 3, extra={"file_id": 3})
+    finally:
+        logger.removeHandler(handler)
+    [logged] = buffer.query(LogFilter())
+    assert (logged["message"], logged["file_id"], logged["source"]) == ("file 3 scanned", 3, "backend")
+
+
+def test_stream_sends_backlog_then_new_entries(buffer):
+    async def run():
+        buffer.add(entry("old", file_id=1))
+        buffer.add(entry("other", file_id=2))
+        disconnected = asyncio.Event()
+
+        async def is_disconnected():
+            return disconnected.is_set()
+
+        stream = logs.event_stream(buffer, LogFilter(file_id=1), 0, is_disconnected, heartbeat=0.05)
+        events = [await stream.__anext__()]
+        # Entries are logged from other threads, too
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, buffer.add, entry("new", file_id=1))
+        events.append(await stream.__anext__())
+        events.append(await stream.__anext__())  # nothing new: keep-alive
+        disconnected.set()
+        await stream.aclose()
+        return events
+
+    events = asyncio.run(run())
+    assert events[0] == f"id: 1\ndata: {json.dumps(buffer.query(LogFilter(file_id=1))[0])}\n\n"
+    assert json.loads(events[1].split("data: ", 1)[1])["message"] == "new"
+    assert events[2] == ": keep-alive\n\n"
+    assert not buffer._subscribers
+
+
+def test_stream_accepts_the_token_in_the_query_string(monkeypatch):
+    # EventSource cannot send an Authorization header
+    monkeypatch.setattr(config_endpoints, "get_sso_rbac_config",
+                        lambda: {"enabled": True, "ad_group_users": "users", "ad_group_admins": "admins"})
+    token = jwt.encode({"preferred_username": "alice", "groups": ["admins"]}, "secret", algorithm="HS256")
+
+    stream_user = config_endpoints.get_current_user(role="admin", query_token=True)
+    assert stream_user(credentials=None, access_token=token)["username"] == "alice"
+    with pytest.raises(HTTPException) as error:
+        stream_user(credentials=None, access_token=None)
+    assert error.value.status_code == 401
+
+    app = FastAPI()
+    app.include_router(logs.router)
+    # Only the stream takes it; other endpoints still require the header
+    assert TestClient(app).get("/logs/realtime", params={"access_token": token}).status_code == 401
@@ -0,0 +1,35 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import metrics
+
+
+def test_metrics_endpoint_exposes_the_pipeline_metrics():
+    metrics.UPLOAD_WRITE_SECONDS.labels("single").observe(0.2)
+    app = FastAPI()
+    app.include_router(metrics.router)
+
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for name in ("cfiles_upload_write_seconds", "cfiles_publish_seconds", "cfiles_db_commit_seconds",
+                 "cfiles_ws_flush_seconds", "cfiles_ws_send_seconds", "cfiles_websocket_clients"):
+        assert f"# TYPE {name}" in response.text
+    assert 'cfiles_upload_write_seconds_count{kind="single"}' in response.text
+
+
+def test_commits_are_timed(tmp_path):
+    metrics.instrument_commits()
+    metrics.instrument_commits()  # only instruments once
+    before = REGISTRY.get_sample_value("cfiles_db_commit_seconds_count") or 0
+    db = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path / 'metrics.db'}"))()
+    db.execute(text("CREATE TABLE t (x INTEGER)"))
+    db.commit()
+    db.execute(text("INSERT INTO t VALUES (1)"))
+    db.rollback()
+    db.close()
+    assert REGISTRY.get_sample_value("cfiles_db_commit_seconds_count") == before + 1
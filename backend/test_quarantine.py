@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import os
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import blob_store
+import config_endpoints
+import quarantine
+from database import models
+from database.async_database import get_async_db
+
+
+@pytest.fixture
+def setup(monkeypatch, tmp_path):
+    db_path = tmp_path / "quarantine.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    for model in (models.Blob, models.File, models.QuarantineJob):
+        model.__table__.create(bind=engine)
+    TestingSession = sessionmaker(bind=engine)
+
+    AsyncTestingSession = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSession() as session:
+            yield session
+
+    events = []
+
+    async def fake_publish(routing_key, message, exchange="", headers=None):
+        if routing_key == quarantine.QUARANTINE_JOB_QUEUE:
+            # Stands in for the job consumer of some replica
+            events.append({"queued": message["job_id"]})
+            await quarantine.continue_quarantine_job(message["job_id"])
+        else:
+            events.append(message)
+
+    monkeypatch.setattr(blob_store, "BLOB_ROOT", str(tmp_path / "blobs"))
+    monkeypatch.setattr(blob_store, "QUARANTINE_BLOB_ROOT", str(tmp_path / "quarantine"))
+    monkeypatch.setattr(config_endpoints, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(config_endpoints, "get_sso_rbac_config", lambda: {"enabled": False})
+    monkeypatch.setattr(quarantine, "AsyncSessionLocal", AsyncTestingSession)
+    monkeypatch.setattr(quarantine, "QUARANTINE_JOB_BATCH_SIZE", 2)
+    monkeypatch.setattr(quarantine.publisher, "publish", fake_publish)
+    app = FastAPI()
+    app.include_router(quarantine.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    return TestClient(app), TestingSession, tmp_path, events
+
+
+def add_quarantined(TestingSession, file_id, data, upload_day=1):
+    """A file quarantined by the worker: content under the quarantine blob root."""
+    sha = hashlib.sha256(data).hexdigest()
+    path = blob_store.blob_path(sha, root=blob_store.QUARANTINE_BLOB_ROOT)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    db = TestingSession()
+    if not db.get(models.Blob, sha):
+        db.add(models.Blob(sha256=sha, size=len(data)))
+    db.add(models.File(id=file_id, filename=f"{file_id}.exe", filepath=path, filesize=len(data),
+                       checksum=sha, blob_sha256=sha, scan_status="infected", is_quarantined=True,
+                       upload_date=datetime(2026, 1, upload_day)))
+    db.commit()
+    db.close()
+    return path
+
+
+def test_listing_is_paginated_newest_first(setup):
+    client, TestingSession, tmp_path, _ = setup
+    for file_id in range(1, 6):
+        add_quarantined(TestingSession, file_id, f"eicar {file_id}".encode(), upload_day=file_id)
+    db = TestingSession()
+    db.add(models.File(id=6, filename="clean.txt", filepath="/uploads/clean.txt", filesize=1, scan_status="clean"))
+    db.commit()
+    db.close()
+
+    response = client.get("/quarantine/files", params={"limit": 3})
+    assert response.status_code == 200
+    assert [f["id"] for f in response.json()["quarantined_files"]] == [5, 4, 3]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get("/quarantine/files", params={"limit": 3, "cursor": cursor})
+    assert [f["id"] for f in response.json()["quarantined_files"]] == [2, 1]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_release_moves_shared_content_back_and_marks_files_clean(setup):
+    client, TestingSession, tmp_path, _ = setup
+    path = add_quarantined(TestingSession, 1, b"false positive")
+    add_quarantined(TestingSession, 2, b"false positive")
+
+    response = client.post("/quarantine/files/1/release")
+    assert response.status_code == 200
+
+    sha = hashlib.sha256(b"false positive").hexdigest()
+    assert not os.path.exists(path)
+    assert os.path.exists(blob_store.blob_path(sha))
+    db = TestingSession()
+    for file_id in (1, 2):
+        db_file = db.get(models.File, file_id)
+        assert (db_file.scan_status, db_file.is_quarantined, db_file.filepath) == ("clean", False, blob_store.blob_path(sha))
+        # The scanner's verdict was overridden, and that is on record
+        assert db_file.verdict_overridden_by == "devuser"
+        assert db_file.verdict_overridden_at is not None
+    db.close()
+    assert client.post("/quarantine/files/2/release").status_code == 404
+
+
+def test_delete_removes_the_row_and_leaves_content_to_the_collector(setup):
+    client, TestingSession, tmp_path, _ = setup
+    path = add_quarantined(TestingSession, 1, b"malware")
+
+    assert client.delete("/quarantine/files/1").status_code == 200
+    assert client.delete("/quarantine/files/1").status_code == 404
+    db = TestingSession()
+    assert db.get(models.File, 1) is None
+    db.close()
+    assert os.path.exists(path)
+
+
+def test_bulk_job_processes_in_batches_and_reports_progress(setup):
+    client, TestingSession, tmp_path, events = setup
+    for file_id in range(1, 6):
+        add_quarantined(TestingSession, file_id, f"malware {file_id}".encode())
+
+    response = client.post("/quarantine/jobs", json={"action": "delete", "file_ids": [5, 1, 2, 99]})
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    assert response.json()["total"] == 4
+
+    job = client.get(f"/quarantine/jobs/{job_id}").json()
+    assert (job["state"], job["processed"], job["failed"]) == ("finished", 4, 1)
+    db = TestingSession()
+    assert sorted(f.id for f in db.query(models.File)) == [3, 4]
+    db.close()
+
+    progress = [(e["state"], e["processed"]) for e in events if e.get("job_id") == job_id]
+    assert progress == [("running", 0), ("running", 2), ("running", 4), ("finished", 4)]
+    assert all(e["type"] == quarantine.QUARANTINE_JOB_EVENT for e in events if "job_id" in e)
+
+
+def test_bulk_release_of_everything(setup):
+    client, TestingSession, tmp_path, _ = setup
+    for file_id in range(1, 4):
+        add_quarantined(TestingSession, file_id, f"sample {file_id}".encode())
+
+    response = client.post("/quarantine/jobs", json={"action": "release", "all": True})
+    assert response.status_code == 202
+    job = client.get(f"/quarantine/jobs/{response.json()['id']}").json()
+    assert (job["state"], job["total"], job["processed"], job["failed"]) == ("finished", 3, 3, 0)
+    assert client.get("/quarantine/files").json() == {"quarantined_files": []}
+
+
+def test_bulk_release_of_files_sharing_content_moves_it_once(setup, monkeypatch):
+    client, TestingSession, tmp_path, _ = setup
+    add_quarantined(TestingSession, 1, b"false positive")
+    add_quarantined(TestingSession, 2, b"false positive")
+    moves = []
+    storage = quarantine.get_storage()
+    move = storage.move
+
+    def recording_move(source, target):
+        moves.append((source, target))
+        move(source, target)
+
+    monkeypatch.setattr(storage, "move", recording_move)
+
+    response = client.post("/quarantine/jobs", json={"action": "release", "file_ids": [1, 2]})
+    job = client.get(f"/quarantine/jobs/{response.json()['id']}").json()
+    assert (job["state"], job["processed"], job["failed"]) == ("finished", 2, 0)
+    # On S3 a move onto itself would delete the only copy
+    sha = hashlib.sha256(b"false positive").hexdigest()
+    assert moves == [(blob_store.blob_path(sha, root=blob_store.QUARANTINE_BLOB_ROOT), blob_store.blob_path(sha))]
+    assert os.path.exists(blob_store.blob_path(sha))
+
+
+def test_job_request_is_validated(setup):
+    client, _, _, _ = setup
+    assert client.post("/quarantine/jobs", json={"action": "purge", "all": True}).status_code == 400
+    assert client.post("/quarantine/jobs", json={"action": "delete"}).status_code == 400
+    assert client.post("/quarantine/jobs", json={"action": "delete", "file_ids": [1], "all": True}).status_code == 400
+    assert client.get("/quarantine/jobs/unknown").status_code == 404
+
+
+def test_legacy_content_is_removed_only_after_the_row_is_deleted(setup, monkeypatch):
+    client, TestingSession, tmp_path, _ = setup
+    path = tmp_path / "quarantine" / "old.exe"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"malware")
+    db = TestingSession()
+    db.add(models.File(id=1, filename="old.exe", filepath=str(path), filesize=7, scan_status="infected", is_quarantined=True))
+    db.commit()
+    db.close()
+
+    removed_content = quarantine.remove_content
+
+    async def remove_content(paths):
+        db = TestingSession()
+        assert db.get(models.File, 1) is None  # already committed
+        db.close()
+        await removed_content(paths)
+
+    monkeypatch.setattr(quarantine, "remove_content", remove_content)
+    assert client.delete("/quarantine/files/1").status_code == 200
+    assert not path.exists()
+
+
+def test_long_job_is_requeued_between_deliveries(setup, monkeypatch):
+    client, TestingSession, tmp_path, events = setup
+    monkeypatch.setattr(quarantine, "QUARANTINE_JOB_BATCHES_PER_DELIVERY", 1)
+    for file_id in range(1, 6):
+        add_quarantined(TestingSession, file_id, f"malware {file_id}".encode())
+
+    job_id = client.post("/quarantine/jobs", json={"action": "delete", "all": True}).json()["id"]
+    assert client.get(f"/quarantine/jobs/{job_id}").json()["state"] == "finished"
+    # One delivery per batch: 2 + 2 + 1 files, then the one that finds nothing left
+    assert [e for e in events if "queued" in e] == [{"queued": job_id}] * 4
+
+
+def test_failing_job_is_marked_failed(setup, monkeypatch):
+    client, TestingSession, tmp_path, events = setup
+    for file_id in range(1, 4):
+        add_quarantined(TestingSession, file_id, f"malware {file_id}".encode())
+
+    delete_file = quarantine.delete_file
+
+    async def broken_delete(db, db_file):
+        if db_file.id == 3:
+            raise RuntimeError("storage unavailable")
+        return await delete_file(db, db_file)
+
+    monkeypatch.setattr(quarantine, "delete_file", broken_delete)
+
+    response = client.post("/quarantine/jobs", json={"action": "delete", "file_ids": [1, 2, 3]})
+    assert response.status_code == 202
+    job = client.get(f"/quarantine/jobs/{response.json()['id']}").json()
+    assert (job["state"], job["processed"], job["error"]) == ("failed", 2, "storage unavailable")
+    assert job["finished_at"] is not None
+    # The first batch was committed; the failed one was rolled back
+    db = TestingSession()
+    assert sorted(f.id for f in db.query(models.File)) == [3]
+    db.close()
+    assert [(e["state"], e["processed"]) for e in events if e.get("type")][-1] == ("failed", 2)
+
+
+def test_interrupted_job_resumes_where_it_stopped(setup):
+    _, TestingSession, tmp_path, events = setup
+    for file_id in range(1, 6):
+        add_quarantined(TestingSession, file_id, f"malware {file_id}".encode())
+    db = TestingSession()
+    # A replica died after committing the first batch (files 1 and 2 are gone)
+    for file_id in (1, 2):
+        db.delete(db.get(models.File, file_id))
+    db.add(models.QuarantineJob(id="job", action="delete", file_ids=None, state="running",
+                                total=5, processed=2, failed=0, last_file_id=2))
+    db.commit()
+    db.close()
+
+    assert asyncio.run(quarantine.run_quarantine_job("job")) is True
+
+    db = TestingSession()
+    job = db.get(models.QuarantineJob, "job")
+    assert (job.state, job.processed, job.failed) == ("finished", 5, 0)
+    assert db.query(models.File).count() == 0
+    db.close()
+    assert [(e["state"], e["processed"]) for e in events] == [("running", 4), ("running", 5), ("finished", 5)]
@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import rabbitmq_publisher
+from rabbitmq_publisher import RabbitMQPublisher
+
+
+class FakeExchange:
+    def __init__(self, published):
+        self.published = published
+
+    async def publish(self, message, routing_key, timeout=None):
+        self.published.append((routing_key, json.loads(message.body)))
+
+
+class FakeChannel:
+    def __init__(self, published, publisher_confirms):
+        self.is_closed = False
+        self.publisher_confirms = publisher_confirms
+        self.default_exchange = FakeExchange(published)
+        self.declared = []
+
+    async def declare_queue(self, name, durable=False):
+        self.declared.append(name)
+
+    async def close(self):
+        self.is_closed = True
+
+
+class FakeConnection:
+    def __init__(self):
+        self.is_closed = False
+        self.channels = []
+        self.published = []
+
+    async def channel(self, publisher_confirms=True):
+        channel = FakeChannel(self.published, publisher_confirms)
+        self.channels.append(channel)
+        return channel
+
+    async def close(self):
+        self.is_closed = True
+
+
+def test_publisher_reuses_connection_and_pools_channels(monkeypatch):
+    connections = []
+
+    async def fake_connect_robust(url):
+        connection = FakeConnection()
+        connections.append(connection)
+        return connection
+
+    monkeypatch.setattr(rabbitmq_publisher.aio_pika, "connect_robust", fake_connect_robust)
+
+    async def run():
+        publisher = RabbitMQPublisher(amqp_url="amqp://test/", pool_size=3)
+        await publisher.start()
+        await asyncio.gather(*[
+            publisher.publish("file_queue", {"file_id": i}) for i in range(50)
+        ])
+        await publisher.close()
+        return publisher
+
+    asyncio.run(run())
+
+    assert len(connections) == 1
+    connection = connections[0]
+    assert len(connection.channels) <= 3
+    assert all(channel.publisher_confirms for channel in connection.channels)
+    assert sorted(m["file_id"] for _, m in connection.published) == list(range(50))
+    assert connection.is_closed
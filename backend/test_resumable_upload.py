@@ -0,0 +1,131 @@
+import hashlib
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import blob_store
+import config_endpoints
+import resumable_upload
+from database import models
+from database.async_database import get_async_db
+
+CHUNK = resumable_upload.MIN_CHUNK_SIZE
+
+
+@pytest.fixture
+def setup(monkeypatch, tmp_path):
+    db_path = tmp_path / "uploads.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    for model in (models.Blob, models.File, models.UploadSession, models.UploadChunk):
+        model.__table__.create(bind=engine)
+    TestingSession = sessionmaker(bind=engine)
+
+    AsyncTestingSession = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSession() as session:
+            yield session
+
+    async def not_in_maintenance():
+        return False
+
+    published = []
+
+    async def fake_publish(routing_key, message, exchange="", headers=None):
+        published.append((routing_key, message))
+
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    monkeypatch.setattr(config_endpoints, "UPLOAD_DIR", str(upload_dir))
+    monkeypatch.setattr(blob_store, "BLOB_ROOT", str(upload_dir / "blobs"))
+    monkeypatch.setattr(blob_store, "STAGING_DIR", str(upload_dir / ".staging"))
+    monkeypatch.setattr(config_endpoints, "is_maintenance_mode_active", not_in_maintenance)
+    monkeypatch.setattr(config_endpoints, "get_sso_rbac_config", lambda: {"enabled": False})
+    monkeypatch.setattr(config_endpoints.publisher, "publish", fake_publish)
+    app = FastAPI()
+    app.include_router(resumable_upload.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    return TestClient(app), TestingSession, published, upload_dir
+
+
+def put_chunk(client, session_id, index, data):
+    return client.put(
+        f"/uploads/sessions/{session_id}/chunks/{index}",
+        content=data,
+        headers={"X-Chunk-SHA256": hashlib.sha256(data).hexdigest()},
+    )
+
+
+def test_chunks_in_any_order_are_assembled_and_queued(setup):
+    client, TestingSession, published, upload_dir = setup
+    data = os.urandom(CHUNK * 2 + 100)
+    response = client.post("/uploads/sessions", json={
+        "filename": "big.bin", "total_size": len(data), "chunk_size": CHUNK,
+        "checksum": hashlib.sha256(data).hexdigest(),
+    })
+    assert response.status_code == 200
+    session = response.json()
+    assert session["total_chunks"] == 3
+    session_id = session["session_id"]
+
+    chunks = [data[i:i + CHUNK] for i in range(0, len(data), CHUNK)]
+    assert put_chunk(client, session_id, 2, chunks[2]).status_code == 200
+    assert put_chunk(client, session_id, 0, chunks[0]).status_code == 200
+
+    # A resuming client learns what is still missing
+    assert client.get(f"/uploads/sessions/{session_id}").json()["received_chunks"] == [0, 2]
+    incomplete = client.post(f"/uploads/sessions/{session_id}/complete")
+    assert incomplete.status_code == 409
+    assert incomplete.json()["detail"]["missing_chunks"] == [1]
+
+    assert put_chunk(client, session_id, 1, chunks[1]).status_code == 200
+    response = client.post(f"/uploads/sessions/{session_id}/complete")
+    assert response.status_code == 200
+    file_id = response.json()["id"]
+
+    stored = blob_store.blob_path(hashlib.sha256(data).hexdigest())
+    assert open(stored, "rb").read() == data
+    assert not (upload_dir / ".sessions" / session_id).exists()
+    db = TestingSession()
+    db_file = db.get(models.File, file_id)
+    assert db_file.filesize == len(data)
+    assert db_file.checksum == hashlib.sha256(data).hexdigest()
+    db.close()
+    assert isinstance(published[0][1].pop("queued_at"), float)
+    assert published == [("file_queue", {
+        "file_path": stored, "file_id": file_id, "checksum": hashlib.sha256(data).hexdigest(),
+        "owner": "devuser", "filesize": len(data),
+    })]
+
+    # Completing again is idempotent
+    again = client.post(f"/uploads/sessions/{session_id}/complete")
+    assert again.status_code == 200
+    assert again.json()["id"] == file_id
+    assert len(published) == 1
+
+
+def test_chunk_retries_are_idempotent_and_verified(setup):
+    client, _, _, _ = setup
+    data = os.urandom(CHUNK + 10)
+    session_id = client.post("/uploads/sessions", json={
+        "filename": "a.bin", "total_size": len(data), "chunk_size": CHUNK,
+    }).json()["session_id"]
+
+    first = put_chunk(client, session_id, 0, data[:CHUNK])
+    retry = put_chunk(client, session_id, 0, data[:CHUNK])
+    assert first.json() == retry.json()
+
+    corrupted = client.put(
+        f"/uploads/sessions/{session_id}/chunks/1",
+        content=b"x" * 10,
+        headers={"X-Chunk-SHA256": hashlib.sha256(data[CHUNK:]).hexdigest()},
+    )
+    assert corrupted.status_code == 400
+    assert put_chunk(client, session_id, 1, data[CHUNK:] + b"extra").status_code == 400
+    assert put_chunk(client, session_id, 2, b"").status_code == 400
+    assert client.get(f"/uploads/sessions/{session_id}").json()["received_chunks"] == [0]
@@ -0,0 +1,83 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import config_endpoints
+import scan_queues
+from database import models
+from database.async_database import get_async_db
+
+
+def test_queue_is_chosen_by_size_and_priority(monkeypatch):
+    monkeypatch.setattr(scan_queues, "SCAN_SMALL_FILE_MAX_BYTES", 1000)
+    assert scan_queues.scan_queue_for(1000) == scan_queues.SMALL_QUEUE
+    assert scan_queues.scan_queue_for(1001) == scan_queues.LARGE_QUEUE
+    assert scan_queues.scan_queue_for(None) == scan_queues.SMALL_QUEUE
+    assert scan_queues.scan_queue_for(10 ** 12, priority=True) == scan_queues.PRIORITY_QUEUE
+
+
+@pytest.fixture
+def setup(monkeypatch, tmp_path):
+    db_path = tmp_path / "files.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    models.File.__table__.create(bind=engine)
+    TestingSession = sessionmaker(bind=engine)
+    db = TestingSession()
+    db.add(models.File(id=1, filename="archive.zip", filepath="/uploads/blobs/aa", filesize=10 ** 10,
+                       checksum="aa", scan_status="clean", owner="alice"))
+    db.commit()
+    db.close()
+
+    AsyncTestingSession = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSession() as session:
+            yield session
+
+    async def not_in_maintenance():
+        return False
+
+    published = []
+
+    async def fake_publish(routing_key, message, exchange="", headers=None):
+        published.append((routing_key, message))
+
+    monkeypatch.setattr(config_endpoints, "is_maintenance_mode_active", not_in_maintenance)
+    monkeypatch.setattr(config_endpoints, "get_sso_rbac_config", lambda: {"enabled": False})
+    monkeypatch.setattr(config_endpoints.publisher, "publish", fake_publish)
+    app = FastAPI()
+    app.include_router(config_endpoints.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    return TestClient(app), TestingSession, published
+
+
+def test_rescan_goes_to_priority_queue(setup):
+    client, TestingSession, published = setup
+    response = client.post("/files/1/rescan")
+    assert response.status_code == 200
+    assert response.json()["status"] == "PENDING"
+    assert isinstance(published[0][1].pop("queued_at"), float)
+    assert published == [(scan_queues.PRIORITY_QUEUE, {
+        "file_path": "/uploads/blobs/aa", "file_id": 1, "checksum": "aa", "owner": "alice", "rescan": True,
+        "filesize": 10 ** 10,
+    })]
+
+    db = TestingSession()
+    assert db.get(models.File, 1).scan_status == models.ScanStatus.PENDING
+    db.close()
+
+
+def test_non_priority_rescan_keeps_size_class(setup):
+    client, _, published = setup
+    assert client.post("/files/1/rescan", json={"priority": False}).status_code == 200
+    assert published[0][0] == scan_queues.LARGE_QUEUE
+    assert client.post("/files/2/rescan").status_code == 404
+
+
+def test_retry_delays_grow_then_dead_letter(monkeypatch):
+    monkeypatch.setattr(scan_queues, "SCAN_RETRY_DELAYS", [5, 30, 120])
+    monkeypatch.setattr(scan_queues, "SCAN_MAX_ATTEMPTS", 5)
+    assert [scan_queues.retry_delay(n) for n in range(0, 6)] == [5, 5, 30, 120, 120, None]
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+from database.settings_cache import SettingsCache
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeSessionFactory:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+        self.fail = False
+
+    def __call__(self):
+        factory = self
+
+        class Session:
+            def query(self, model):
+                factory.queries += 1
+                if factory.fail:
+                    raise RuntimeError("database down")
+                return FakeQuery(list(factory.rows))
+
+            def close(self):
+                pass
+
+        return Session()
+
+
+def setting(key, value):
+    return SimpleNamespace(key=key, value=value)
+
+
+def test_reads_are_served_from_memory_within_ttl():
+    factory = FakeSessionFactory([setting("MAINTENANCE_MODE", "false")])
+    cache = SettingsCache(session_factory=factory, ttl=60)
+
+    for _ in range(100):
+        assert cache.get_bool("MAINTENANCE_MODE") is False
+
+    assert factory.queries == 1
+
+
+def test_invalidate_forces_reload():
+    factory = FakeSessionFactory([setting("MAINTENANCE_MODE", "false")])
+    cache = SettingsCache(session_factory=factory, ttl=60)
+    assert cache.get_bool("MAINTENANCE_MODE") is False
+
+    factory.rows = [setting("MAINTENANCE_MODE", "true")]
+    assert cache.get_bool("MAINTENANCE_MODE") is False
+    cache.invalidate()
+    assert cache.get_bool("MAINTENANCE_MODE") is True
+    assert factory.queries == 2
+
+
+def test_change_notification_invalidates_and_runs_callbacks():
+    factory = FakeSessionFactory([setting("MAINTENANCE_MODE", "false")])
+    cache = SettingsCache(session_factory=factory, ttl=60)
+    changed = []
+    cache.add_change_callback(changed.append)
+    cache.get_all()
+
+    cache._handle_notification("MAINTENANCE_MODE")
+
+    assert changed == ["MAINTENANCE_MODE"]
+    assert not cache.is_fresh()
+
+
+def test_stale_values_are_served_when_reload_fails():
+    factory = FakeSessionFactory([setting("RBAC_SSO_ENABLED", "true")])
+    cache = SettingsCache(session_factory=factory, ttl=60)
+    assert cache.get("RBAC_SSO_ENABLED") == "true"
+
+    factory.fail = True
+    cache.invalidate()
+    assert cache.get("RBAC_SSO_ENABLED") == "true"
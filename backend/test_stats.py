@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import config_endpoints
+from database import models
+from database.database import get_db
+
+
+@pytest.fixture
+def client():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.FileStat.__table__.create(bind=engine)
+    TestingSession = sessionmaker(bind=engine)
+
+    today = datetime.utcnow().date()
+    db = TestingSession()
+    db.add_all([
+        models.FileStat(day=today, owner="alice", scan_status="clean", file_count=5),
+        models.FileStat(day=today, owner="alice", scan_status="infected", file_count=1),
+        models.FileStat(day=today, owner="bob", scan_status="pending", file_count=2),
+        models.FileStat(day=today - timedelta(days=1), owner="bob", scan_status="clean", file_count=3),
+        models.FileStat(day=today - timedelta(days=1), owner="", scan_status="quarantined", file_count=1),
+        # Counter that has dropped back to zero is left out of the response
+        models.FileStat(day=today - timedelta(days=1), owner="bob", scan_status="scanning", file_count=0),
+        models.FileStat(day=today - timedelta(days=90), owner="alice", scan_status="clean", file_count=4),
+    ])
+    db.commit()
+    db.close()
+
+    def override_get_db():
+        session = TestingSession()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app = FastAPI()
+    app.include_router(config_endpoints.router)
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def test_stats_aggregates_counters(client):
+    response = client.get("/stats", params={"days": 7})
+    assert response.status_code == 200
+    stats = response.json()
+
+    assert stats["total"] == 16
+    assert stats["by_status"] == {"clean": 12, "infected": 1, "pending": 2, "quarantined": 1}
+    assert stats["by_owner"]["alice"] == {"clean": 9, "infected": 1}
+    assert stats["by_owner"][""] == {"quarantined": 1}
+    # Only the requested window, oldest day first
+    assert [d["counts"] for d in stats["by_day"]] == [
+        {"clean": 3, "quarantined": 1},
+        {"clean": 5, "infected": 1, "pending": 2},
+    ]
+
+
+def test_count_endpoints_read_counters(client):
+    assert client.get("/config/files/count").json() == 16
+    assert client.get("/config/files/scanned-count").json() == 14
+    assert client.get("/config/files/infected-count").json() == 1
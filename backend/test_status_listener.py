@@ -0,0 +1,97 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import main
+
+
+class FakeMessage:
+    def __init__(self, payload):
+        self.body = json.dumps(payload).encode()
+        self.headers = {}
+
+    @asynccontextmanager
+    async def process(self):
+        yield
+
+
+class FakeQueue:
+    def __init__(self, messages):
+        self.name = "amq.gen-test"
+        self.messages = messages
+        self.bound_to = None
+
+    async def bind(self, exchange):
+        self.bound_to = exchange
+
+    @asynccontextmanager
+    async def iterator(self):
+        async def iterate():
+            for message in self.messages:
+                yield message
+            # Stay subscribed like a real consumer until cancelled
+            await asyncio.Event().wait()
+        yield iterate()
+
+
+class FakeChannel:
+    def __init__(self, queue):
+        self.queue = queue
+        self.is_closed = False
+        self.exchanges = []
+        self.queue_kwargs = None
+
+    async def declare_exchange(self, name, exchange_type, durable=False):
+        self.exchanges.append((name, exchange_type))
+        return name
+
+    async def declare_queue(self, name=None, **kwargs):
+        self.queue_kwargs = dict(kwargs, name=name)
+        return self.queue
+
+    async def close(self):
+        self.is_closed = True
+
+
+class FakeConnection:
+    def __init__(self, channel):
+        self._channel = channel
+
+    async def channel(self):
+        return self._channel
+
+
+class RecordingManager:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, message):
+        self.published.append(message)
+
+    def broadcast(self, text):
+        pass
+
+
+def test_each_replica_consumes_its_own_queue_bound_to_the_fanout_exchange(monkeypatch):
+    queue = FakeQueue([FakeMessage({"file_id": 1, "status": "scanning"}), FakeMessage({"file_id": 1, "status": "clean"})])
+    channel = FakeChannel(queue)
+
+    async def get_connection():
+        return FakeConnection(channel)
+
+    monkeypatch.setattr(main.publisher, "get_connection", get_connection)
+    manager = RecordingManager()
+
+    async def scenario():
+        task = asyncio.create_task(main.listen_to_status_updates(manager))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await task
+
+    asyncio.run(scenario())
+
+    assert channel.exchanges == [(main.STATUS_EXCHANGE, main.aio_pika.ExchangeType.FANOUT)]
+    assert channel.queue_kwargs == {"name": None, "exclusive": True}
+    assert queue.bound_to == main.STATUS_EXCHANGE
+    assert [m["status"] for m in manager.published] == ["scanning", "clean"]
+    assert channel.is_closed
@@ -0,0 +1,157 @@
+import hashlib
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import config_endpoints
+import storage
+from database import models
+from database.async_database import get_async_db
+
+BUCKET = "cfiles-test"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield storage.S3Storage(bucket=BUCKET, client=client)
+
+
+@pytest.fixture(params=["local", "s3"])
+def store(request, tmp_path):
+    if request.param == "local":
+        return storage.LocalStorage(root=str(tmp_path / "root"))
+    return request.getfixturevalue("s3")
+
+
+def test_incomplete_backend_cannot_be_created():
+    class ReadOnlyStorage(storage.Storage):
+        def exists(self, key):
+            return False
+
+    with pytest.raises(TypeError, match="put_file"):
+        ReadOnlyStorage()
+
+
+def staged(tmp_path, data: bytes) -> str:
+    path = tmp_path / f"staged-{hashlib.sha256(data).hexdigest()}"
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_put_read_move_delete(store, tmp_path):
+    data = os.urandom(3000)
+    local = staged(tmp_path, data)
+    store.put_file(local, "/uploads/blobs/ab/cd/abcd")
+    assert not os.path.exists(local)
+    assert store.exists("/uploads/blobs/ab/cd/abcd")
+    assert store.stat("/uploads/blobs/ab/cd/abcd").st_size == 3000
+
+    assert b"".join(store.iter_bytes("/uploads/blobs/ab/cd/abcd", chunk_size=1000)) == data
+    assert b"".join(store.iter_bytes("/uploads/blobs/ab/cd/abcd", 100, 199)) == data[100:200]
+    assert b"".join(store.iter_bytes("/uploads/blobs/ab/cd/abcd", 2990)) == data[2990:]
+    with store.open("/uploads/blobs/ab/cd/abcd") as f:
+        assert f.read(10) == data[:10]
+
+    store.move("/uploads/blobs/ab/cd/abcd", "/quarantine/blobs/ab/cd/abcd")
+    assert not store.exists("/uploads/blobs/ab/cd/abcd")
+    assert b"".join(store.iter_bytes("/quarantine/blobs/ab/cd/abcd")) == data
+
+    store.delete("/quarantine/blobs/ab/cd/abcd")
+    store.delete("/quarantine/blobs/ab/cd/abcd")
+    assert not store.exists("/quarantine/blobs/ab/cd/abcd")
+    with pytest.raises(FileNotFoundError):
+        store.stat("/quarantine/blobs/ab/cd/abcd")
+
+
+def test_delete_prefix_only_removes_that_prefix(store, tmp_path):
+    for key in ("/uploads/.sessions/s1/000000.part", "/uploads/.sessions/s1/000001.part", "/uploads/.sessions/s10/000000.part"):
+        store.put_file(staged(tmp_path, key.encode()), key)
+    store.delete_prefix("/uploads/.sessions/s1")
+    assert not store.exists("/uploads/.sessions/s1/000000.part")
+    assert not store.exists("/uploads/.sessions/s1/000001.part")
+    assert store.exists("/uploads/.sessions/s10/000000.part")
+
+
+def test_large_files_use_multipart_upload(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "S3_MULTIPART_THRESHOLD", 5 * 1024 * 1024)
+    monkeypatch.setattr(storage, "S3_MULTIPART_CHUNK_SIZE", 5 * 1024 * 1024)
+    store = storage.S3Storage(bucket=BUCKET, client=s3.client)
+    data = os.urandom(11 * 1024 * 1024)
+    store.put_file(staged(tmp_path, data), "/uploads/blobs/big")
+
+    head = s3.client.head_object(Bucket=BUCKET, Key="uploads/blobs/big")
+    # Multipart ETags end in -<number of parts>
+    assert head["ETag"].strip('"').endswith("-3")
+    assert hashlib.sha256(b"".join(store.iter_bytes("/uploads/blobs/big"))).digest() == hashlib.sha256(data).digest()
+
+
+@pytest.fixture
+def s3_client(s3, tmp_path, monkeypatch):
+    data = bytes(range(256)) * 40
+    s3.put_file(staged(tmp_path, data), "/uploads/blobs/report")
+    monkeypatch.setattr(storage, "_storage", s3)
+
+    db_path = tmp_path / "files.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    models.File.__table__.create(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add(models.File(id=1, filename="report.bin", filepath="/uploads/blobs/report", filesize=len(data),
+                       checksum=hashlib.sha256(data).hexdigest(), scan_status="clean"))
+    db.commit()
+    db.close()
+
+    AsyncTestingSession = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSession() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(config_endpoints.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    return TestClient(app), data
+
+
+def test_download_from_s3_supports_ranges_and_validators(s3_client):
+    client, data = s3_client
+    full = client.get("/files/1/download")
+    assert full.status_code == 200
+    assert full.content == data
+    assert full.headers["content-disposition"] == 'attachment; filename="report.bin"'
+    etag = full.headers["etag"]
+
+    assert client.get("/files/1/download", headers={"If-None-Match": etag}).status_code == 304
+
+    partial = client.get("/files/1/download", headers={"Range": "bytes=100-199", "If-Range": etag})
+    assert partial.status_code == 206
+    assert partial.content == data[100:200]
+    assert partial.headers["content-range"] == f"bytes 100-199/{len(data)}"
+
+    suffix = client.get("/files/1/download", headers={"Range": "bytes=-10"})
+    assert suffix.content == data[-10:]
+
+    # A stale If-Range gets the whole current file
+    stale = client.get("/files/1/download", headers={"Range": "bytes=100-199", "If-Range": '"outdated"'})
+    assert stale.status_code == 200
+    assert stale.content == data
+
+    unsatisfiable = client.get("/files/1/download", headers={"Range": f"bytes={len(data)}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{len(data)}"
+
+    head = client.head("/files/1/download")
+    assert head.status_code == 200
+    assert head.headers["content-length"] == str(len(data))
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import SpanKind
+
+import tracing
+
+exporter = InMemorySpanExporter()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def provider():
+    # The global provider can only be set once per process
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    yield provider
+
+
+@pytest.fixture(autouse=True)
+def clear_spans():
+    exporter.clear()
+
+
+def test_context_travels_in_message_headers():
+    with tracing.tracer.start_as_current_span("publish", kind=SpanKind.PRODUCER) as producer:
+        headers = tracing.inject_headers({"x-attempt": 1})
+    assert headers["x-attempt"] == 1
+    assert tracing.TRACEPARENT_FIELD in headers
+
+    # pika hands header values over as bytes
+    received = {key: value.encode() if isinstance(value, str) else value for key, value in headers.items()}
+    with tracing.tracer.start_as_current_span("consume", context=tracing.extract_context(received), kind=SpanKind.CONSUMER) as consumer:
+        assert tracing.current_traceparent().split("-")[1] == format(producer.get_span_context().trace_id, "032x")
+
+    assert consumer.parent.span_id == producer.get_span_context().span_id
+    assert consumer.get_span_context().trace_id == producer.get_span_context().trace_id
+
+
+def test_no_traceparent_outside_a_span():
+    assert tracing.current_traceparent() is None
+    assert tracing.extract_context(None) is not None
+
+
+def test_file_exporter_writes_a_json_line_per_span(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(tracing.create_exporter("file", str(path))))
+    with provider.get_tracer("test").start_as_current_span("upload"):
+        with provider.get_tracer("test").start_as_current_span("publish"):
+            pass
+    provider.shutdown()
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [span["name"] for span in spans] == ["publish", "upload"]
+    assert spans[0]["parent_id"] == spans[1]["context"]["span_id"]
+
+
+def test_unknown_exporter_is_rejected():
+    assert tracing.configure_tracing("test", exporter="none") is None
+    with pytest.raises(ValueError):
+        tracing.create_exporter("zipkin")
+
+
+def test_upload_span_is_the_parent_of_the_publish(monkeypatch):
+    import config_endpoints
+
+    published = []
+
+    async def fake_publish(routing_key, message, exchange="", headers=None):
+        published.append(headers)
+
+    class FakeFile:
+        id = 7
+        filename = "report.pdf"
+        filepath = "/uploads/blobs/aa"
+        filesize = 10
+        checksum = "aa"
+        owner = "alice"
+        scan_status = None
+        scan_details = None
+
+    monkeypatch.setattr(config_endpoints.publisher, "publish", fake_publish)
+
+    @tracing.traced("upload", kind=SpanKind.SERVER)
+    async def upload():
+        await config_endpoints.queue_for_scan(None, FakeFile())
+
+    asyncio.run(upload())
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    upload_span, publish_span = spans["upload"], spans["publish " + config_endpoints.scan_queue_for(10)]
+    assert publish_span.parent.span_id == upload_span.context.span_id
+    assert publish_span.attributes["cfiles.file_id"] == 7
+    traceparent = published[0][tracing.TRACEPARENT_FIELD]
+    assert traceparent.split("-")[2] == format(publish_span.context.span_id, "016x")
@@ -0,0 +1,47 @@
+import asyncio
+import hashlib
+import io
+import os
+
+from fastapi import UploadFile
+
+from upload_stream import copy_and_hash, save_upload
+
+
+def test_copy_and_hash_returns_size_and_checksum(tmp_path):
+    data = os.urandom(3 * 1024 + 17)
+    dest = tmp_path / "out.bin"
+
+    size, checksum = copy_and_hash(io.BytesIO(data), str(dest), chunk_size=1024)
+
+    assert size == len(data)
+    assert checksum == hashlib.sha256(data).hexdigest()
+    assert dest.read_bytes() == data
+    # No temporary files should be left behind
+    assert os.listdir(tmp_path) == ["out.bin"]
+
+
+def test_copy_and_hash_removes_temp_file_on_error(tmp_path):
+    class BrokenStream:
+        def read(self, size):
+            raise IOError("connection reset")
+
+    dest = tmp_path / "out.bin"
+    try:
+        copy_and_hash(BrokenStream(), str(dest))
+        assert False, "expected IOError"
+    except IOError:
+        pass
+    assert os.listdir(tmp_path) == []
+
+
+def test_save_upload_streams_upload_file(tmp_path):
+    data = b"hello world" * 1000
+    upload = UploadFile(io.BytesIO(data), filename="hello.txt")
+    dest = tmp_path / "hello.txt"
+
+    size, checksum = asyncio.run(save_upload(upload, str(dest)))
+
+    assert size == len(data)
+    assert checksum == hashlib.sha256(data).hexdigest()
+    assert dest.read_bytes() == data
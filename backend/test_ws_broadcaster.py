@@ -0,0 +1,150 @@
+import asyncio
+import json
+
+from ws_broadcaster import StatusBroadcaster
+
+
+class FakeWebSocket:
+    def __init__(self, name, stall=False):
+        self.client = name
+        self.sent = []
+        self.closed_with = None
+        self.stall = stall
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.stall:
+            await asyncio.sleep(3600)
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def test_updates_are_coalesced_per_file_into_one_frame():
+    async def scenario():
+        broadcaster = StatusBroadcaster()
+        websocket = FakeWebSocket("client")
+        await broadcaster.connect(websocket)
+
+        for status in ("pending", "scanning", "clean"):
+            broadcaster.publish({"file_id": 1, "status": status})
+        broadcaster.publish({"file_id": 2, "status": "pending"})
+        broadcaster.publish({"file_id": 2, "status": "scanning"})
+        assert broadcaster.flush() == 1
+        assert broadcaster.flush() == 0
+        await asyncio.sleep(0.01)
+
+        assert websocket.sent == [[{"file_id": 1, "status": "clean"}, {"file_id": 2, "status": "scanning"}]]
+
+    asyncio.run(scenario())
+
+
+def test_new_clients_get_a_snapshot_of_in_flight_files():
+    async def scenario():
+        broadcaster = StatusBroadcaster()
+        broadcaster.publish({"file_id": 1, "status": "clean"})
+        broadcaster.publish({"file_id": 2, "status": "scanning", "owner": "alice"})
+        broadcaster.publish({"file_id": 3, "status": "pending", "owner": "bob"})
+        broadcaster.flush()
+
+        everything = FakeWebSocket("all")
+        alice = FakeWebSocket("alice")
+        await broadcaster.connect(everything)
+        await broadcaster.connect(alice, owners=["alice"])
+        await asyncio.sleep(0.01)
+
+        assert [[m["file_id"] for m in frame] for frame in everything.sent] == [[2, 3]]
+        assert [[m["file_id"] for m in frame] for frame in alice.sent] == [[2]]
+
+    asyncio.run(scenario())
+
+
+def test_stalled_client_does_not_hold_up_others():
+    async def scenario():
+        broadcaster = StatusBroadcaster(queue_size=2, send_timeout=0.2)
+        fast = FakeWebSocket("fast")
+        slow = FakeWebSocket("slow", stall=True)
+        await broadcaster.connect(fast)
+        await broadcaster.connect(slow)
+
+        for i in range(10):
+            broadcaster.publish({"file_id": i, "status": "clean"})
+            assert broadcaster.flush() == 2
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.05)
+
+        assert [frame[0]["file_id"] for frame in fast.sent] == list(range(10))
+        slow_client = broadcaster.clients[slow]
+        assert slow_client.dropped > 0
+        # The backlog was replaced by a resync request followed by the newest update
+        queued = [json.loads(slow_client.queue.get_nowait()) for _ in range(slow_client.queue.qsize())]
+        assert {"type": "resync"} in queued
+        await asyncio.sleep(0.3)
+        # The stalled client is disconnected once a send times out
+        assert slow.closed_with == 1008
+        assert slow not in broadcaster.clients
+        assert fast in broadcaster.clients
+
+    asyncio.run(scenario())
+
+
+def test_subscriptions_filter_by_file_and_owner():
+    async def scenario():
+        broadcaster = StatusBroadcaster()
+        everything = FakeWebSocket("all")
+        by_file = FakeWebSocket("file")
+        by_owner = FakeWebSocket("owner")
+        await broadcaster.connect(everything)
+        await broadcaster.connect(by_file, file_ids=[1])
+        await broadcaster.connect(by_owner)
+        broadcaster.handle_client_message(by_owner, json.dumps({"type": "subscribe", "owners": ["alice"]}))
+
+        broadcaster.publish({"file_id": 1, "status": "clean", "owner": "bob"})
+        broadcaster.publish({"file_id": 2, "status": "clean", "owner": "alice"})
+        broadcaster.publish({"file_id": 3, "status": "clean", "owner": None})
+        broadcaster.flush()
+        await asyncio.sleep(0.01)
+
+        assert [[m["file_id"] for m in frame] for frame in everything.sent] == [[1, 2, 3]]
+        assert [[m["file_id"] for m in frame] for frame in by_file.sent] == [[1]]
+        assert [[m["file_id"] for m in frame] for frame in by_owner.sent] == [[2]]
+
+    asyncio.run(scenario())
+
+
+def test_job_progress_only_goes_to_clients_following_the_job():
+    async def scenario():
+        broadcaster = StatusBroadcaster()
+        everything = FakeWebSocket("all")
+        admin = FakeWebSocket("admin")
+        other_job = FakeWebSocket("other")
+        await broadcaster.connect(everything)
+        await broadcaster.connect(admin, job_ids=["job-1"])
+        await broadcaster.connect(other_job)
+        broadcaster.handle_client_message(other_job, json.dumps({"type": "subscribe", "job_ids": ["job-2"]}))
+
+        broadcaster.publish_job({"type": "quarantine_job", "job_id": "job-1", "state": "running", "processed": 200})
+        await asyncio.sleep(0.01)
+
+        assert everything.sent == [] and other_job.sent == []
+        assert [event["processed"] for event in admin.sent] == [200]
+
+    asyncio.run(scenario())
+
+
+def test_pong_updates_last_seen():
+    async def scenario():
+        broadcaster = StatusBroadcaster()
+        websocket = FakeWebSocket("client")
+        client = await broadcaster.connect(websocket)
+        before = client.last_pong
+        await asyncio.sleep(0.01)
+        broadcaster.handle_client_message(websocket, '{"type":"pong"}')
+        assert client.last_pong > before
+        broadcaster.disconnect(websocket)
+        assert broadcaster.active_connections == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+"""
+OpenTelemetry tracing of a file's way through the pipeline.
+
+One trace follows a file from the upload request through the scan queue,
+the worker (checksum, clamd scan, verdict) and the status update back to the
+backend. The W3C trace context travels in the AMQP headers of the scan and
+status messages (inject_headers / extract_context). Status updates also carry
+it as "traceparent" in the payload, which reaches the WebSocket clients
+unchanged, so a UI event can be matched with its trace.
+
+TRACING_EXPORTER selects where spans go:
+
+    none  tracing off (default); the context is still passed on
+    file  one JSON span per line appended to TRACING_FILE
+    otlp  an OpenTelemetry collector over OTLP/HTTP, configured with the
+          standard OTEL_EXPORTER_OTLP_* variables
+
+Shared by the backend and the workers.
+"""
+import functools
+import logging
+import os
+from typing import Optional
+
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.trace import SpanKind
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "/tmp/cfiles-traces.jsonl")
+TRACEPARENT_FIELD = "traceparent"
+
+# Spans are no-ops until configure_tracing() has installed a provider
+tracer = trace.get_tracer("cfiles")
+
+
+def create_exporter(exporter: str = TRACING_EXPORTER, path: str = TRACING_FILE):
+    if exporter == "file":
+        out = open(path, "a", buffering=1)
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    if exporter == "otlp":
+        # Only needed when exporting to a collector
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    raise ValueError(f"Unknown TRACING_EXPORTER: {exporter}")
+
+
+def configure_tracing(service_name: str, exporter: str = TRACING_EXPORTER) -> Optional[TracerProvider]:
+    """Installs a provider exporting this process's spans. Call shutdown() on it to flush them."""
+    if exporter == "none":
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(create_exporter(exporter)))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Tracing enabled ({exporter}) for {service_name}.")
+    return provider
+
+
+def inject_headers(headers: dict = None) -> dict:
+    """Message headers with the current trace context added."""
+    carrier = dict(headers or {})
+    propagate.inject(carrier)
+    return carrier
+
+
+def extract_context(headers: dict = None):
+    """The trace context a message was published in, for parenting the span that handles it."""
+    carrier = {key: value.decode() if isinstance(value, bytes) else value for key, value in (headers or {}).items()}
+    return propagate.extract(carrier)
+
+
+def current_traceparent() -> Optional[str]:
+    return inject_headers().get(TRACEPARENT_FIELD)
+
+
+def traced(name: str, kind: SpanKind = SpanKind.INTERNAL):
+    """Runs an async function (e.g. an endpoint) in a span of its own."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name, kind=kind):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,111 @@
+"""
+Streaming ingest of uploaded files.
+
+The upload is read once, in large chunks, and written to disk while its SHA-256
+checksum and size are computed in the same pass. All blocking file I/O runs in
+the thread pool so the event loop stays responsive while large files arrive.
+"""
+import hashlib
+import os
+import uuid
+
+from starlette.concurrency import run_in_threadpool
+
+# 1 MiB chunks: large enough to keep syscalls and hash updates cheap.
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+
+def copy_and_hash(src, dest_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Copies a readable binary file object to dest_path while hashing it.
+
+    The data is first written to a temporary file next to the target and then
+    atomically renamed, so the worker never sees a half-written file.
+    Returns a tuple (size, sha256 hexdigest).
+    """
+    return _write_atomically([src], dest_path, chunk_size)
+
+
+def concat_and_hash(part_paths, dest_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE, opener=None):
+    """
+    Concatenates the files in part_paths, in order, into dest_path in a single
+    streaming pass, hashing the result. Returns a tuple (size, sha256 hexdigest).
+    opener(part_path) opens a part for reading (default: a local binary file).
+    """
+    opener = opener or (lambda path: open(path, "rb"))
+
+    def sources():
+        for part_path in part_paths:
+            with opener(part_path) as part:
+                yield part
+
+    return _write_atomically(sources(), dest_path, chunk_size)
+
+
+def _write_atomically(sources, dest_path: str, chunk_size: int):
+    sha256_hash = hashlib.sha256()
+    size = 0
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as out:
+            for src in sources:
+                for chunk in iter(lambda: src.read(chunk_size), b""):
+                    sha256_hash.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size, sha256_hash.hexdigest()
+
+
+async def save_upload(upload, dest_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Streams a FastAPI UploadFile to dest_path off the event loop. Returns (size, checksum)."""
+    await upload.seek(0)
+    return await run_in_threadpool(copy_and_hash, upload.file, dest_path, chunk_size)
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+async def save_stream(stream, dest_path: str, max_size: int = None, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Writes an async iterator of byte strings (e.g. Request.stream()) to dest_path.
+
+    Network reads arrive in small pieces; they are collected into chunk_size
+    blocks that are hashed and written in the thread pool. Raises
+    UploadTooLargeError as soon as more than max_size bytes have arrived.
+    Returns a tuple (size, sha256 hexdigest).
+    """
+    sha256_hash = hashlib.sha256()
+    size = 0
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+
+    def write_block(out, block):
+        sha256_hash.update(block)
+        out.write(block)
+
+    out = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        buffer = bytearray()
+        async for data in stream:
+            size += len(data)
+            if max_size is not None and size > max_size:
+                raise UploadTooLargeError(f"More than {max_size} bytes received")
+            buffer += data
+            if len(buffer) >= chunk_size:
+                await run_in_threadpool(write_block, out, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(write_block, out, bytes(buffer))
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(os.replace, tmp_path, dest_path)
+    except BaseException:
+        out.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size, sha256_hash.hexdigest()
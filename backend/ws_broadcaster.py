@@ -0,0 +1,263 @@
+"""
+Fan-out of status updates to WebSocket clients.
+
+publish() only records the latest status per file_id. Every
+WS_FLUSH_INTERVAL_MS a flusher sends the collected updates as one JSON array
+per client, so the PENDING -> SCANNING -> CLEAN sequence of a quickly scanned
+file costs one entry in one frame instead of three frames. The array is
+serialised once and shared by all clients that receive everything.
+
+Each connected client gets a bounded outgoing queue and its own writer task,
+so flushing never awaits a socket. A client whose queue overflows has it
+replaced by a single {"type": "resync"} message telling it to reload the file
+list, and one whose socket stalls for longer than WS_SEND_TIMEOUT is
+disconnected. Either way the RabbitMQ listener and all other clients carry on
+at full speed. Newly connected clients first receive a snapshot of all files
+that are still pending or being scanned.
+
+Clients receive every update by default. They can narrow that down to
+specific files or owners, either with query parameters on connect
+(/ws/status?file_id=1&file_id=2&owner=alice) or by sending
+{"type": "subscribe", "file_ids": [...], "owners": [...]} at any time
+({"type": "unsubscribe", ...} removes them again).
+
+Progress of bulk quarantine jobs is not a file update and only goes to the
+clients that subscribed to the job (?job_id= or "job_ids" in a subscribe
+message). Job ids are random and only returned to the admin who created
+the job.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable
+
+from fastapi import WebSocket
+
+from metrics import WS_FLUSH_SECONDS, WS_SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "64"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+WS_FLUSH_INTERVAL_MS = int(os.getenv("WS_FLUSH_INTERVAL_MS", "250"))
+# Upper bound on the in-flight snapshot, in case final statuses never arrive for some files
+WS_SNAPSHOT_MAX_FILES = int(os.getenv("WS_SNAPSHOT_MAX_FILES", "10000"))
+
+IN_FLIGHT_STATUSES = ("pending", "scanning")
+RESYNC_MESSAGE = json.dumps({"type": "resync"})
+
+
+class ClientConnection:
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.file_ids = set()
+        self.owners = set()
+        self.job_ids = set()
+        self.last_pong = datetime.utcnow()
+        self.dropped = 0
+        self.writer_task = None
+
+    @property
+    def subscribed_to_all(self) -> bool:
+        return not self.file_ids and not self.owners
+
+    def wants(self, file_id, owner) -> bool:
+        return self.subscribed_to_all or file_id in self.file_ids or (owner is not None and owner in self.owners)
+
+    def enqueue(self, text: str):
+        """
+        Queues a message without blocking. If the client is too far behind, its
+        backlog is discarded and replaced by a request to reload everything.
+        """
+        if self.queue.full():
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            logger.warning(f"WebSocket client {self.websocket.client} is falling behind; asking it to resync ({self.dropped} messages dropped so far).")
+            self.queue.put_nowait(RESYNC_MESSAGE)
+        self.queue.put_nowait(text)
+
+
+class StatusBroadcaster:
+    def __init__(self, queue_size: int = WS_CLIENT_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT,
+                 flush_interval_ms: int = WS_FLUSH_INTERVAL_MS):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.flush_interval = flush_interval_ms / 1000
+        self.clients: dict = {}
+        # Latest unsent status per file_id
+        self._pending: dict = {}
+        # Latest status of files that are not finished yet, for snapshots
+        self._in_flight = OrderedDict()
+        self._flush_task = None
+
+    def start(self):
+        """Starts the periodic flusher. Must be called from the running event loop."""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._run_flusher())
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        self.flush()
+
+    @property
+    def active_connections(self) -> dict:
+        """{websocket: last pong time}, as used by the ping-pong service."""
+        return {ws: client.last_pong for ws, client in self.clients.items()}
+
+    async def connect(self, websocket: WebSocket, file_ids: Iterable[int] = (), owners: Iterable[str] = (), job_ids: Iterable[str] = ()):
+        await websocket.accept()
+        client = ClientConnection(websocket, self.queue_size)
+        client.file_ids.update(file_ids)
+        client.owners.update(owners)
+        client.job_ids.update(job_ids)
+        client.writer_task = asyncio.create_task(self._writer(client))
+        self.clients[websocket] = client
+        snapshot = [m for m in self._in_flight.values() if client.wants(m.get("file_id"), m.get("owner"))]
+        if snapshot:
+            client.enqueue(json.dumps(snapshot))
+        logger.info(f"New WebSocket connection: {websocket.client}. Total connections: {len(self.clients)}")
+        return client
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        if client.writer_task is not None and client.writer_task is not asyncio.current_task():
+            client.writer_task.cancel()
+        logger.info(f"WebSocket disconnected: {websocket.client}. Total connections: {len(self.clients)}")
+
+    def update_last_pong(self, websocket: WebSocket):
+        """Updates the timestamp for a given websocket when a pong is received."""
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.last_pong = datetime.utcnow()
+            logger.debug(f"Pong received from {websocket.client}")
+
+    def handle_client_message(self, websocket: WebSocket, data: str):
+        """Handles a text frame from a client: pongs and (un)subscribe requests."""
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        try:
+            message = json.loads(data)
+        except ValueError:
+            logger.debug(f"Ignoring non-JSON message from {websocket.client}: {data}")
+            return
+        if not isinstance(message, dict):
+            return
+        message_type = message.get("type")
+        if message_type == "pong":
+            self.update_last_pong(websocket)
+        elif message_type in ("subscribe", "unsubscribe"):
+            file_ids = {int(i) for i in message.get("file_ids") or [] if str(i).isdigit()}
+            owners = {str(o) for o in message.get("owners") or []}
+            job_ids = {str(j) for j in message.get("job_ids") or []}
+            if message_type == "subscribe":
+                client.file_ids |= file_ids
+                client.owners |= owners
+                client.job_ids |= job_ids
+            else:
+                client.file_ids -= file_ids
+                client.owners -= owners
+                client.job_ids -= job_ids
+
+    def publish(self, message: dict):
+        """
+        Records a status update for the next flush, replacing any unsent
+        update for the same file. Never blocks.
+        """
+        file_id = message.get("file_id")
+        if file_id is None:
+            return
+        self._pending[file_id] = message
+        if message.get("status") in IN_FLIGHT_STATUSES:
+            self._in_flight[file_id] = message
+            self._in_flight.move_to_end(file_id)
+            while len(self._in_flight) > WS_SNAPSHOT_MAX_FILES:
+                self._in_flight.popitem(last=False)
+        else:
+            self._in_flight.pop(file_id, None)
+
+    def flush(self) -> int:
+        """
+        Sends all pending updates, one JSON array per client containing the
+        files it is subscribed to. Returns the number of frames queued.
+        """
+        if not self._pending:
+            return 0
+        started = time.perf_counter()
+        batch = list(self._pending.values())
+        self._pending = {}
+        shared_text = None
+        frames = 0
+        for client in list(self.clients.values()):
+            if client.subscribed_to_all:
+                if shared_text is None:
+                    shared_text = json.dumps(batch)
+                client.enqueue(shared_text)
+            else:
+                wanted = [m for m in batch if client.wants(m.get("file_id"), m.get("owner"))]
+                if not wanted:
+                    continue
+                client.enqueue(json.dumps(wanted))
+            frames += 1
+        WS_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        logger.debug(f"Flushed {len(batch)} status updates in {frames} frames.")
+        return frames
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing status updates: {e}")
+
+    def publish_job(self, event: dict):
+        """Queues a quarantine job progress event for the clients subscribed to that job."""
+        text = None
+        for client in list(self.clients.values()):
+            if event.get("job_id") in client.job_ids:
+                text = text or json.dumps(event)
+                client.enqueue(text)
+
+    def broadcast(self, text: str):
+        """Queues a message for all clients regardless of their subscriptions."""
+        for client in list(self.clients.values()):
+            client.enqueue(text)
+
+    async def close(self, websocket: WebSocket, code: int = 1000):
+        try:
+            await asyncio.wait_for(websocket.close(code=code), timeout=self.send_timeout)
+        except Exception:
+            pass
+        finally:
+            self.disconnect(websocket)
+
+    async def _writer(self, client: ClientConnection):
+        websocket = client.websocket
+        try:
+            while True:
+                text = await client.queue.get()
+                with WS_SEND_SECONDS.time():
+                    await asyncio.wait_for(websocket.send_text(text), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.warning(f"WebSocket client {websocket.client} stalled for {self.send_timeout}s. Disconnecting.")
+            await self.close(websocket, code=1008)
+        except Exception as e:
+            logger.info(f"Could not send to WebSocket client {websocket.client}: {e}")
+            self.disconnect(websocket)
@@ -121,26 +121,41 @@ function App() {
           return;
         }
 
+        // The server asks for a full reload when it had to discard updates for us
+        if (messageData.type === 'resync') {
+          fetchFiles();
+          return;
+        }
+
         // console.log('WebSocket message received:', messageData);
-        
+
+        // Status updates arrive coalesced, as an array with the latest status per file.
+        // Anything else (e.g. quarantine job progress) is not a file update.
+        const updates = (Array.isArray(messageData) ? messageData : [messageData])
+          .filter((update) => update.file_id != null && update.type !== 'quarantine_job');
+        if (updates.length === 0) {
+          return;
+        }
+
         setFiles(prevFiles => {
           const filesMap = new Map(prevFiles.map(f => [f.id, f]));
-          const updatedFile = {
-            ...(filesMap.get(messageData.file_id) || { id: messageData.file_id }),
-            scan_status: messageData.status,
-            scan_details: messageData.details,
-            checksum: messageData.checksum,
-          };
-          filesMap.set(messageData.file_id, updatedFile);
+          let hasNewFile = false;
+          updates.forEach(update => {
+            if (!filesMap.has(update.file_id)) {
+              hasNewFile = true;
+            }
+            filesMap.set(update.file_id, {
+              ...(filesMap.get(update.file_id) || { id: update.file_id }),
+              scan_status: update.status,
+              scan_details: update.details,
+              checksum: update.checksum,
+            });
+          });
 
           // If it's a new file, we might not have all details (like filename)
-          // A robust way is to re-fetch the full file info
-          if (!prevFiles.some(f => f.id === messageData.file_id)) {
-            const apiUrl = process.env.REACT_APP_API_URL || 'http://localhost:8000';
-            fetch(`${apiUrl}/files/`)
-              .then(res => res.json())
-              .then(allFiles => setFiles(allFiles))
-              .catch(err => console.error("Failed to re-fetch files after update:", err));
+          // A robust way is to re-fetch the full file info, once per batch
+          if (hasNewFile) {
+            fetchFiles();
           }
 
           return Array.from(filesMap.values()).sort((a, b) => (a.id < b.id) ? 1 : -1);
@@ -1,24 +1,32 @@
 import React, { useState, useEffect } from 'react';
 
+const MAX_LOG_LINES = 500;
+
+// EventSource cannot send an Authorization header; with SSO the token goes in the query string
+const logStreamUrl = () => {
+  const params = new URLSearchParams({ level: 'INFO' });
+  const token = localStorage.getItem('access_token');
+  if (token) {
+    params.set('access_token', token);
+  }
+  return `http://localhost:8000/logs/stream?${params}`;
+};
+
 const AdminPanel = () => {
   const [logs, setLogs] = useState([]);
   const [quarantinedFiles, setQuarantinedFiles] = useState([]);
 
   useEffect(() => {
-    fetchLogs();
     fetchQuarantinedFiles();
+    // Sends the buffered entries first, then new ones as they are logged
+    const logStream = new EventSource(logStreamUrl());
+    logStream.onmessage = (event) => {
+      const entry = JSON.parse(event.data);
+      setLogs((previous) => [...previous.slice(-(MAX_LOG_LINES - 1)), entry]);
+    };
+    return () => logStream.close();
   }, []);
 
-  const fetchLogs = async () => {
-    try {
-      const response = await fetch('http://localhost:8000/logs/realtime');
-      const data = await response.json();
-      setLogs(data.logs);
-    } catch (error) {
-      console.error('Error fetching logs:', error);
-    }
-  };
-
   const fetchQuarantinedFiles = async () => {
     try {
       const response = await fetch('http://localhost:8000/quarantine/files');
@@ -31,8 +39,8 @@ const AdminPanel = () => {
 
   const handleReleaseFile = async (fileId) => {
     try {
-      const response = await fetch(`http://localhost:8000/quarantine/files/${fileId}`, {
-        method: 'DELETE',
+      const response = await fetch(`http://localhost:8000/quarantine/files/${fileId}/release`, {
+        method: 'POST',
       });
       if (response.ok) {
         alert('File released successfully!');
@@ -45,6 +53,21 @@ const AdminPanel = () => {
     }
   };
 
+  const handleDeleteFile = async (fileId) => {
+    try {
+      const response = await fetch(`http://localhost:8000/quarantine/files/${fileId}`, {
+        method: 'DELETE',
+      });
+      if (response.ok) {
+        fetchQuarantinedFiles();
+      } else {
+        alert('Failed to delete file.');
+      }
+    } catch (error) {
+      console.error('Error deleting file:', error);
+    }
+  };
+
   return (
     <div>
       <h2>Admin Panel</h2>
@@ -52,8 +75,10 @@ const AdminPanel = () => {
       <section>
         <h3>Logs</h3>
         <ul>
-          {logs.map((log, index) => (
-            <li key={index}>{log}</li>
+          {logs.map((log) => (
+            <li key={`${log.source}-${log.seq}`}>
+              {log.time} {log.level} [{log.source}] {log.logger}: {log.message}
+            </li>
           ))}
         </ul>
       </section>
@@ -61,9 +86,10 @@ const AdminPanel = () => {
       <section>
         <h3>Quarantined Files</h3>
         <ul>
-          {quarantinedFiles.map((file, index) => (
-            <li key={index}>
-              {file} <button onClick={() => handleReleaseFile(file)}>Release</button>
+          {quarantinedFiles.map((file) => (
+            <li key={file.id}>
+              {file.filename} <button onClick={() => handleReleaseFile(file.id)}>Release</button>{' '}
+              <button onClick={() => handleDeleteFile(file.id)}>Delete</button>
             </li>
           ))}
         </ul>
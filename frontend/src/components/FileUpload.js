@@ -2,6 +2,67 @@ import React, { useState } from 'react';
 import './FileUpload.css';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
+// Attempts per chunk before the upload is given up; a later retry resumes it
+const CHUNK_ATTEMPTS = 3;
+
+// Files are sent through a resumable upload session (see backend/resumable_upload.py).
+// The session id is remembered per file, so uploading the same file again after a
+// failure only sends the chunks the server does not have yet.
+const sessionKey = (file) => `upload-session:${file.name}:${file.size}:${file.lastModified}`;
+
+const errorMessage = async (response, fallback) => {
+  const errorData = await response.json().catch(() => ({ detail: fallback }));
+  const detail = errorData.detail;
+  return typeof detail === 'string' ? detail : (detail && detail.message) || fallback;
+};
+
+const openSession = async (file) => {
+  const savedId = localStorage.getItem(sessionKey(file));
+  if (savedId) {
+    const response = await fetch(`${API_URL}/uploads/sessions/${savedId}`);
+    if (response.ok) {
+      return response.json();
+    }
+    // Expired or aborted; start over
+    localStorage.removeItem(sessionKey(file));
+  }
+  const response = await fetch(`${API_URL}/uploads/sessions`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: file.name, total_size: file.size }),
+  });
+  if (!response.ok) {
+    throw new Error(await errorMessage(response, 'Failed to start upload'));
+  }
+  const session = await response.json();
+  localStorage.setItem(sessionKey(file), session.session_id);
+  return session;
+};
+
+const putChunk = async (session, file, index) => {
+  const start = index * session.chunk_size;
+  const chunk = file.slice(start, Math.min(start + session.chunk_size, file.size));
+  for (let attempt = 1; ; attempt++) {
+    let response = null;
+    try {
+      response = await fetch(`${API_URL}/uploads/sessions/${session.session_id}/chunks/${index}`, {
+        method: 'PUT',
+        body: chunk,
+      });
+    } catch (error) {
+      // Connection dropped; try again below
+      if (attempt >= CHUNK_ATTEMPTS) throw error;
+    }
+    if (response && response.ok) {
+      return;
+    }
+    // A rejected chunk will not be accepted on a retry either
+    if (response && (response.status < 500 || attempt >= CHUNK_ATTEMPTS)) {
+      throw new Error(await errorMessage(response, `Failed to upload chunk ${index}`));
+    }
+    await new Promise((resolve) => setTimeout(resolve, 1000 * attempt));
+  }
+};
 
 const FileUpload = ({ onUploadSuccess }) => {
   const [selectedFile, setSelectedFile] = useState(null);
@@ -20,31 +81,38 @@ const FileUpload = ({ onUploadSuccess }) => {
     if (event.dataTransfer.files && event.dataTransfer.files[0]) {
       setSelectedFile(event.dataTransfer.files[0]);
       setMessage('');
-      handleUploadAuto(event.dataTransfer.files[0]);
+      uploadFile(event.dataTransfer.files[0]); // Automatisk uppladdning vid drag-and-drop
     }
   };
 
-  // Automatisk uppladdning vid drag-and-drop
-  const handleUploadAuto = async (file) => {
-    if (!file) return;
+  const uploadFile = async (file) => {
     setMessage('Uploading...');
-    const formData = new FormData();
-    formData.append('file', file);
     try {
-      const response = await fetch(`${API_URL}/upload/`, {
+      const session = await openSession(file);
+      if (session.file_id == null) {
+        const received = new Set(session.received_chunks);
+        for (let index = 0; index < session.total_chunks; index++) {
+          if (!received.has(index)) {
+            await putChunk(session, file, index);
+          }
+          setMessage(`Uploading... ${Math.round(((index + 1) / session.total_chunks) * 100)}%`);
+        }
+      }
+      const response = await fetch(`${API_URL}/uploads/sessions/${session.session_id}/complete`, {
         method: 'POST',
-        body: formData,
       });
       if (!response.ok) {
-        const errorData = await response.json().catch(() => ({ detail: 'An unknown error occurred.' }));
-        throw new Error(errorData.detail || 'Failed to upload file');
+        throw new Error(await errorMessage(response, 'Failed to upload file'));
       }
+      localStorage.removeItem(sessionKey(file));
+
       const result = await response.json();
       setMessage(`File uploaded successfully! Status: ${result.status}`);
+      // Clear the file input after successful upload
       document.querySelector('input[type="file"]').value = '';
       setSelectedFile(null);
       if (onUploadSuccess) {
-        onUploadSuccess(result);
+        onUploadSuccess(result); // Skicka upp filobjektet till App.js
       }
     } catch (error) {
       setMessage(`Error: ${error.message}`);
@@ -69,39 +137,11 @@ const FileUpload = ({ onUploadSuccess }) => {
       setMessage('Please select a file first!');
       return;
     }
-
-    const formData = new FormData();
-    formData.append('file', selectedFile);
-
-    setMessage('Uploading...');
-
-    try {
-      const response = await fetch(`${API_URL}/upload/`, {
-        method: 'POST',
-        body: formData,
-      });
-
-      if (!response.ok) {
-        const errorData = await response.json().catch(() => ({ detail: 'An unknown error occurred.' }));
-        throw new Error(errorData.detail || 'Failed to upload file');
-      }
-
-      const result = await response.json();
-      setMessage(`File uploaded successfully! Status: ${result.status}`);
-      // Clear the file input after successful upload
-      document.querySelector('input[type="file"]').value = '';
-      setSelectedFile(null);
-      if (onUploadSuccess) {
-        onUploadSuccess(result); // Skicka upp filobjektet till App.js
-      }
-    } catch (error) {
-      setMessage(`Error: ${error.message}`);
-      console.error('Upload failed:', error);
-    }
+    await uploadFile(selectedFile);
   };
 
   return (
-    <div 
+    <div
       className={`file-upload ${dragActive ? 'drag-active' : ''}`}
       onDragOver={handleDragOver}
       onDragLeave={handleDragLeave}
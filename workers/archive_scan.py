@@ -0,0 +1,249 @@
+import logging
+import lzma
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import clamd
+
+# Expand zip/tar archives in the worker and scan their members in parallel
+ARCHIVE_SCAN_ENABLED = os.getenv("ARCHIVE_SCAN_ENABLED", "false").lower() == "true"
+# Member scans of one worker process running at once (each holds its own clamd connection)
+ARCHIVE_SCAN_CONCURRENCY = max(1, int(os.getenv("ARCHIVE_SCAN_CONCURRENCY", "4")))
+# Smaller archives are cheaper to send to clamd in one piece
+ARCHIVE_MIN_BYTES = int(os.getenv("ARCHIVE_MIN_BYTES", str(8 * 1024 * 1024)))
+# Archive bomb limits; an archive exceeding one is scanned whole by clamd instead
+ARCHIVE_MAX_MEMBERS = int(os.getenv("ARCHIVE_MAX_MEMBERS", "10000"))
+ARCHIVE_MAX_TOTAL_BYTES = int(os.getenv("ARCHIVE_MAX_TOTAL_BYTES", str(4 * 1024 * 1024 * 1024)))
+ARCHIVE_MAX_RATIO = int(os.getenv("ARCHIVE_MAX_RATIO", "100"))
+# Archives nested deeper than this are scanned as a single member
+ARCHIVE_MAX_DEPTH = int(os.getenv("ARCHIVE_MAX_DEPTH", "2"))
+# Extracted members are kept in memory up to this size, then spill to a temporary file
+ARCHIVE_SPOOL_MEMORY_BYTES = int(os.getenv("ARCHIVE_SPOOL_MEMORY_BYTES", str(8 * 1024 * 1024)))
+
+COPY_CHUNK_SIZE = 1024 * 1024
+# Infected members named in scan_details
+MAX_REPORTED_MEMBERS = 10
+
+
+class ArchiveLimitExceeded(Exception):
+    """The archive is too large, too deep or too compressed to expand safely."""
+
+
+# Archives that fail with one of these are scanned whole instead (corrupt, truncated, unsupported)
+UNEXPANDABLE_ERRORS = (ArchiveLimitExceeded, zipfile.BadZipFile, NotImplementedError, tarfile.TarError, EOFError, zlib.error, lzma.LZMAError, OSError)
+
+
+def archive_kind(head: bytes):
+    """'zip', 'tar' (possibly compressed) or None, from the first bytes of a file."""
+    if head.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+        return "zip"
+    if head[257:262] == b"ustar" or head.startswith((b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00")):
+        return "tar"
+    return None
+
+
+def read_head(fileobj) -> bytes:
+    head = fileobj.read(512)
+    fileobj.seek(0)
+    return head
+
+
+class ArchiveScanResult:
+    def __init__(self):
+        self.scanned = 0
+        self.infected = []  # (member name, signature)
+
+    def verdict(self):
+        """(status, details) in the shape of a clamd result."""
+        if not self.infected:
+            return "OK", f"File is clean ({self.scanned} archive members scanned)"
+        found = [f"{signature} in {name}" for name, signature in self.infected[:MAX_REPORTED_MEMBERS]]
+        if len(self.infected) > MAX_REPORTED_MEMBERS:
+            found.append(f"and {len(self.infected) - MAX_REPORTED_MEMBERS} more")
+        return "FOUND", "; ".join(found)
+
+
+class _ArchiveScan:
+    """State of one archive being expanded: limits, in-flight member scans and results."""
+
+    def __init__(self, scanner, archive_size: int, on_progress):
+        self.scanner = scanner
+        self.max_total_bytes = min(ARCHIVE_MAX_TOTAL_BYTES, max(archive_size, 1) * ARCHIVE_MAX_RATIO)
+        self.total_bytes = 0
+        self.members = 0
+        self.result = ArchiveScanResult()
+        self.futures = []
+        self.lock = threading.Lock()
+        self.on_progress = on_progress
+        # Bounds the extracted members waiting for a clamd connection
+        self.slots = threading.BoundedSemaphore(scanner.concurrency * 2)
+        self.stopped = threading.Event()
+
+    def expand(self, fileobj, prefix: str, depth: int):
+        """Extracts the members of a seekable archive file and submits them for scanning."""
+        kind = archive_kind(read_head(fileobj))
+        if kind == "zip":
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if info.flag_bits & 0x1:
+                        # Cannot be extracted; clamd has its own handling of encrypted archives
+                        raise ArchiveLimitExceeded(f"{prefix}{info.filename} is encrypted")
+                    with archive.open(info) as member:
+                        if not self.add_member(member, prefix + info.filename, depth):
+                            return
+        else:
+            with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+                for info in archive:
+                    if not info.isfile():
+                        continue
+                    if not self.add_member(archive.extractfile(info), prefix + info.name, depth):
+                        return
+
+    def add_member(self, member, name: str, depth: int) -> bool:
+        """Spools one member and scans (or expands) it. False once scanning should stop."""
+        if self.stopped.is_set():
+            return False
+        self.members += 1
+        if self.members > ARCHIVE_MAX_MEMBERS:
+            raise ArchiveLimitExceeded(f"More than {ARCHIVE_MAX_MEMBERS} archive members")
+
+        spool = tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_MEMORY_BYTES)
+        try:
+            for chunk in iter(lambda: member.read(COPY_CHUNK_SIZE), b""):
+                self.total_bytes += len(chunk)
+                if self.total_bytes > self.max_total_bytes:
+                    raise ArchiveLimitExceeded(f"Archive expands to more than {self.max_total_bytes} bytes")
+                spool.write(chunk)
+            spool.seek(0)
+
+            if depth < ARCHIVE_MAX_DEPTH and archive_kind(read_head(spool)):
+                self.members -= 1  # counted through its own members
+                self.expand(spool, name + "!", depth + 1)
+                spool.close()
+                return not self.stopped.is_set()
+
+            self.slots.acquire()
+            self.futures.append(self.scanner.executor.submit(self.scan_member, spool, name))
+            spool = None  # closed by scan_member
+            return True
+        finally:
+            if spool is not None:
+                spool.close()
+
+    def scan_member(self, spool, name: str):
+        try:
+            if self.stopped.is_set():
+                return
+            with self.scanner.clamd_pool.connection() as clamd_socket_wrapper:
+                if clamd_socket_wrapper[0] is None:
+                    raise clamd.ConnectionError("No ClamAV connection for archive members")
+                try:
+                    result, _ = clamd_socket_wrapper[0].instream_chunks(iter(lambda: spool.read(COPY_CHUNK_SIZE), b""), name=name)
+                except clamd.ConnectionError:
+                    # Not returned to the pool; the next member scan connects again
+                    clamd_socket_wrapper[0] = None
+                    raise
+            status, reason = result[name]
+            if status == "ERROR":
+                raise RuntimeError(f"clamd could not scan {name}: {reason}")
+            with self.lock:
+                self.result.scanned += 1
+                if status == "FOUND":
+                    self.result.infected.append((name, reason))
+                    # One infected member decides the verdict
+                    self.stopped.set()
+                scanned = self.result.scanned
+            if self.on_progress:
+                self.on_progress(scanned)
+        finally:
+            spool.close()
+            self.slots.release()
+
+    def wait(self):
+        """Waits for all member scans; the first failure is raised once they are done."""
+        error = None
+        for future in self.futures:
+            try:
+                future.result()
+            except Exception as e:
+                self.stopped.set()
+                error = error or e
+        if error:
+            raise error
+        return self.result
+
+
+class ArchiveScanner:
+    """
+    Scans zip and tar archives member by member on a pool of clamd connections.
+
+    clamd scans a single file on one thread, so a large archive sent in one
+    piece takes as long as all of its members in a row and reports nothing
+    until it is done. The scanner extracts members one at a time while the
+    members before them are being scanned, ARCHIVE_SCAN_CONCURRENCY at once.
+    Nested archives are expanded up to ARCHIVE_MAX_DEPTH. An archive that
+    exceeds one of the bomb limits, is encrypted or cannot be read is left to
+    clamd (scan() returns None), which applies its own limits. A clamd
+    connection that cannot be made or is lost raises clamd.ConnectionError,
+    like a scan of the whole file would.
+    """
+
+    def __init__(self, clamd_pool, concurrency: int = ARCHIVE_SCAN_CONCURRENCY):
+        self.clamd_pool = clamd_pool
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="archive-scan")
+
+    def scan(self, storage, file_path: str, on_progress=None):
+        """
+        Scans a stored archive. Returns an ArchiveScanResult, or None when the
+        file is not an archive worth expanding and should be scanned whole.
+        on_progress(members_scanned) is called from the scan threads.
+        """
+        size = storage.stat(file_path).st_size
+        if size < ARCHIVE_MIN_BYTES:
+            return None
+        local_path = storage.local_path(file_path)
+        source = open(local_path, "rb") if local_path else storage.open(file_path)
+        fileobj = source
+        try:
+            if not local_path:
+                # zip needs to seek; other storage is copied to a local temporary file first
+                fileobj = tempfile.TemporaryFile()
+                shutil.copyfileobj(source, fileobj, COPY_CHUNK_SIZE)
+                fileobj.seek(0)
+            if not archive_kind(read_head(fileobj)):
+                return None
+            started = time.monotonic()
+            archive_scan = _ArchiveScan(self, size, on_progress)
+            try:
+                archive_scan.expand(fileobj, "", 1)
+            except Exception as e:
+                archive_scan.stopped.set()
+                # Let the member scans already submitted finish before giving up on them
+                try:
+                    archive_scan.wait()
+                except Exception:
+                    pass
+                if not isinstance(e, UNEXPANDABLE_ERRORS):
+                    raise
+                logging.warning(f"Not expanding {file_path}: {e}. Scanning it whole.")
+                return None
+            result = archive_scan.wait()
+            logging.info(f"Scanned {result.scanned} members of {file_path} in {time.monotonic() - started:.1f}s.")
+            return result
+        finally:
+            if fileobj is not source:
+                fileobj.close()
+            source.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
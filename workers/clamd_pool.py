@@ -0,0 +1,61 @@
+import functools
+import logging
+import queue
+from contextlib import contextmanager
+
+
+class ClamdPool:
+    """
+    Fixed-size pool of clamd client connections shared by the scan threads.
+
+    clamd client objects keep per-call socket state and must not be used by
+    two threads at once, so each in-flight scan borrows its own connection.
+    Connections are created lazily through `factory` and a connection that
+    was replaced after a reconnect is returned to the pool in its place.
+    """
+
+    def __init__(self, size: int, factory):
+        self.size = size
+        self._factory = factory
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(None)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection for the duration of the block.
+
+        Yields a one-element list so that code which reconnects (such as
+        process_message) can swap in a new connection.
+        """
+        clamd_socket = self._idle.get()
+        wrapper = [clamd_socket]
+        try:
+            if wrapper[0] is None:
+                wrapper[0] = self._factory()
+            yield wrapper
+        finally:
+            self._idle.put(wrapper[0])
+
+
+class ThreadSafeChannel:
+    """
+    Proxy for a pika BlockingChannel that can be used from scan threads.
+
+    pika connections are not thread-safe, so publishes are handed to the
+    connection's I/O thread with add_callback_threadsafe.
+    """
+
+    def __init__(self, connection, channel):
+        self._connection = connection
+        self._channel = channel
+
+    def basic_publish(self, **kwargs):
+        self._connection.add_callback_threadsafe(functools.partial(self._safe_publish, kwargs))
+
+    def _safe_publish(self, kwargs):
+        if not self._channel.is_open:
+            logging.warning(f"Channel closed, dropping publish to {kwargs.get('routing_key')}.")
+            return
+        self._channel.basic_publish(**kwargs)
@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import os
+import socket
+import struct
+
+import clamd
+
+# 'instream' streams file bytes to clamd over the socket, 'scan' lets clamd
+# open the path itself (requires the uploads volume inside the clamav container).
+CLAMD_SCAN_MODE = os.getenv("CLAMD_SCAN_MODE", "instream").lower()
+# Must stay below StreamMaxLength in clamd.conf (25 MiB by default).
+INSTREAM_CHUNK_SIZE = int(os.getenv("INSTREAM_CHUNK_SIZE", str(1024 * 1024)))
+
+INSTREAM_SIZE_LIMIT_REPLY = "INSTREAM size limit exceeded. ERROR"
+
+
+class StreamingClamdSocket(clamd.ClamdNetworkSocket):
+    """
+    clamd network client that can stream a file with INSTREAM in large chunks.
+
+    The python-clamd `instream` helper sends 1 KiB chunks and needs a separate
+    read to compute a checksum; `instream_file` reads each chunk once and uses
+    it both for the SHA-256 and for the socket.
+    """
+
+    def instream_chunks(self, chunks, name: str = "stream"):
+        """
+        Streams an iterable of byte chunks to clamd.
+        Returns ({name: (status, reason)}, sha256 hexdigest).
+        """
+        sha256_hash = hashlib.sha256()
+        try:
+            self._init_socket()
+            self._send_command('INSTREAM')
+            try:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    sha256_hash.update(chunk)
+                    self.clamd_socket.sendall(struct.pack('!L', len(chunk)))
+                    self.clamd_socket.sendall(chunk)
+                self.clamd_socket.sendall(struct.pack('!L', 0))
+            except socket.error as e:
+                # clamd drops the connection once StreamMaxLength is exceeded;
+                # its reply explaining why is still readable.
+                logging.warning(f"clamd closed the stream early: {e}")
+            result = self._recv_response()
+        finally:
+            self._close_socket()
+
+        if not result:
+            raise clamd.ConnectionError("clamd closed the connection without a reply")
+        if result == INSTREAM_SIZE_LIMIT_REPLY:
+            raise clamd.BufferTooLongError(result)
+        _, reason, status = self._parse_response(result)
+        return {name: (status, reason)}, sha256_hash.hexdigest()
+
+    def instream_file(self, file_path: str, chunk_size: int = INSTREAM_CHUNK_SIZE):
+        """Streams a file to clamd, hashing it in the same read. Returns (result, checksum)."""
+        with open(file_path, "rb") as f:
+            return self.instream_chunks(iter(lambda: f.read(chunk_size), b""), name=file_path)
+
+
+def scan_file(clamd_socket, file_path: str):
+    """
+    Scans a file using the configured CLAMD_SCAN_MODE.
+
+    Returns (result, checksum) where result has the same shape as
+    clamd's scan() ({file_path: (status, reason)}). checksum is only
+    available in instream mode, otherwise None.
+    """
+    if CLAMD_SCAN_MODE == "instream" and hasattr(clamd_socket, "instream_file"):
+        return clamd_socket.instream_file(file_path)
+    return clamd_socket.scan(file_path), None
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The worker image gets database/, storage.py, scan_queues.py and the other
+# shared modules copied in from backend/ (see Dockerfile); so do the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "backend"))
+
+# pytest puts this directory back in front for each test module; importing the
+# shared database modules now keeps the old copies in workers/database out
+import database.database  # noqa: E402,F401
+import database.models  # noqa: E402,F401
+import database.settings_cache  # noqa: E402,F401
@@ -0,0 +1,133 @@
+"""
+Minimal fake clamd server for tests and local development.
+
+Speaks the subset of the clamd protocol that the worker uses (PING, VERSION,
+SCAN and INSTREAM, with either the 'n' or 'z' command prefix). Content that
+contains the EICAR test string is reported as infected, everything else is OK.
+
+Run standalone with: python fake_clamd.py --port 3310
+"""
+import argparse
+import socketserver
+import struct
+import threading
+
+# Split so that the string in this source file is not itself detected.
+EICAR = b"X5O!P%@AP[4\\PZX54(P^)7CC)7}$" + b"EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"
+EICAR_SIGNATURE = "Eicar-Test-Signature"
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server.fake
+        prefix = self.request.recv(1)
+        if prefix not in (b"n", b"z"):
+            return
+        terminator = b"\n" if prefix == b"n" else b"\0"
+        command = self._read_until(terminator).decode()
+        name, _, argument = command.partition(" ")
+        server.commands.append(name)
+
+        if name == "PING":
+            reply = "PONG"
+        elif name == "VERSION":
+            reply = f"ClamAV 1.0.0/{server.signature_version}/Mon Jan  1 00:00:00 2024"
+        elif name == "SCAN":
+            try:
+                with open(argument, "rb") as f:
+                    reply = f"{argument}: {server.verdict(f.read())}"
+            except OSError:
+                reply = f"{argument}: File path check failure: No such file or directory. ERROR"
+        elif name == "INSTREAM":
+            reply = self._instream(server)
+        else:
+            reply = "UNKNOWN COMMAND"
+        self.request.sendall(reply.encode() + terminator)
+
+    def _read_until(self, terminator):
+        data = b""
+        while not data.endswith(terminator):
+            byte = self.request.recv(1)
+            if not byte:
+                break
+            data += byte
+        return data.rstrip(terminator)
+
+    def _read_exact(self, size):
+        data = bytearray()
+        while len(data) < size:
+            part = self.request.recv(size - len(data))
+            if not part:
+                raise ConnectionError("client closed the stream")
+            data.extend(part)
+        return bytes(data)
+
+    def _instream(self, server):
+        total = 0
+        tail = b""
+        found = False
+        sizes = []
+        while True:
+            (length,) = struct.unpack("!L", self._read_exact(4))
+            if length == 0:
+                break
+            chunk = self._read_exact(length)
+            sizes.append(length)
+            total += length
+            if server.max_stream_size is not None and total > server.max_stream_size:
+                server.chunk_sizes.append(sizes)
+                return "INSTREAM size limit exceeded. ERROR"
+            # Keep an overlap so signatures spanning two chunks are still seen.
+            window = tail + chunk
+            found = found or EICAR in window
+            tail = window[-len(EICAR):]
+        server.chunk_sizes.append(sizes)
+        return f"stream: {EICAR_SIGNATURE} FOUND" if found else "stream: OK"
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class FakeClamd:
+    """Threaded fake clamd listening on a local TCP port (0 picks a free port)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, signature_version: str = "27000", max_stream_size: int = None):
+        self.host = host
+        self.signature_version = signature_version
+        self.max_stream_size = max_stream_size
+        self.commands = []
+        self.chunk_sizes = []
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    def verdict(self, content: bytes) -> str:
+        return f"{EICAR_SIGNATURE} FOUND" if EICAR in content else "OK"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake clamd server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3310)
+    args = parser.parse_args()
+    fake = FakeClamd(args.host, args.port)
+    print(f"Fake clamd listening on {fake.host}:{fake.port}")
+    fake._server.serve_forever()
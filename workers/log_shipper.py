@@ -0,0 +1,121 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+import pika
+
+from log_buffer import LOG_BUFFER_LEVEL, LOG_EXCHANGE, record_to_entry
+
+# Entries sent per message to the log exchange
+LOG_SHIP_BATCH_SIZE = 100
+# Longest an entry waits for its batch to fill up
+LOG_SHIP_INTERVAL = 0.5
+
+# File id of the message the current scan thread is working on
+_context = threading.local()
+
+
+def set_log_file_id(file_id):
+    """Tags the log records of this thread with file_id until it is set to None."""
+    _context.file_id = file_id
+
+
+class FileIdFilter(logging.Filter):
+    """Adds the current thread's file id to records that do not have one."""
+
+    def filter(self, record):
+        if getattr(record, "file_id", None) is None:
+            record.file_id = getattr(_context, "file_id", None)
+        return True
+
+
+class LogShipper(logging.Handler):
+    """
+    Sends this worker's log records to the backends through LOG_EXCHANGE.
+
+    emit() only puts the entry on a bounded queue; a background thread with
+    its own RabbitMQ connection publishes them in batches. A batch that
+    could not be published is kept and sent again once RabbitMQ is back,
+    while newer entries wait on the queue. Entries are dropped rather than
+    blocking logging when that queue is full, and the number dropped is
+    logged once RabbitMQ is back.
+    """
+
+    def __init__(self, connection_parameters, source: str, level=LOG_BUFFER_LEVEL, max_queued: int = 10000):
+        super().__init__(level)
+        self.source = source
+        self._parameters = connection_parameters
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._dropped = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def emit(self, record):
+        try:
+            self._queue.put_nowait(record_to_entry(record, self.source))
+        except queue.Full:
+            self._dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _next_batch(self):
+        """Entries queued within the next LOG_SHIP_INTERVAL, up to a batch."""
+        batch = []
+        deadline = time.monotonic() + LOG_SHIP_INTERVAL
+        while len(batch) < LOG_SHIP_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is not None:
+                batch.append(entry)
+        return batch
+
+    def _run(self):
+        connection = None
+        # Last batch that could not be published; it is sent before any newer entries
+        batch = []
+        while not self._stopped.is_set():
+            try:
+                if connection is None or connection.is_closed:
+                    connection = pika.BlockingConnection(self._parameters)
+                    channel = connection.channel()
+                    channel.exchange_declare(exchange=LOG_EXCHANGE, exchange_type='fanout', durable=True)
+                if not batch:
+                    batch = self._next_batch()
+                    if self._dropped:
+                        # Not through logging: that would only queue it behind the entries being dropped
+                        notice = logging.makeLogRecord({"name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                                                        "msg": f"Dropped {self._dropped} log records"})
+                        batch.append(record_to_entry(notice, self.source))
+                        self._dropped = 0
+                # Answers heartbeats while the worker is quiet
+                connection.process_data_events(time_limit=0)
+                if batch:
+                    channel.basic_publish(exchange=LOG_EXCHANGE, routing_key='', body=json.dumps(batch),
+                                          properties=pika.BasicProperties(delivery_mode=1))
+                    batch = []
+            except Exception:
+                # Keep what is logged meanwhile bounded by the queue; try again later
+                connection = None
+                self._stopped.wait(5)
+        if connection is not None and connection.is_open:
+            connection.close()
+
+    def close(self):
+        self._stopped.set()
+        try:
+            # Wakes the thread if it is waiting for entries
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        super().close()
@@ -0,0 +1,45 @@
+import logging
+import threading
+
+MAINTENANCE_MODE_KEY = "MAINTENANCE_MODE"
+
+
+class MaintenancePause:
+    """
+    Stops consuming scan messages while maintenance mode is on.
+
+    Instead of taking messages only to postpone them, the worker cancels its
+    consumers when MAINTENANCE_MODE is switched on and starts them again when
+    it is switched off, so the backlog waits in RabbitMQ at no cost. Changes
+    arrive as settings notifications (see SettingsCache.add_change_callback)
+    on the listener thread; consumers are started and cancelled on the pika
+    connection thread through add_callback_threadsafe.
+    """
+
+    def __init__(self, connection, start_consumers, stop_consumers, is_active):
+        self._connection = connection
+        self._start_consumers = start_consumers
+        self._stop_consumers = stop_consumers
+        self._is_active = is_active
+        self._lock = threading.Lock()
+        self.consuming = False
+
+    def on_setting_changed(self, key):
+        """Settings change callback; key is None when anything may have changed."""
+        if key not in (None, MAINTENANCE_MODE_KEY):
+            return
+        # Read the setting here, off the connection thread
+        active = self._is_active()
+        self._connection.add_callback_threadsafe(lambda: self.apply(active))
+
+    def apply(self, maintenance_active: bool):
+        """Starts or cancels the consumers to match maintenance mode. Runs on the connection thread."""
+        with self._lock:
+            if maintenance_active and self.consuming:
+                self._stop_consumers()
+                self.consuming = False
+                logging.info("Maintenance mode is on. Stopped consuming scan messages.")
+            elif not maintenance_active and not self.consuming:
+                self._start_consumers()
+                self.consuming = True
+                logging.info("Consuming scan messages.")
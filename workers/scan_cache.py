@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from database.models import ScanVerdict, ScanStatus
+
+# Only definitive verdicts are worth caching; errors must always be retried.
+CACHEABLE_STATUSES = (ScanStatus.CLEAN.value, ScanStatus.INFECTED.value)
+
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "10000"))
+# How long the ClamAV signature version is trusted before asking clamd again.
+SIGNATURE_VERSION_TTL = float(os.getenv("SIGNATURE_VERSION_TTL", "60"))
+
+
+def parse_signature_version(version_string: str):
+    """
+    Extracts the signature database version from a clamd VERSION reply,
+    e.g. 'ClamAV 1.0.5/27265/Mon Apr 29 08:26:00 2024' -> '27265'.
+    """
+    if not version_string:
+        return None
+    parts = version_string.strip().split("/")
+    if len(parts) < 2 or not parts[1].strip():
+        return None
+    return parts[1].strip()
+
+
+class VerdictCache:
+    """
+    Scan verdicts keyed by (checksum, signature version).
+
+    Lookups go to an in-process LRU first and fall back to the scan_verdicts
+    table, so verdicts are shared between worker processes. Because the
+    signature version is part of the key, all entries go stale as soon as
+    clamd loads new virus definitions.
+    """
+
+    def __init__(self, max_entries: int = VERDICT_CACHE_SIZE, version_ttl: float = SIGNATURE_VERSION_TTL):
+        self.max_entries = max_entries
+        self.version_ttl = version_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._signature_version = None
+        self._version_checked_at = 0.0
+
+    def signature_version(self, clamd_socket):
+        """Returns the current signature version, asking clamd at most once per TTL."""
+        now = time.monotonic()
+        with self._lock:
+            if self._signature_version and now - self._version_checked_at < self.version_ttl:
+                return self._signature_version
+        try:
+            version = parse_signature_version(clamd_socket.version())
+        except Exception as e:
+            logging.warning(f"Could not read ClamAV signature version: {e}")
+            version = None
+        with self._lock:
+            if version and version != self._signature_version:
+                if self._signature_version:
+                    logging.info(f"ClamAV signatures changed from {self._signature_version} to {version}; cached verdicts are now stale.")
+                # Entries for the old version can never be hit again.
+                self._entries.clear()
+            self._signature_version = version
+            self._version_checked_at = now
+        return version
+
+    def _remember(self, key, verdict):
+        with self._lock:
+            self._entries[key] = verdict
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, db: Session, checksum: str, signature_version: str):
+        """Returns a cached (status, details) tuple or None."""
+        if not checksum or not signature_version:
+            return None
+        key = (checksum, signature_version)
+        with self._lock:
+            verdict = self._entries.get(key)
+            if verdict is not None:
+                self._entries.move_to_end(key)
+                return verdict
+        try:
+            row = db.query(ScanVerdict).filter(
+                ScanVerdict.checksum == checksum,
+                ScanVerdict.signature_version == signature_version,
+            ).first()
+        except Exception as e:
+            logging.warning(f"Verdict cache lookup failed for {checksum}: {e}")
+            db.rollback()
+            return None
+        if row is None:
+            return None
+        verdict = (row.scan_status, row.scan_details)
+        self._remember(key, verdict)
+        return verdict
+
+    def put(self, db: Session, checksum: str, signature_version: str, status: ScanStatus, details: str = None):
+        """Stores a definitive verdict in the LRU and in the database."""
+        if not checksum or not signature_version or status.value not in CACHEABLE_STATUSES:
+            return
+        self._remember((checksum, signature_version), (status.value, details))
+        try:
+            stmt = insert(ScanVerdict).values(
+                checksum=checksum,
+                signature_version=signature_version,
+                scan_status=status.value,
+                scan_details=details,
+            ).on_conflict_do_update(
+                index_elements=[ScanVerdict.checksum, ScanVerdict.signature_version],
+                set_={"scan_status": status.value, "scan_details": details},
+            )
+            db.execute(stmt)
+            db.commit()
+        except Exception as e:
+            logging.warning(f"Could not store verdict for {checksum}: {e}")
+            db.rollback()
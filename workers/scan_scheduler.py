@@ -0,0 +1,58 @@
+import threading
+from collections import deque
+
+
+class WeightedScheduler:
+    """
+    Decides which of the deliveries prefetched from several queues a free
+    scan thread runs next.
+
+    Among the queues that have work waiting, the next one is chosen by smooth
+    weighted round-robin: with weights 8/4/1, thirteen picks take eight items
+    from the first queue, four from the second and one from the third,
+    interleaved rather than in bursts. At most `capacity` items are in
+    progress at once (one per scan thread), and a queue can be limited to
+    fewer, so long scans of large files never occupy every scan thread.
+    Callers report finished items with done().
+    """
+
+    def __init__(self, weights: dict, capacity: int, limits: dict = None):
+        self.weights = dict(weights)
+        self.capacity = capacity
+        self.limits = dict(limits or {})
+        self._items = {name: deque() for name in self.weights}
+        self._current = {name: 0 for name in self.weights}
+        self._running = {name: 0 for name in self.weights}
+        self._lock = threading.Lock()
+
+    def put(self, queue_name: str, item):
+        with self._lock:
+            self._items[queue_name].append(item)
+
+    def take(self):
+        """Returns the (queue_name, item) to start now, or None if nothing may start."""
+        with self._lock:
+            if sum(self._running.values()) >= self.capacity:
+                return None
+            ready = [name for name, items in self._items.items() if items and self._has_capacity(name)]
+            if not ready:
+                return None
+            queue_name = self._pick(ready)
+            self._running[queue_name] += 1
+            return queue_name, self._items[queue_name].popleft()
+
+    def done(self, queue_name: str):
+        with self._lock:
+            self._running[queue_name] -= 1
+
+    def _has_capacity(self, queue_name: str) -> bool:
+        limit = self.limits.get(queue_name)
+        return limit is None or self._running[queue_name] < limit
+
+    def _pick(self, ready) -> str:
+        total = sum(self.weights[name] for name in ready)
+        for name in ready:
+            self._current[name] += self.weights[name]
+        best = max(ready, key=lambda name: self._current[name])
+        self._current[best] -= total
+        return best
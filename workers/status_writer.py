@@ -0,0 +1,155 @@
+import logging
+import os
+import threading
+
+from sqlalchemy import text
+
+from worker_metrics import DB_COMMIT_SECONDS
+
+# Flush when this many files have pending updates...
+STATUS_BATCH_SIZE = int(os.getenv("STATUS_BATCH_SIZE", "1"))
+# ...or at the latest after this many milliseconds. Workers prefetch only a few
+# messages beyond their scan threads, so most batches are flushed on this timer.
+STATUS_BATCH_INTERVAL_MS = int(os.getenv("STATUS_BATCH_INTERVAL_MS", "200"))
+
+# Columns of the files table that the worker writes, with their SQL types.
+# A None value means "leave the column unchanged".
+BATCH_COLUMNS = [
+    ("scan_status", "VARCHAR"),
+    ("scan_details", "VARCHAR"),
+    ("checksum", "VARCHAR"),
+    ("filepath", "VARCHAR"),
+    ("is_quarantined", "BOOLEAN"),
+]
+
+
+def build_batch_update(updates: dict):
+    """
+    Builds one UPDATE ... FROM (VALUES ...) statement for {file_id: {column: value}}.
+    Returns (statement, params).
+    """
+    params = {}
+    rows = []
+    for i, (file_id, fields) in enumerate(updates.items()):
+        params[f"id_{i}"] = file_id
+        cells = [f"CAST(:id_{i} AS INTEGER)"]
+        for column, sql_type in BATCH_COLUMNS:
+            params[f"{column}_{i}"] = fields.get(column)
+            cells.append(f"CAST(:{column}_{i} AS {sql_type})")
+        rows.append(f"({', '.join(cells)})")
+
+    assignments = ", ".join(f"{column} = COALESCE(v.{column}, f.{column})" for column, _ in BATCH_COLUMNS)
+    column_names = ", ".join(["id"] + [column for column, _ in BATCH_COLUMNS])
+    statement = (
+        f"UPDATE files AS f SET {assignments} "
+        f"FROM (VALUES {', '.join(rows)}) AS v({column_names}) "
+        f"WHERE f.id = v.id"
+    )
+    return text(statement), params
+
+
+class StatusBatchWriter:
+    """
+    Write-behind buffer for file status updates.
+
+    Updates for the same file are merged (the latest non-None value per column
+    wins), so a SCANNING update followed by the final verdict usually costs a
+    single row write. A background thread flushes everything that is pending
+    as one bulk UPDATE when the batch is full or the interval has passed, and
+    then runs the commit callbacks registered for that batch - this is where
+    messages get acked.
+
+    A batch can be flushed before the message that queued its updates has
+    registered a callback. Files whose latest flush failed are therefore
+    remembered until a later update of theirs commits, and a callback
+    registered for such a file gets the error even if its own batch succeeded.
+    """
+
+    def __init__(self, session_factory, max_batch: int = STATUS_BATCH_SIZE, interval_ms: int = STATUS_BATCH_INTERVAL_MS):
+        self._session_factory = session_factory
+        self.max_batch = max(1, max_batch)
+        self.interval = interval_ms / 1000.0
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._callbacks = []
+        # file_id -> error of the last flush that failed to write its updates
+        self._failed = {}
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="status-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, file_id: int, **fields):
+        """Queues column updates for a file, merging with any pending update."""
+        with self._lock:
+            pending = self._pending.setdefault(file_id, {})
+            for column, value in fields.items():
+                if value is not None:
+                    pending[column] = value
+            if len(self._pending) >= self.max_batch:
+                self._wake.set()
+
+    def after_commit(self, on_commit, on_error=None, file_id: int = None):
+        """
+        Registers callbacks that run once everything queued so far is committed
+        (or failed). With file_id, on_error runs if that file's latest updates
+        could not be written, including in a flush before this call.
+        """
+        with self._lock:
+            self._callbacks.append((on_commit, on_error, file_id))
+
+    def flush(self):
+        """Writes all pending updates in one statement and runs their callbacks."""
+        with self._lock:
+            updates, self._pending = self._pending, {}
+            callbacks, self._callbacks = self._callbacks, []
+        if not updates and not callbacks:
+            return
+
+        error = None
+        if updates:
+            db = self._session_factory()
+            try:
+                statement, params = build_batch_update(updates)
+                db.execute(statement, params)
+                with DB_COMMIT_SECONDS.labels("batch").time():
+                    db.commit()
+                logging.debug(f"Committed status updates for {len(updates)} files in one batch.")
+            except Exception as e:
+                logging.error(f"Batched status update for {len(updates)} files failed: {e}")
+                db.rollback()
+                error = e
+            finally:
+                db.close()
+
+        with self._lock:
+            for file_id in updates:
+                if error is None:
+                    self._failed.pop(file_id, None)
+                else:
+                    self._failed[file_id] = error
+            # A file's callback depends on that file's writes alone; the
+            # failure is reported to it once (its message is retried)
+            errors = [error if file_id is None else self._failed.pop(file_id, None) for _, _, file_id in callbacks]
+
+        for (on_commit, on_error, _), callback_error in zip(callbacks, errors):
+            try:
+                if callback_error is None:
+                    on_commit()
+                elif on_error is not None:
+                    on_error(callback_error)
+            except Exception as e:
+                logging.error(f"Status batch callback failed: {e}")
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """Stops the background thread after a final flush."""
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
@@ -0,0 +1,138 @@
+import io
+import os
+import tarfile
+import zipfile
+
+import clamd
+import pytest
+
+import archive_scan
+from archive_scan import ArchiveScanner, archive_kind
+from clamd_pool import ClamdPool
+from clamd_stream import StreamingClamdSocket
+from fake_clamd import EICAR, FakeClamd
+
+
+class LocalFiles:
+    """The part of the storage interface the archive scanner uses."""
+
+    def stat(self, key):
+        return os.stat(key)
+
+    def local_path(self, key):
+        return key
+
+
+@pytest.fixture
+def scanner(monkeypatch):
+    monkeypatch.setattr(archive_scan, "ARCHIVE_MIN_BYTES", 0)
+    with FakeClamd() as server:
+        pool = ClamdPool(3, lambda: StreamingClamdSocket(host=server.host, port=server.port, timeout=5))
+        scanner = ArchiveScanner(pool, concurrency=3)
+        yield scanner, server
+        scanner.close()
+
+
+def make_zip(members, compression=zipfile.ZIP_STORED) -> bytes:
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", compression=compression) as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return data.getvalue()
+
+
+def make_tar_gz(members) -> bytes:
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w:gz") as archive:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_archive_kind():
+    assert archive_kind(make_zip({"a.txt": b"a"})) == "zip"
+    assert archive_kind(make_tar_gz({"a.txt": b"a"})) == "tar"
+    assert archive_kind(b"MZ" + b"\0" * 600) is None
+
+
+def test_clean_zip_members_are_scanned_separately(scanner, tmp_path):
+    scanner, server = scanner
+    members = {f"docs/{i}.txt": os.urandom(1000) for i in range(10)}
+    progress = []
+    path = write(tmp_path, "bundle.zip", make_zip(members))
+
+    result = scanner.scan(LocalFiles(), path, on_progress=progress.append)
+
+    assert result.verdict() == ("OK", "File is clean (10 archive members scanned)")
+    assert server.commands.count("INSTREAM") == 10
+    assert sorted(progress) == list(range(1, 11))
+
+
+def test_infected_member_is_named_in_the_verdict(scanner, tmp_path):
+    scanner, _ = scanner
+    path = write(tmp_path, "bundle.tar.gz", make_tar_gz({"readme.txt": b"hello", "bin/tool.exe": EICAR}))
+
+    status, details = scanner.scan(LocalFiles(), path).verdict()
+
+    assert status == "FOUND"
+    assert details == "Eicar-Test-Signature in bin/tool.exe"
+
+
+def test_nested_archives_are_expanded(scanner, tmp_path):
+    scanner, _ = scanner
+    inner = make_zip({"payload.com": EICAR})
+    path = write(tmp_path, "outer.zip", make_zip({"inner.zip": inner, "notes.txt": b"notes"}))
+
+    status, details = scanner.scan(LocalFiles(), path).verdict()
+
+    assert (status, details) == ("FOUND", "Eicar-Test-Signature in inner.zip!payload.com")
+
+
+def test_archive_bombs_are_left_to_clamd(scanner, tmp_path, monkeypatch):
+    scanner, _ = scanner
+    path = write(tmp_path, "bomb.zip", make_zip({"zeros.bin": b"\0" * (1024 * 1024)}, zipfile.ZIP_DEFLATED))
+    assert scanner.scan(LocalFiles(), path) is None
+
+    monkeypatch.setattr(archive_scan, "ARCHIVE_MAX_MEMBERS", 3)
+    path = write(tmp_path, "many.zip", make_zip({f"{i}.txt": b"x" for i in range(5)}))
+    assert scanner.scan(LocalFiles(), path) is None
+
+
+def test_small_files_and_non_archives_are_scanned_whole(scanner, tmp_path, monkeypatch):
+    scanner, server = scanner
+    assert scanner.scan(LocalFiles(), write(tmp_path, "plain.bin", os.urandom(2048))) is None
+    assert scanner.scan(LocalFiles(), write(tmp_path, "corrupt.zip", b"PK\x03\x04" + b"\0" * 100)) is None
+
+    monkeypatch.setattr(archive_scan, "ARCHIVE_MIN_BYTES", 1024 * 1024)
+    assert scanner.scan(LocalFiles(), write(tmp_path, "small.zip", make_zip({"a.txt": b"a"}))) is None
+    assert "INSTREAM" not in server.commands
+
+
+def test_missing_clamd_connection_is_a_connection_error(monkeypatch, tmp_path):
+    monkeypatch.setattr(archive_scan, "ARCHIVE_MIN_BYTES", 0)
+    connects = []
+
+    def connect():
+        # connect_clamav() returns None once its retries are used up
+        connects.append(1)
+        return None
+
+    scanner = ArchiveScanner(ClamdPool(1, connect), concurrency=1)
+    path = write(tmp_path, "bundle.zip", make_zip({"a.txt": b"a", "b.txt": b"b"}))
+    try:
+        with pytest.raises(clamd.ConnectionError):
+            scanner.scan(LocalFiles(), path)
+        # The pool tries again on the next scan instead of keeping None
+        with pytest.raises(clamd.ConnectionError):
+            scanner.scan(LocalFiles(), path)
+    finally:
+        scanner.close()
+    assert len(connects) >= 2
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from clamd_pool import ClamdPool, ThreadSafeChannel
+
+
+def test_pool_bounds_concurrent_connections():
+    created = []
+    in_use = []
+    peak = []
+    lock = threading.Lock()
+
+    def factory():
+        conn = object()
+        created.append(conn)
+        return conn
+
+    pool = ClamdPool(3, factory)
+
+    def scan():
+        with pool.connection() as wrapper:
+            with lock:
+                in_use.append(wrapper[0])
+                peak.append(len(in_use))
+            time.sleep(0.01)
+            with lock:
+                in_use.remove(wrapper[0])
+
+    threads = [threading.Thread(target=scan) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert max(peak) <= 3
+    assert len(created) <= 3
+
+
+def test_pool_keeps_replaced_connection():
+    pool = ClamdPool(1, lambda: "old")
+    with pool.connection() as wrapper:
+        wrapper[0] = "reconnected"
+    with pool.connection() as wrapper:
+        assert wrapper[0] == "reconnected"
+
+
+def test_thread_safe_channel_defers_publish_to_connection_thread():
+    scheduled = []
+
+    class FakeConnection:
+        def add_callback_threadsafe(self, callback):
+            scheduled.append(callback)
+
+    class FakeChannel:
+        is_open = True
+
+        def __init__(self):
+            self.published = []
+
+        def basic_publish(self, **kwargs):
+            self.published.append(kwargs)
+
+    channel = FakeChannel()
+    proxy = ThreadSafeChannel(FakeConnection(), channel)
+    proxy.basic_publish(exchange="", routing_key="status_updates", body="{}")
+
+    assert channel.published == []
+    scheduled[0]()
+    assert channel.published == [{"exchange": "", "routing_key": "status_updates", "body": "{}"}]
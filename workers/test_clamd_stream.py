@@ -0,0 +1,66 @@
+import hashlib
+import os
+
+import clamd
+import pytest
+
+import clamd_stream
+from clamd_stream import StreamingClamdSocket, scan_file
+from fake_clamd import EICAR, FakeClamd
+
+
+@pytest.fixture
+def fake_clamd():
+    with FakeClamd() as server:
+        yield server
+
+
+def make_socket(server):
+    return StreamingClamdSocket(host=server.host, port=server.port, timeout=5)
+
+
+def test_instream_clean_file_hashes_in_same_read(fake_clamd, tmp_path):
+    data = os.urandom(2 * 1024 * 1024 + 123)
+    path = tmp_path / "clean.bin"
+    path.write_bytes(data)
+
+    result, checksum = make_socket(fake_clamd).instream_file(str(path), chunk_size=1024 * 1024)
+
+    assert result == {str(path): ("OK", None)}
+    assert checksum == hashlib.sha256(data).hexdigest()
+    assert fake_clamd.chunk_sizes[-1] == [1024 * 1024, 1024 * 1024, 123]
+
+
+def test_instream_detects_signature_across_chunks(fake_clamd, tmp_path):
+    path = tmp_path / "eicar.com"
+    path.write_bytes(b"A" * 30 + EICAR + b"B" * 30)
+
+    result, _ = make_socket(fake_clamd).instream_file(str(path), chunk_size=50)
+
+    assert result == {str(path): ("FOUND", "Eicar-Test-Signature")}
+
+
+def test_instream_size_limit_raises(tmp_path):
+    path = tmp_path / "big.bin"
+    path.write_bytes(b"x" * 4096)
+
+    with FakeClamd(max_stream_size=1024) as server:
+        with pytest.raises(clamd.BufferTooLongError):
+            make_socket(server).instream_file(str(path), chunk_size=512)
+
+
+def test_scan_file_uses_path_scan_in_scan_mode(fake_clamd, tmp_path, monkeypatch):
+    path = tmp_path / "doc.txt"
+    path.write_bytes(b"hello")
+    monkeypatch.setattr(clamd_stream, "CLAMD_SCAN_MODE", "scan")
+
+    result, checksum = scan_file(make_socket(fake_clamd), str(path))
+
+    assert result == {str(path): ("OK", None)}
+    assert checksum is None
+    assert fake_clamd.commands[-1] == "SCAN"
+
+
+def test_version_reports_signature_version():
+    with FakeClamd(signature_version="27123") as server:
+        assert "/27123/" in make_socket(server).version()
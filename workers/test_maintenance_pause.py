@@ -0,0 +1,63 @@
+from maintenance_pause import MaintenancePause
+
+
+class FakeConnection:
+    def __init__(self):
+        self.callbacks = []
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.append(callback)
+
+    def run_callbacks(self):
+        while self.callbacks:
+            self.callbacks.pop(0)()
+
+
+def make_pause(state):
+    events = []
+    connection = FakeConnection()
+    pause = MaintenancePause(
+        connection,
+        start_consumers=lambda: events.append("start"),
+        stop_consumers=lambda: events.append("stop"),
+        is_active=lambda: state["maintenance"],
+    )
+    return pause, connection, events
+
+
+def test_consumers_follow_maintenance_mode():
+    state = {"maintenance": False}
+    pause, connection, events = make_pause(state)
+    pause.apply(False)
+    assert events == ["start"]
+
+    state["maintenance"] = True
+    pause.on_setting_changed("MAINTENANCE_MODE")
+    # Nothing happens until the connection thread runs the callback
+    assert events == ["start"]
+    connection.run_callbacks()
+    assert events == ["start", "stop"]
+    assert not pause.consuming
+
+    state["maintenance"] = False
+    pause.on_setting_changed(None)
+    connection.run_callbacks()
+    assert events == ["start", "stop", "start"]
+
+
+def test_starts_paused_and_ignores_other_settings():
+    state = {"maintenance": True}
+    pause, connection, events = make_pause(state)
+    pause.apply(True)
+    assert events == []
+
+    state["maintenance"] = False
+    pause.on_setting_changed("LOGO_URL")
+    connection.run_callbacks()
+    assert events == []
+
+    # Repeated notifications do not start a second set of consumers
+    pause.on_setting_changed("MAINTENANCE_MODE")
+    pause.on_setting_changed("MAINTENANCE_MODE")
+    connection.run_callbacks()
+    assert events == ["start"]
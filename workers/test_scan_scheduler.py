@@ -0,0 +1,57 @@
+from scan_scheduler import WeightedScheduler
+
+
+def drain(scheduler, count):
+    picked = []
+    for _ in range(count):
+        queue_name, _ = scheduler.take()
+        scheduler.done(queue_name)
+        picked.append(queue_name)
+    return picked
+
+
+def test_picks_follow_weights_and_interleave():
+    scheduler = WeightedScheduler({"priority": 8, "small": 4, "large": 1}, capacity=1)
+    for name in ("priority", "small", "large"):
+        for i in range(20):
+            scheduler.put(name, i)
+
+    picked = drain(scheduler, 13)
+    assert picked.count("priority") == 8
+    assert picked.count("small") == 4
+    assert picked.count("large") == 1
+    # Smooth: the small queue is not starved until all priority work is done
+    assert "small" in picked[:4]
+
+
+def test_idle_queues_do_not_waste_turns():
+    scheduler = WeightedScheduler({"priority": 8, "small": 4, "large": 1}, capacity=1)
+    for i in range(5):
+        scheduler.put("large", i)
+    assert drain(scheduler, 5) == ["large"] * 5
+
+
+def test_limit_caps_items_in_progress():
+    scheduler = WeightedScheduler({"small": 1, "large": 100}, capacity=4, limits={"large": 1})
+    for i in range(3):
+        scheduler.put("large", i)
+        scheduler.put("small", i)
+
+    first = scheduler.take()
+    assert first[0] == "large"
+    # While a large file is being scanned, only small files are handed out
+    assert [scheduler.take()[0] for _ in range(3)] == ["small"] * 3
+    scheduler.done("large")
+    assert scheduler.take()[0] == "large"
+
+
+def test_nothing_starts_while_every_thread_is_busy():
+    scheduler = WeightedScheduler({"small": 1}, capacity=2)
+    for i in range(3):
+        scheduler.put("small", i)
+
+    assert [scheduler.take()[1] for _ in range(2)] == [0, 1]
+    assert scheduler.take() is None
+    scheduler.done("small")
+    assert scheduler.take() == ("small", 2)
+    assert scheduler.take() is None
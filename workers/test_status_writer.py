@@ -0,0 +1,130 @@
+import threading
+
+from status_writer import StatusBatchWriter, build_batch_update
+
+
+class FakeSession:
+    def __init__(self, log, fail=False):
+        self.log = log
+        self.fail = fail
+
+    def execute(self, statement, params):
+        if self.fail:
+            raise RuntimeError("database down")
+        self.log.append((str(statement), params))
+
+    def commit(self):
+        self.log.append("commit")
+
+    def rollback(self):
+        self.log.append("rollback")
+
+    def close(self):
+        pass
+
+
+def test_build_batch_update_uses_single_values_statement():
+    statement, params = build_batch_update({
+        1: {"scan_status": "clean", "checksum": "abc"},
+        2: {"scan_status": "infected", "filepath": "/quarantine/x"},
+    })
+    sql = str(statement)
+    assert sql.startswith("UPDATE files AS f SET")
+    assert "FROM (VALUES" in sql
+    assert "COALESCE(v.scan_details, f.scan_details)" in sql
+    assert params["id_0"] == 1 and params["id_1"] == 2
+    assert params["scan_details_0"] is None
+    assert params["filepath_1"] == "/quarantine/x"
+
+
+def test_updates_for_same_file_are_merged_and_acked_after_commit():
+    log = []
+    writer = StatusBatchWriter(lambda: FakeSession(log), max_batch=100, interval_ms=60000)
+    acked = []
+    try:
+        writer.add(7, scan_status="scanning", checksum="abc")
+        writer.add(7, scan_status="clean", scan_details="File is clean")
+        writer.after_commit(lambda: acked.append(7))
+        assert acked == []
+
+        writer.flush()
+    finally:
+        writer.close()
+
+    statements = [entry for entry in log if entry != "commit"]
+    assert len(statements) == 1
+    _, params = statements[0]
+    assert params["scan_status_0"] == "clean"
+    assert params["checksum_0"] == "abc"
+    assert params["scan_details_0"] == "File is clean"
+    assert acked == [7]
+
+
+def test_full_batch_triggers_background_flush():
+    log = []
+    committed = threading.Event()
+    writer = StatusBatchWriter(lambda: FakeSession(log), max_batch=3, interval_ms=60000)
+    try:
+        for file_id in range(3):
+            writer.add(file_id, scan_status="clean")
+        writer.after_commit(committed.set)
+        assert committed.wait(5)
+    finally:
+        writer.close()
+
+
+def test_failed_flush_calls_error_callbacks():
+    log = []
+    errors = []
+    writer = StatusBatchWriter(lambda: FakeSession(log, fail=True), max_batch=100, interval_ms=60000)
+    try:
+        writer.add(1, scan_status="clean")
+        writer.after_commit(lambda: errors.append("acked"), lambda e: errors.append(str(e)))
+        writer.flush()
+    finally:
+        writer.close()
+    assert errors == ["database down"]
+    assert "rollback" in log
+
+
+def test_flush_failing_before_the_callback_is_registered_is_reported():
+    log = []
+    session = FakeSession(log, fail=True)
+    writer = StatusBatchWriter(lambda: session, max_batch=100, interval_ms=60000)
+    outcomes = []
+    try:
+        # The verdict is queued and flushed (and lost) before the message registers its ack
+        writer.add(1, scan_status="clean")
+        writer.flush()
+        session.fail = False
+        writer.after_commit(lambda: outcomes.append("acked 1"), lambda e: outcomes.append(f"retry 1: {e}"), file_id=1)
+        # Another file's batch commits fine
+        writer.add(2, scan_status="clean")
+        writer.after_commit(lambda: outcomes.append("acked 2"), lambda e: outcomes.append(f"retry 2: {e}"), file_id=2)
+        writer.flush()
+
+        # The retry of file 1 writes its status again and is acked
+        writer.add(1, scan_status="clean")
+        writer.after_commit(lambda: outcomes.append("acked 1"), lambda e: outcomes.append(f"retry 1: {e}"), file_id=1)
+        writer.flush()
+    finally:
+        writer.close()
+    assert outcomes == ["retry 1: database down", "acked 2", "acked 1"]
+
+
+def test_file_callback_ignores_failures_of_other_files():
+    log = []
+    session = FakeSession(log)
+    writer = StatusBatchWriter(lambda: session, max_batch=100, interval_ms=60000)
+    outcomes = []
+    try:
+        writer.add(1, scan_status="clean")
+        writer.flush()
+        session.fail = True
+        writer.add(2, scan_status="clean")
+        writer.after_commit(lambda: outcomes.append("acked 1"), lambda e: outcomes.append("retry 1"), file_id=1)
+        writer.after_commit(lambda: outcomes.append("acked 2"), lambda e: outcomes.append("retry 2"), file_id=2)
+        writer.flush()
+    finally:
+        writer.close()
+    assert outcomes == ["acked 1", "retry 2"]
@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import worker
+from database import models
+from fake_clamd import EICAR, FakeClamd
+from scan_cache import VerdictCache
+
+
+class FakeChannel:
+    def __init__(self):
+        self.published = []
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append(json.loads(body))
+
+
+@pytest.fixture
+def setup(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'worker.db'}")
+    for model in (models.Blob, models.File, models.ScanVerdict):
+        model.__table__.create(bind=engine)
+    TestingSession = sessionmaker(bind=engine)
+
+    monkeypatch.setattr(worker, "BLOB_ROOT", str(tmp_path / "blobs"))
+    monkeypatch.setattr(worker, "QUARANTINE_DIR", str(tmp_path / "quarantine"))
+    monkeypatch.setattr(worker, "QUARANTINE_BLOB_ROOT", str(tmp_path / "quarantine" / "blobs"))
+    monkeypatch.setattr(worker, "is_maintenance_mode_active", lambda: False)
+    monkeypatch.setattr(worker, "verdict_cache", VerdictCache())
+    with FakeClamd() as server:
+        clamd_socket = worker.StreamingClamdSocket(host=server.host, port=server.port, timeout=5)
+        yield TestingSession, tmp_path, clamd_socket
+
+
+def message(db_file, **extra):
+    return json.dumps({"file_id": db_file.id, "file_path": db_file.filepath, "checksum": db_file.checksum, **extra}).encode()
+
+
+@pytest.mark.parametrize("rescan", [False, True])
+def test_queued_files_sharing_an_infected_blob_are_all_infected(setup, rescan):
+    TestingSession, tmp_path, clamd_socket = setup
+    sha = hashlib.sha256(EICAR).hexdigest()
+    blob = tmp_path / "blobs" / sha[:2] / sha
+    blob.parent.mkdir(parents=True)
+    blob.write_bytes(EICAR)
+
+    db = TestingSession()
+    files = [models.File(filename=f"copy{i}.com", filepath=str(blob), filesize=len(EICAR), checksum=sha) for i in range(2)]
+    db.add_all(files)
+    db.commit()
+    # Both scan requests were queued before either was scanned
+    messages = [message(db_file, rescan=rescan) for db_file in files]
+    channel = FakeChannel()
+    for body in messages:
+        worker.process_message(TestingSession(), body, [clamd_socket], channel)
+
+    db.expire_all()
+    quarantined = tmp_path / "quarantine" / "blobs" / sha[:2] / sha
+    for db_file in files:
+        assert db_file.scan_status == models.ScanStatus.INFECTED.value
+        assert db_file.is_quarantined
+        assert db_file.filepath == str(quarantined)
+    assert quarantined.read_bytes() == EICAR
+    assert not blob.exists()
+    assert [update["status"] for update in channel.published if update["file_id"] == files[1].id][-1] == models.ScanStatus.INFECTED.value
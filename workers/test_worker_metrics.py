@@ -0,0 +1,10 @@
+from worker_metrics import size_class
+
+
+def test_size_classes():
+    assert size_class(None) == "unknown"
+    assert size_class(0) == "le_1MiB"
+    assert size_class(1024 * 1024) == "le_1MiB"
+    assert size_class(1024 * 1024 + 1) == "le_16MiB"
+    assert size_class(100 * 1024 * 1024) == "le_256MiB"
+    assert size_class(5 * 1024 ** 3) == "gt_1GiB"
@@ -4,31 +4,79 @@ import clamd
 import logging
 import time
 import json
-import shutil
 import hashlib
+import functools
+from collections import namedtuple
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy.orm import Session
 from database.database import SessionLocal
-from database.models import File, ScanStatus, SystemSetting
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from database.models import File, ScanStatus
+from database.settings_cache import settings_cache
+from scan_cache import VerdictCache
+from clamd_pool import ClamdPool, ThreadSafeChannel
+from clamd_stream import StreamingClamdSocket, scan_file, CLAMD_SCAN_MODE, INSTREAM_CHUNK_SIZE
+from status_writer import StatusBatchWriter, STATUS_BATCH_SIZE
+from storage import get_storage
+from scan_queues import (
+    ATTEMPTS_HEADER, DEAD_LETTER_QUEUE, DEAD_LETTERED_AT_HEADER, LARGE_QUEUE, LAST_ERROR_HEADER, ORIGINAL_QUEUE_HEADER,
+    SCAN_QUEUES, SCAN_QUEUE_WEIGHTS, SCAN_RETRY_DELAYS, retry_delay, retry_exchange, retry_queue_arguments,
+)
+from scan_scheduler import WeightedScheduler
+from maintenance_pause import MaintenancePause
+from log_buffer import configure_logging, default_source
+from log_shipper import FileIdFilter, LogShipper, set_log_file_id
+from worker_metrics import (
+    CHECKSUM_SECONDS, CLAMD_ERRORS, DB_COMMIT_SECONDS, IN_FLIGHT_SCANS, QUEUE_WAIT_SECONDS, SCAN_RESULTS, SCAN_SECONDS,
+    size_class, start_metrics_server,
+)
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from tracing import TRACEPARENT_FIELD, configure_tracing, current_traceparent, extract_context, inject_headers, tracer
+from archive_scan import ARCHIVE_SCAN_CONCURRENCY, ARCHIVE_SCAN_ENABLED, ArchiveScanner
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
 
 QUARANTINE_DIR = "/quarantine"
+# Content-addressed uploads (see backend/blob_store.py); infected blobs keep their layout in quarantine
+BLOB_ROOT = os.getenv("BLOB_ROOT", "/uploads/blobs")
+QUARANTINE_BLOB_ROOT = os.getenv("QUARANTINE_BLOB_ROOT", os.path.join(QUARANTINE_DIR, "blobs"))
+
+CLAMAV_HOST = os.getenv("CLAMAV_HOST", "clamav")
+CLAMAV_PORT = int(os.getenv("CLAMAV_PORT", "3310"))
+
+# Number of files scanned in parallel by this worker process
+WORKER_CONCURRENCY = max(1, int(os.getenv("WORKER_CONCURRENCY", "1")))
+# Scan threads that files from the large-file queue may occupy at once
+SCAN_LARGE_CONCURRENCY = max(1, int(os.getenv("SCAN_LARGE_CONCURRENCY", str(max(1, WORKER_CONCURRENCY // 2)))))
+# Unacked messages a worker may hold beyond one per scan thread: scanned messages
+# whose ack waits for the next timed status flush, and the next one to start
+PREFETCH_HEADROOM = 2
+# Fanout exchange for status updates; every backend replica binds its own queue to it
+STATUS_EXCHANGE = "status_updates"
+
+# Verdicts for already scanned content, keyed by checksum and signature version
+verdict_cache = VerdictCache()
+# Large archives are scanned member by member on clamd connections of their own
+archive_scanner = ArchiveScanner(ClamdPool(ARCHIVE_SCAN_CONCURRENCY, lambda: connect_clamav())) if ARCHIVE_SCAN_ENABLED else None
+# Minimum seconds between two progress updates for the same archive
+ARCHIVE_PROGRESS_INTERVAL = float(os.getenv("ARCHIVE_PROGRESS_INTERVAL", "1"))
 
 # Skapa nödvändiga mappar automatiskt
 for folder in ["uploads", "quarantine", "testfiles"]:
     os.makedirs(folder, exist_ok=True)
 
+@CHECKSUM_SECONDS.time()
+@tracer.start_as_current_span("checksum")
 def calculate_checksum(file_path):
-    """Calculates the SHA256 checksum of a file."""
+    """Calculates the SHA256 checksum of a stored file."""
     sha256_hash = hashlib.sha256()
     try:
-        with open(file_path, "rb") as f:
-            # Read and update hash string value in blocks of 4K
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
+        # Read and update hash string value in blocks of 1 MiB
+        for byte_block in get_storage().iter_bytes(file_path, chunk_size=1024 * 1024):
+            sha256_hash.update(byte_block)
         return sha256_hash.hexdigest()
-    except IOError as e:
+    except Exception as e:
         logging.error(f"Error reading file for checksum: {e}")
         return None
 
@@ -38,7 +86,7 @@ def connect_clamav():
     retry_delay = 5
     for attempt in range(max_retries):
         try:
-            cd = clamd.ClamdNetworkSocket(host='clamav', port=3310)
+            cd = StreamingClamdSocket(host=CLAMAV_HOST, port=CLAMAV_PORT)
             cd.ping()
             logging.info(f"Successfully connected to ClamAV on attempt {attempt + 1}")
             return cd
@@ -48,8 +96,12 @@ def connect_clamav():
     logging.error("Could not connect to ClamAV after several retries.")
     return None
 
-def update_scan_status(db: Session, file_id: int, status: ScanStatus, details: str = None, checksum: str = None):
-    """Updates the scan status and checksum of a file in the database."""
+def update_scan_status(db: Session, file_id: int, status: ScanStatus, details: str = None, checksum: str = None, writer: StatusBatchWriter = None):
+    """Updates the scan status and checksum of a file in the database (or queues it on the batch writer)."""
+    if writer is not None:
+        writer.add(file_id, scan_status=status.value, scan_details=details, checksum=checksum)
+        logging.debug(f"Queued status {status.value} for file {file_id}")
+        return
     try:
         db_file = db.query(File).filter(File.id == file_id).first()
         if db_file:
@@ -58,7 +110,8 @@ def update_scan_status(db: Session, file_id: int, status: ScanStatus, details: s
                 db_file.scan_details = details
             if checksum is not None:
                 db_file.checksum = checksum
-            db.commit()
+            with DB_COMMIT_SECONDS.labels("single").time():
+                db.commit()
             logging.info(f"Updated file {file_id} status to {status.value}, details: {details}, checksum: {'yes' if checksum else 'no'}")
         else:
             logging.warning(f"File with id {file_id} not found in database.")
@@ -66,34 +119,61 @@ def update_scan_status(db: Session, file_id: int, status: ScanStatus, details: s
         logging.error(f"Failed to update database for file {file_id}: {e}")
         db.rollback()
 
-def quarantine_file(db: Session, file_id: int, file_path: str):
-    """Moves a file to the quarantine directory and updates its path in the database."""
-    if not os.path.exists(file_path):
-        logging.error(f"Cannot quarantine file: {file_path} does not exist.")
-        return None
+def in_quarantine(file_path: str) -> bool:
+    """Whether a stored file is already under one of the quarantine roots."""
+    return any(not os.path.relpath(file_path, root).startswith(os.pardir) for root in (QUARANTINE_BLOB_ROOT, QUARANTINE_DIR))
+
+def quarantine_path(file_path: str) -> str:
+    """Where an infected file goes: blobs keep their relative path, other files get a free name."""
+    relative = os.path.relpath(file_path, BLOB_ROOT)
+    if not relative.startswith(os.pardir):
+        return os.path.join(QUARANTINE_BLOB_ROOT, relative)
 
     filename = os.path.basename(file_path)
     new_path = os.path.join(QUARANTINE_DIR, filename)
 
     # Handle filename conflicts in quarantine
     counter = 1
-    while os.path.exists(new_path):
+    while get_storage().exists(new_path):
         name, extension = os.path.splitext(filename)
         new_filename = f"{name}_{counter}{extension}"
         new_path = os.path.join(QUARANTINE_DIR, new_filename)
         counter += 1
+    return new_path
+
+def quarantine_file(db: Session, file_id: int, file_path: str, writer: StatusBatchWriter = None):
+    """Moves a file to the quarantine directory and updates its path in the database."""
+    storage = get_storage()
+    # Content quarantined with another file sharing its blob stays where it is
+    new_path = file_path if in_quarantine(file_path) else quarantine_path(file_path)
+    if not storage.exists(file_path):
+        if not storage.exists(new_path):
+            logging.error(f"Cannot quarantine file: {file_path} does not exist.")
+            return None
+        # A blob shared with another file that was quarantined first
+        logging.info(f"File {file_id} content is already quarantined at {new_path}")
 
     try:
-        # Ensure the quarantine directory exists inside the container
-        os.makedirs(QUARANTINE_DIR, exist_ok=True)
-        
-        shutil.move(file_path, new_path)
-        logging.info(f"Moved infected file {file_id} to quarantine at {new_path}")
+        if new_path != file_path and storage.exists(file_path):
+            # A rename on local storage, a server-side copy on S3
+            storage.move(file_path, new_path)
+            logging.info(f"Moved infected file {file_id} to quarantine at {new_path}")
+            # Other files sharing the blob now point at the quarantined copy as well
+            siblings = db.query(File).filter(File.filepath == file_path, File.id != file_id).update(
+                {File.filepath: new_path, File.is_quarantined: True}, synchronize_session=False
+            )
+            if siblings:
+                db.commit()
+
+        if writer is not None:
+            writer.add(file_id, filepath=new_path, is_quarantined=True)
+            return new_path
 
         # Update the filepath in the database
         db_file = db.query(File).filter(File.id == file_id).first()
         if db_file:
             db_file.filepath = new_path
+            db_file.is_quarantined = True
             db.commit()
             logging.info(f"Updated filepath for file {file_id} to {new_path}")
             return new_path
@@ -107,33 +187,32 @@ def quarantine_file(db: Session, file_id: int, file_path: str):
         return None
 
 
-def is_maintenance_mode_active(db: Session) -> bool:
-    """Checks if maintenance mode is active."""
+def is_maintenance_mode_active() -> bool:
+    """Checks if maintenance mode is active, using the shared in-memory settings cache."""
     try:
-        setting = db.query(SystemSetting).filter(SystemSetting.key == "maintenance_mode").first()
-        # The value is stored as a boolean.
-        return setting and setting.value is True
+        return settings_cache.get_bool("MAINTENANCE_MODE")
     except Exception as e:
         logging.error(f"Could not check maintenance mode status: {e}")
         # Fail-safe: if we can't check, assume it's not active to not halt processing.
         return False
 
-def connect_to_rabbitmq():
-    """Establishes a connection to RabbitMQ with retries."""
+def rabbitmq_parameters():
     rabbitmq_user = os.getenv("RABBITMQ_DEFAULT_USER", "guest")
     rabbitmq_password = os.getenv("RABBITMQ_DEFAULT_PASS", "guest")
-    
-    if not rabbitmq_user or not rabbitmq_password:
+    credentials = pika.PlainCredentials(rabbitmq_user, rabbitmq_password)
+    return pika.ConnectionParameters(host='rabbitmq', port=5672, heartbeat=600, blocked_connection_timeout=300, credentials=credentials)
+
+def connect_to_rabbitmq():
+    """Establishes a connection to RabbitMQ with retries."""
+    if not os.getenv("RABBITMQ_DEFAULT_USER", "guest") or not os.getenv("RABBITMQ_DEFAULT_PASS", "guest"):
         logging.error("RabbitMQ user or password not set. Please check environment variables.")
         return None
 
-    credentials = pika.PlainCredentials(rabbitmq_user, rabbitmq_password)
-    
     max_retries = 5
     retry_delay = 5
     for attempt in range(max_retries):
         try:
-            connection = pika.BlockingConnection(pika.ConnectionParameters(host='rabbitmq', port=5672, heartbeat=600, blocked_connection_timeout=300, credentials=credentials))
+            connection = pika.BlockingConnection(rabbitmq_parameters())
             logging.info("Successfully connected to RabbitMQ")
             return connection
         except pika.exceptions.AMQPConnectionError as e:
@@ -149,87 +228,326 @@ def get_db():
     finally:
         db.close()
 
-def publish_status_update(channel: pika.channel.Channel, file_id: int, status: str, details: str = None, checksum: str = None, new_path: str = None):
+def publish_status_update(channel: pika.channel.Channel, file_id: int, status: str, details: str = None, checksum: str = None, new_path: str = None, owner: str = None):
     """Publishes a status update to RabbitMQ using an existing channel."""
     try:
-        message = {'file_id': file_id, 'status': status, 'details': details, 'checksum': checksum}
+        # owner is echoed from the scan request so the backend can route the update to subscribers
+        message = {'file_id': file_id, 'status': status, 'details': details, 'checksum': checksum, 'owner': owner}
         if new_path:
             message['filepath'] = new_path
+        # Lets clients match the update with the file's trace
+        traceparent = current_traceparent()
+        if traceparent:
+            message[TRACEPARENT_FIELD] = traceparent
         channel.basic_publish(
-            exchange='',
-            routing_key='status_updates',
+            exchange=STATUS_EXCHANGE,
+            routing_key='',
             body=json.dumps(message),
             properties=pika.BasicProperties(
-                delivery_mode=2,  # make message persistent
+                delivery_mode=1,  # transient: replicas that were offline reload state from the DB
+                headers=inject_headers(),
             ))
-        logging.info(f"Published status update for file {file_id}: {status}")
+        logging.debug(f"Published status update for file {file_id}: {status}")
     except Exception as e:
         logging.error(f"Failed to publish status update for file {file_id}: {e}")
 
 
+@tracer.start_as_current_span("apply verdict")
+def apply_verdict(db: Session, channel: pika.channel.Channel, file_id: int, file_path: str, infected: bool, details: str, checksum: str = None, writer: StatusBatchWriter = None, owner: str = None):
+    """Records a CLEAN/INFECTED verdict, quarantining infected files."""
+    if infected:
+        logging.info(f"File {file_id} is INFECTED. Moving to quarantine.")
+        new_filepath = quarantine_file(db, file_id, file_path, writer=writer)
+        update_scan_status(db, file_id, ScanStatus.INFECTED, details, checksum=checksum, writer=writer)
+        publish_status_update(channel, file_id, ScanStatus.INFECTED.value, details, checksum, new_path=new_filepath, owner=owner)
+    else:
+        update_scan_status(db, file_id, ScanStatus.CLEAN, details, checksum=checksum, writer=writer)
+        publish_status_update(channel, file_id, ScanStatus.CLEAN.value, details, checksum, owner=owner)
+
+
+# A message taken from one of the scan queues
+Delivery = namedtuple("Delivery", ["queue_name", "delivery_tag", "properties", "body"])
+
+
+def observe_queue_wait(delivery: Delivery):
+    """Records how long a first delivery waited in its queue (retries wait on purpose)."""
+    if (delivery.properties.headers or {}).get(ATTEMPTS_HEADER):
+        return
+    try:
+        queued_at = json.loads(delivery.body).get('queued_at')
+    except (ValueError, AttributeError):
+        return
+    if queued_at:
+        QUEUE_WAIT_SECONDS.labels(delivery.queue_name).observe(max(0.0, time.time() - float(queued_at)))
+
+
+def message_file_id(body: bytes):
+    """The file_id of a scan request, or None if the body cannot be read."""
+    try:
+        return json.loads(body).get('file_id')
+    except (ValueError, AttributeError):
+        return None
+
+
+def handle_delivery(body: bytes, clamd_pool: ClamdPool, channel, writer: StatusBatchWriter = None, headers: dict = None):
+    """
+    Runs process_message for one delivery and decides how it should be settled.
+    Returns (outcome, reason) where outcome is 'ack', 'retry' (a failed
+    attempt), 'postpone' (try again later without counting an attempt) or
+    'dead' (move to the dead-letter queue). The work is traced as part of
+    the trace the message was published in.
+    """
+    with tracer.start_as_current_span("process_message", context=extract_context(headers), kind=SpanKind.CONSUMER) as span:
+        outcome, reason = _handle_delivery(body, clamd_pool, channel, writer)
+        span.set_attribute("cfiles.outcome", outcome)
+        if outcome != 'ack':
+            span.set_status(Status(StatusCode.ERROR, reason))
+        return outcome, reason
+
+def _handle_delivery(body: bytes, clamd_pool: ClamdPool, channel, writer: StatusBatchWriter = None):
+    db = SessionLocal()
+    try:
+        with clamd_pool.connection() as clamd_socket_wrapper:
+            process_message(db, body, clamd_socket_wrapper, channel, writer=writer)
+        return 'ack', None
+    except MessageProcessingError as e:
+        logging.error(f"Message processing failed: {e}. Scheduling a retry.")
+        return ('retry' if e.count_attempt else 'postpone'), str(e)
+    except Exception as e:
+        logging.error(f"An unhandled error occurred during message processing: {e}", exc_info=True)
+        return 'dead', f"Unhandled worker error: {e}" # Don't retry unknown errors
+    finally:
+        set_log_file_id(None)
+        db.close()
+
+
+def settle_delivery(channel: pika.channel.Channel, confirm_channel: pika.channel.Channel, delivery: Delivery, outcome: str, reason: str = None):
+    """
+    Acks a delivery, first republishing it to a retry queue or the dead-letter
+    queue unless it succeeded. The copy goes out on confirm_channel, which is
+    in confirm mode, so the delivery is only acked once the broker has the
+    copy; otherwise it is requeued. Must run on the connection thread.
+    """
+    if not channel.is_open:
+        logging.warning(f"Channel closed before delivery {delivery.delivery_tag} could be settled; it will be redelivered.")
+        return
+    if outcome != 'ack':
+        headers = dict(delivery.properties.headers or {})
+        attempts = int(headers.get(ATTEMPTS_HEADER, 0)) + (1 if outcome == 'retry' else 0)
+        original_queue = headers.get(ORIGINAL_QUEUE_HEADER) or delivery.queue_name
+        headers.update({ATTEMPTS_HEADER: attempts, ORIGINAL_QUEUE_HEADER: original_queue, LAST_ERROR_HEADER: reason})
+        delay = None if outcome == 'dead' else retry_delay(attempts)
+        if delay is None:
+            headers[DEAD_LETTERED_AT_HEADER] = datetime.utcnow().isoformat()
+            exchange, routing_key = '', DEAD_LETTER_QUEUE
+            logging.warning(f"Moving message to {DEAD_LETTER_QUEUE} after {attempts} attempts: {reason}")
+        else:
+            # The retry queue's TTL dead-letters it back to the original queue
+            exchange, routing_key = retry_exchange(delay), original_queue
+            logging.info(f"Retrying message in {delay}s (attempt {attempts}): {reason}")
+        try:
+            # Blocks until the broker confirms; raises if it nacks or cannot route the copy
+            confirm_channel.basic_publish(
+                exchange=exchange,
+                routing_key=routing_key,
+                body=delivery.body,
+                properties=pika.BasicProperties(
+                    delivery_mode=2,
+                    content_type=delivery.properties.content_type,
+                    headers=headers,
+                ),
+                mandatory=True,
+            )
+        except pika.exceptions.AMQPError as e:
+            logging.error(f"Could not republish message to {routing_key or exchange}: {e!r}. Requeueing it.")
+            channel.basic_nack(delivery_tag=delivery.delivery_tag, requeue=True)
+            return
+    channel.basic_ack(delivery_tag=delivery.delivery_tag)
+
+
+def declare_scan_topology(channel: pika.channel.Channel):
+    """Declares the scan queues, their retry queues and the dead-letter queue."""
+    for queue_name in SCAN_QUEUES:
+        channel.queue_declare(queue=queue_name, durable=True)
+    for delay in sorted(set(SCAN_RETRY_DELAYS)):
+        name = retry_exchange(delay)
+        channel.exchange_declare(exchange=name, exchange_type='fanout', durable=True)
+        channel.queue_declare(queue=name, durable=True, arguments=retry_queue_arguments(delay))
+        channel.queue_bind(queue=name, exchange=name)
+    channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
+
+
 def main():
-    logging.info("Worker started")
+    # Console output on a background thread; records also go to the backends' log buffers
+    log_shipper = LogShipper(rabbitmq_parameters(), default_source("worker")).start()
+    log_listener = configure_logging(log_shipper, fmt=LOG_FORMAT, record_filter=FileIdFilter())
+    logging.info(f"Worker started with concurrency {WORKER_CONCURRENCY}")
+    start_metrics_server()
+    tracer_provider = configure_tracing("cfiles-worker")
+    settings_cache.start_listener()
 
     connection = connect_to_rabbitmq()
     if not connection:
         return
 
-    clamd_socket = connect_clamav()
+    # One clamd connection and one scan thread per in-flight message
+    clamd_pool = ClamdPool(WORKER_CONCURRENCY, connect_clamav)
+    executor = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix="scan")
+    # Decides which of the prefetched deliveries a free scan thread takes next
+    scheduler = WeightedScheduler(SCAN_QUEUE_WEIGHTS, capacity=WORKER_CONCURRENCY, limits={LARGE_QUEUE: SCAN_LARGE_CONCURRENCY})
+    # Batch status writes when STATUS_BATCH_SIZE > 1; otherwise write each update directly
+    status_writer = StatusBatchWriter(SessionLocal) if STATUS_BATCH_SIZE > 1 else None
+    # One delivery per scan thread plus a little headroom, whatever the status batch size:
+    # acks wait at most STATUS_BATCH_INTERVAL_MS for the writer's timed flush, and
+    # everything else stays in the queue for other workers
+    prefetch_count = WORKER_CONCURRENCY + PREFETCH_HEADROOM
 
     try:
         channel = connection.channel()
-        channel.queue_declare(queue='file_queue', durable=True)
-        # Also declare the queue we will be publishing to
-        channel.queue_declare(queue='status_updates', durable=True)
-
-        def callback(ch, method, properties, body):
-            nonlocal clamd_socket
-            db = SessionLocal()
+        declare_scan_topology(channel)
+        # Shared by the consumers of all scan queues, so this worker never holds
+        # more unacked messages than it can work on; other workers take the rest
+        channel.basic_qos(prefetch_count=prefetch_count, global_qos=True)
+        # Also declare the exchange we will be publishing status updates to
+        channel.exchange_declare(exchange=STATUS_EXCHANGE, exchange_type='fanout', durable=True)
+        publish_channel = ThreadSafeChannel(connection, channel)
+        # Retries and dead letters are republished with confirms before the original is acked
+        confirm_channel = connection.channel()
+        confirm_channel.confirm_delivery()
+
+        def settle(delivery, outcome, reason=None):
+            connection.add_callback_threadsafe(functools.partial(settle_delivery, channel, confirm_channel, delivery, outcome, reason))
+
+        def run_scan(queue_name, delivery):
             try:
-                # Pass the channel 'ch' to process_message for publishing
-                # Pass clamd_socket as a mutable list to allow modification on reconnect
-                new_socket = process_message(db, body, [clamd_socket], ch)
-                if new_socket is not None:
-                    clamd_socket = new_socket
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-            except MessageProcessingError as e:
-                logging.error(f"Message processing failed: {e}. Requeuing message.")
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-            except Exception as e:
-                logging.error(f"An unhandled error occurred during message processing: {e}", exc_info=True)
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False) # Don't requeue on unknown errors
+                observe_queue_wait(delivery)
+                with IN_FLIGHT_SCANS.labels(delivery.queue_name).track_inprogress():
+                    outcome, reason = handle_delivery(delivery.body, clamd_pool, publish_channel, status_writer, headers=delivery.properties.headers)
+                if status_writer and outcome == 'ack':
+                    # Only ack once this message's updates have committed; a flush that
+                    # already failed for the file before this point is retried too
+                    status_writer.after_commit(
+                        functools.partial(settle, delivery, 'ack'),
+                        lambda error: settle(delivery, 'retry', f"Status update failed: {error}"),
+                        file_id=message_file_id(delivery.body),
+                    )
+                else:
+                    # Each message is settled on the connection thread once its own scan is done
+                    settle(delivery, outcome, reason)
             finally:
-                db.close()
-
-        channel.basic_qos(prefetch_count=1)
-        channel.basic_consume(queue='file_queue', on_message_callback=callback, auto_ack=False)
+                scheduler.done(queue_name)
+                connection.add_callback_threadsafe(dispatch)
+
+        def dispatch():
+            # Runs on the connection thread: start a scan for every free scan thread
+            while True:
+                scheduled = scheduler.take()
+                if scheduled is None:
+                    return
+                executor.submit(run_scan, *scheduled)
+
+        def make_callback(queue_name):
+            def callback(ch, method, properties, body):
+                scheduler.put(queue_name, Delivery(queue_name, method.delivery_tag, properties, body))
+                dispatch()
+            return callback
+
+        consumer_tags = []
+
+        def start_consumers():
+            for queue_name in SCAN_QUEUES:
+                # Per consumer, within the channel-wide limit: large files are prefetched
+                # only as far as they may be scanned at once
+                channel.basic_qos(prefetch_count=SCAN_LARGE_CONCURRENCY if queue_name == LARGE_QUEUE else 0)
+                consumer_tags.append(channel.basic_consume(queue=queue_name, on_message_callback=make_callback(queue_name), auto_ack=False))
+
+        def stop_consumers():
+            # Messages already prefetched are still scanned (or postponed)
+            while consumer_tags:
+                channel.basic_cancel(consumer_tags.pop())
+
+        # Consume only while maintenance mode is off; settings notifications switch it
+        pause = MaintenancePause(connection, start_consumers, stop_consumers, is_maintenance_mode_active)
+        settings_cache.add_change_callback(pause.on_setting_changed)
+        pause.apply(is_maintenance_mode_active())
         logging.info("Waiting for messages...")
-        channel.start_consuming()
+        # Unlike channel.start_consuming(), keeps running while the consumers are cancelled
+        while connection.is_open:
+            connection.process_data_events(time_limit=1)
 
     except Exception as e:
         logging.error(f"An unexpected error occurred in the main loop: {e}")
     finally:
+        executor.shutdown(wait=True)
+        if status_writer:
+            status_writer.close()
+        if archive_scanner:
+            archive_scanner.close()
         if connection and not connection.is_closed:
             connection.close()
             logging.info("RabbitMQ connection closed.")
+        if tracer_provider:
+            tracer_provider.shutdown()
+        log_listener.stop()
+        log_shipper.close()
+
+def scan_stored_file(clamd_socket, file_path: str):
+    """
+    scan_file() for a stored file. Files that are not on a local filesystem
+    (e.g. in S3) are always streamed to clamd, whatever CLAMD_SCAN_MODE says.
+    The result is keyed by file_path like scan_file()'s.
+    """
+    storage = get_storage()
+    local_path = storage.local_path(file_path)
+    if local_path is None:
+        return clamd_socket.instream_chunks(storage.iter_bytes(file_path, chunk_size=INSTREAM_CHUNK_SIZE), name=file_path)
+    result, checksum = scan_file(clamd_socket, local_path)
+    if result and local_path != file_path:
+        result = {file_path: next(iter(result.values()))}
+    return result, checksum
+
+def scan_archive(channel, file_id: int, file_path: str, owner: str = None):
+    """
+    Scans a stored archive member by member, publishing how far it has got.
+    Returns an ArchiveScanResult, or None if the file should be scanned whole.
+    """
+    last_published = [0.0]
+
+    def on_progress(scanned):
+        now = time.monotonic()
+        if now - last_published[0] >= ARCHIVE_PROGRESS_INTERVAL:
+            last_published[0] = now
+            publish_status_update(channel, file_id, ScanStatus.SCANNING.value, f"Scanned {scanned} archive members", owner=owner)
+
+    return archive_scanner.scan(get_storage(), file_path, on_progress=on_progress)
 
 class MessageProcessingError(Exception):
-    """Custom exception for message processing errors."""
-    pass
-
-def process_message(db: Session, body: bytes, clamd_socket_wrapper: list, channel: pika.channel.Channel):
+    """
+    Custom exception for message processing errors. The message is retried
+    later; count_attempt=False does not count it towards SCAN_MAX_ATTEMPTS.
+    """
+    def __init__(self, message: str, count_attempt: bool = True):
+        super().__init__(message)
+        self.count_attempt = count_attempt
+
+def process_message(db: Session, body: bytes, clamd_socket_wrapper: list, channel: pika.channel.Channel, writer: StatusBatchWriter = None):
     """Processes a single message from the queue."""
     clamd_socket = clamd_socket_wrapper[0]
     file_id = None
     checksum = None # Initialize checksum
+    owner = None
     try:
-        if is_maintenance_mode_active(db):
-            logging.info("Maintenance mode is active. Re-queuing message.")
-            raise MessageProcessingError("Maintenance mode is active")
+        if is_maintenance_mode_active():
+            logging.info("Maintenance mode is active. Postponing message.")
+            raise MessageProcessingError("Maintenance mode is active", count_attempt=False)
 
         message_data = json.loads(body.decode())
         file_path = message_data.get('file_path')
         file_id = message_data.get('file_id')
+        owner = message_data.get('owner')
+        # Lets the log viewer filter this scan's records by file
+        set_log_file_id(file_id)
+        trace.get_current_span().set_attribute("cfiles.file_id", file_id)
 
         if not file_path or not file_id:
             logging.error("Message missing file_path or file_id")
@@ -238,47 +556,83 @@ def process_message(db: Session, body: bytes, clamd_socket_wrapper: list, channe
         logging.info(f"Received file: {file_path} with ID: {file_id}")
 
         # Immediately publish 'pending' status
-        publish_status_update(channel, file_id, ScanStatus.PENDING.value, "Awaiting scan...")
+        publish_status_update(channel, file_id, ScanStatus.PENDING.value, "Awaiting scan...", owner=owner)
+
+        # A file sharing its blob with one found infected since this message was
+        # queued has been moved to quarantine along with it; the row has the path
+        current_path = db.query(File.filepath).filter(File.id == file_id).scalar()
+        if current_path and current_path != file_path:
+            logging.info(f"File {file_id} was moved to {current_path} since it was queued.")
+            file_path = current_path
 
-        if not os.path.exists(file_path):
+        if not get_storage().exists(file_path):
             logging.warning(f"File does not exist: {file_path}")
-            update_scan_status(db, file_id, ScanStatus.ERROR, "File not found at worker")
-            publish_status_update(channel, file_id, ScanStatus.ERROR.value, "File not found at worker")
+            update_scan_status(db, file_id, ScanStatus.ERROR, "File not found at worker", writer=writer)
+            publish_status_update(channel, file_id, ScanStatus.ERROR.value, "File not found at worker", owner=owner)
             return
 
-        checksum = calculate_checksum(file_path)
-        if not checksum:
-            logging.warning(f"Could not calculate checksum for file {file_id}, continuing without it.")
-
-        update_scan_status(db, file_id, ScanStatus.SCANNING, checksum=checksum)
-        publish_status_update(channel, file_id, ScanStatus.SCANNING.value, checksum=checksum)
+        # The backend hashes the file while streaming it to disk. Without that
+        # checksum, instream mode computes it during the scan itself; only path
+        # based scans need a separate read.
+        checksum = message_data.get('checksum')
+        if not checksum and CLAMD_SCAN_MODE != "instream":
+            checksum = calculate_checksum(file_path)
+            if not checksum:
+                logging.warning(f"Could not calculate checksum for file {file_id}, continuing without it.")
+
+        # Identical content scanned with the current signatures needs no rescan
+        signature_version = verdict_cache.signature_version(clamd_socket) if clamd_socket else None
+        # An admin rescan always asks clamd again
+        cached = None if message_data.get('rescan') else verdict_cache.get(db, checksum, signature_version)
+        if cached:
+            cached_status, cached_details = cached
+            logging.info(f"Reusing cached verdict '{cached_status}' for file {file_id} (signatures {signature_version}).")
+            SCAN_RESULTS.labels("cached").inc()
+            apply_verdict(db, channel, file_id, file_path, cached_status == ScanStatus.INFECTED.value, cached_details, checksum, writer=writer, owner=owner)
+            return clamd_socket_wrapper[0]
+
+        update_scan_status(db, file_id, ScanStatus.SCANNING, checksum=checksum, writer=writer)
+        publish_status_update(channel, file_id, ScanStatus.SCANNING.value, checksum=checksum, owner=owner)
 
         if not clamd_socket:
             logging.error("No ClamAV connection, cannot scan.")
-            update_scan_status(db, file_id, ScanStatus.ERROR, "Could not connect to ClamAV")
-            publish_status_update(channel, file_id, ScanStatus.ERROR.value, "Could not connect to ClamAV")
+            update_scan_status(db, file_id, ScanStatus.ERROR, "Could not connect to ClamAV", writer=writer)
+            publish_status_update(channel, file_id, ScanStatus.ERROR.value, "Could not connect to ClamAV", owner=owner)
             raise MessageProcessingError("No ClamAV connection")
 
         try:
             logging.info(f"Scanning file: {file_path}")
-            result = clamd_socket.scan(file_path)
+            size = size_class(message_data.get('filesize'))
+            with SCAN_SECONDS.labels(size).time(), tracer.start_as_current_span("clamd scan", attributes={"cfiles.size_class": size}):
+                # Members are hashed separately, never the archive itself, so an archive is only
+                # expanded when the message carries its checksum; otherwise it is streamed whole,
+                # which hashes it in the same read
+                archive = scan_archive(channel, file_id, file_path, owner) if archive_scanner and checksum else None
+                if archive:
+                    result, streamed_checksum = {file_path: archive.verdict()}, None
+                else:
+                    result, streamed_checksum = scan_stored_file(clamd_socket, file_path)
             logging.info(f"Scan result for file {file_id}: {result}")
+            if streamed_checksum:
+                if checksum and streamed_checksum != checksum:
+                    logging.warning(f"Checksum of file {file_id} changed since upload ({checksum} -> {streamed_checksum}).")
+                checksum = streamed_checksum
 
             if result:
                 status, details = result[file_path]
-                if status == 'FOUND':
-                    logging.info(f"File {file_id} is INFECTED. Moving to quarantine.")
-                    new_filepath = quarantine_file(db, file_id, file_path)
-                    update_scan_status(db, file_id, ScanStatus.INFECTED, details, checksum=checksum)
-                    publish_status_update(channel, file_id, ScanStatus.INFECTED.value, details, checksum, new_path=new_filepath)
-                else:  # OK
-                    update_scan_status(db, file_id, ScanStatus.CLEAN, "File is clean", checksum=checksum)
-                    publish_status_update(channel, file_id, ScanStatus.CLEAN.value, "File is clean", checksum)
+                infected = status == 'FOUND'
+                if not infected and not archive:
+                    details = "File is clean"
+                apply_verdict(db, channel, file_id, file_path, infected, details, checksum, writer=writer, owner=owner)
+                SCAN_RESULTS.labels("infected" if infected else "clean").inc()
+                verdict_cache.put(db, checksum, signature_version, ScanStatus.INFECTED if infected else ScanStatus.CLEAN, details)
             else:
-                update_scan_status(db, file_id, ScanStatus.ERROR, "Scan failed or returned no result", checksum=checksum)
-                publish_status_update(channel, file_id, ScanStatus.ERROR.value, "Scan failed or returned no result", checksum)
+                CLAMD_ERRORS.labels("no_result").inc()
+                update_scan_status(db, file_id, ScanStatus.ERROR, "Scan failed or returned no result", checksum=checksum, writer=writer)
+                publish_status_update(channel, file_id, ScanStatus.ERROR.value, "Scan failed or returned no result", checksum, owner=owner)
 
         except clamd.ConnectionError as e:
+            CLAMD_ERRORS.labels("connection").inc()
             logging.error(f"ClamAV connection lost: {e}. Reconnecting...")
             new_clamd_socket = connect_clamav() # Try to reconnect
             if new_clamd_socket:
@@ -287,25 +641,26 @@ def process_message(db: Session, body: bytes, clamd_socket_wrapper: list, channe
             else:
                 logging.error("Failed to reconnect to ClamAV.")
 
-            update_scan_status(db, file_id, ScanStatus.ERROR, f"ClamAV connection error: {e}")
-            publish_status_update(channel, file_id, ScanStatus.ERROR.value, f"ClamAV connection error: {e}", checksum)
+            update_scan_status(db, file_id, ScanStatus.ERROR, f"ClamAV connection error: {e}", writer=writer)
+            publish_status_update(channel, file_id, ScanStatus.ERROR.value, f"ClamAV connection error: {e}", checksum, owner=owner)
             raise MessageProcessingError("ClamAV connection error")
         except Exception as e:
+            CLAMD_ERRORS.labels("error").inc()
             logging.error(f"Error scanning file {file_path}: {e}")
-            update_scan_status(db, file_id, ScanStatus.ERROR, str(e))
-            publish_status_update(channel, file_id, ScanStatus.ERROR.value, str(e), checksum)
+            update_scan_status(db, file_id, ScanStatus.ERROR, str(e), writer=writer)
+            publish_status_update(channel, file_id, ScanStatus.ERROR.value, str(e), checksum, owner=owner)
 
     except json.JSONDecodeError:
         logging.error(f"Error decoding message body: {body}")
         # Do not requeue if message is malformed
     except MessageProcessingError:
-        raise # Re-raise to be handled by the callback for requeuing
+        raise # Re-raise to be handled by the callback for a delayed retry
     except Exception as e:
         logging.error(f"Unhandled error in process_message: {e}", exc_info=True)
         if file_id:
             try:
-                update_scan_status(db, file_id, ScanStatus.ERROR, f"Unhandled worker error: {e}")
-                publish_status_update(channel, file_id, ScanStatus.ERROR.value, f"Unhandled worker error: {e}", checksum)
+                update_scan_status(db, file_id, ScanStatus.ERROR, f"Unhandled worker error: {e}", writer=writer)
+                publish_status_update(channel, file_id, ScanStatus.ERROR.value, f"Unhandled worker error: {e}", checksum, owner=owner)
             except Exception as db_e:
                 logging.error(f"Could not update DB to ERROR status after unhandled exception: {db_e}")
         # Do not requeue for unknown errors to avoid poison pills
@@ -0,0 +1,46 @@
+import logging
+import os
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Port the worker serves Prometheus metrics on; 0 turns it off
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+# Scans and checksums of large files take minutes, not milliseconds
+SCAN_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# Upper bounds of the size classes scan times are reported by
+SIZE_CLASSES = [
+    (1024 * 1024, "1MiB"),
+    (16 * 1024 * 1024, "16MiB"),
+    (64 * 1024 * 1024, "64MiB"),
+    (256 * 1024 * 1024, "256MiB"),
+    (1024 * 1024 * 1024, "1GiB"),
+]
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "cfiles_scan_queue_wait_seconds", "Time from publishing a scan message until a worker started on it",
+    ["queue"], buckets=SCAN_BUCKETS,
+)
+IN_FLIGHT_SCANS = Gauge("cfiles_scans_in_flight", "Scan messages being processed", ["queue"])
+CHECKSUM_SECONDS = Histogram("cfiles_checksum_seconds", "Time to compute the SHA-256 of a stored file", buckets=SCAN_BUCKETS)
+SCAN_SECONDS = Histogram("cfiles_clamd_scan_seconds", "Time to scan a file with clamd, by file size", ["size"], buckets=SCAN_BUCKETS)
+SCAN_RESULTS = Counter("cfiles_scans_total", "Completed scans by verdict (cached: reused an earlier verdict)", ["result"])
+CLAMD_ERRORS = Counter("cfiles_clamd_errors_total", "Scans that failed in clamd", ["kind"])
+DB_COMMIT_SECONDS = Histogram("cfiles_db_commit_seconds", "Time to commit scan status updates", ["mode"])
+
+
+def size_class(size) -> str:
+    """Label for a file size: the smallest SIZE_CLASSES bound it fits under."""
+    if size is None:
+        return "unknown"
+    for limit, label in SIZE_CLASSES:
+        if size <= limit:
+            return f"le_{label}"
+    return f"gt_{SIZE_CLASSES[-1][1]}"
+
+
+def start_metrics_server(port: int = WORKER_METRICS_PORT):
+    if not port:
+        return
+    start_http_server(port)
+    logging.info(f"Serving Prometheus metrics on port {port}.")